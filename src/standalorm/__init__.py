@@ -1 +1,28 @@
 from .orm_init import orm_init
+
+# everything else is imported on first use, so importing standalorm only loads what orm_init() needs
+_lazy_exports = {
+    "connection_scope": "connections",
+    "aorm": "aio",
+    "aiterate": "aio",
+    "await_ready": "warmup",
+    "unit_of_work": "buffered_writes",
+    "compact": "compact_rows",
+    "atomic_retry": "retry",
+}
+
+
+def __getattr__(name):
+    if name in _lazy_exports:
+        from importlib import import_module
+
+        value = getattr(import_module(f".{_lazy_exports[name]}", __name__), name)
+        globals()[name] = value
+
+        return value
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_exports))
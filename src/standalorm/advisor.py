@@ -0,0 +1,500 @@
+"""
+An index advisor driven by a recorded query workload.
+
+With ``record = true`` in the [advisor] table of orm-settings.toml, ``orm_init()`` installs a recorder on every
+connection. The recorder keeps each distinct statement's execution count, total time, and slowest example (with its
+parameters), and merges them into a workload file (``workload_file``, relative to the project's root) when the script
+exits. Several scripts, or several runs of one, add to the same workload.
+
+``standalorm db advise`` then asks the database how it would run the most expensive statements (``EXPLAIN QUERY PLAN``
+on SQLite, ``EXPLAIN`` on PostgreSQL). For every full table scan of a large table, it proposes an index on the columns
+the statement filters, joins or sorts that table by: equality columns first, then one range column or the sort
+columns. Proposals are printed as ``Meta.indexes`` entries and written as an ``AddIndex`` migration.
+"""
+
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db.backends.signals import connection_created
+from standalorm.instrumentation import get_sql_shape
+from standalorm.utils import atomic_write
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+WORKLOAD_VERSION = 1
+
+# statements worth explaining: the ones that read rows by a condition
+_explainable = re.compile(r"^\s*(SELECT|UPDATE|DELETE)\b", re.IGNORECASE)
+
+# "table"."column" followed by an equality, range or IN comparison (functions and casts around the column don't
+# match, since an index on the column can't be used for them)
+_equality_left = re.compile(r'"(\w+)"\."(\w+)"\s*(?:=|IN\b)', re.IGNORECASE)
+_equality_right = re.compile(r'=\s*"(\w+)"\."(\w+)"')
+_range = re.compile(r'"(\w+)"\."(\w+)"\s*(?:<=|>=|<|>|BETWEEN\b)', re.IGNORECASE)
+# the start of a negated group of comparisons, as .exclude() generates
+_negation = re.compile(r"\bNOT\s*\(", re.IGNORECASE)
+_column = re.compile(r'"(\w+)"\."(\w+)"')
+_table_alias = re.compile(r'(?:FROM|JOIN)\s+"(\w+)"(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_clause_end = re.compile(r"\s(?:GROUP BY|HAVING|ORDER BY|LIMIT|OFFSET|FOR UPDATE)\s", re.IGNORECASE)
+_order_by = re.compile(r"\sORDER BY\s(.*?)(?:\sLIMIT\s|\sOFFSET\s|\sFOR UPDATE|$)", re.IGNORECASE | re.DOTALL)
+
+# SQLite's query plan line for a full scan of a table (older versions say "SCAN TABLE x")
+_sqlite_scan = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?$")
+
+# the most columns a proposed index has
+MAX_INDEX_COLUMNS = 3
+
+_recorder = None
+
+
+class WorkloadRecorder:
+    """
+    A Django execute wrapper that aggregates the statements run through the connections it's installed on, by
+    connection alias and statement shape (see ``standalorm.instrumentation.get_sql_shape()``).
+
+    :param max_statements: The most distinct statements to keep. Statements first seen after that are ignored.
+    """
+
+    def __init__(self, max_statements: int = 1000):
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self._statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if many or not _explainable.match(sql):
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(context["connection"].alias, sql, params, (time.perf_counter() - start) * 1000)
+
+    def record(self, alias: str, sql: str, params, elapsed_ms: float):
+        """
+        Records one executed statement.
+
+        :param alias: The alias of the connection the statement ran on.
+        :param sql: The statement.
+        :param params: The statement's parameters.
+        :param elapsed_ms: How long the statement took, in milliseconds.
+        """
+        key = (alias, get_sql_shape(sql))
+
+        with self._lock:
+            entry = self._statements.get(key)
+
+            if entry is None:
+                if len(self._statements) >= self.max_statements:
+                    return
+
+                entry = self._statements[key] = {"count": 0, "total_ms": 0.0, "max_ms": -1.0}
+
+            entry["count"] += 1
+            entry["total_ms"] += elapsed_ms
+
+            # the slowest example is the one most worth explaining
+            if elapsed_ms > entry["max_ms"]:
+                entry.update(max_ms=elapsed_ms, sql=sql, params=list(params or ()))
+
+    def save(self, path: str):
+        """
+        Merges the statements recorded so far into a workload file, and starts recording afresh. Processes recording
+        the same workload take turns, so none of them overwrites what another has merged.
+
+        :param path: The workload file's path.
+        """
+        with self._lock:
+            statements, self._statements = self._statements, {}
+
+        if not statements:
+            return
+
+        with _lock_workload(path):
+            workload = read_workload(path)
+
+            for (alias, shape), entry in statements.items():
+                merged = workload.setdefault(f"{alias}\n{shape}", {"alias": alias, "shape": shape, "count": 0,
+                                                                    "total_ms": 0.0, "max_ms": -1.0})
+                merged["count"] += entry["count"]
+                merged["total_ms"] += entry["total_ms"]
+
+                if entry["max_ms"] > merged["max_ms"]:
+                    merged.update(max_ms=entry["max_ms"], sql=entry["sql"], params=entry["params"])
+
+            data = {"version": WORKLOAD_VERSION, "statements": list(workload.values())}
+            atomic_write(path, json.dumps(data, default=str, indent=1).encode())
+
+
+@contextmanager
+def _lock_workload(path: str):
+    """
+    Holds an exclusive lock on a workload file (through a lock file beside it, since the workload file itself is
+    replaced on every write), waiting for any other process holding it.
+    """
+    with open(f"{path}.lock", "a+b") as lock_file:
+        if fcntl is not None:
+            # closing the file releases the lock
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+            return
+
+        # msvcrt locks from the current position, and LK_LOCK only retries for about 10 seconds
+        lock_file.seek(0)
+
+        while True:
+            try:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                break
+            except OSError:
+                pass
+
+        try:
+            yield
+        finally:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def read_workload(path: str) -> dict:
+    """
+    Reads a workload file.
+
+    :param path: The workload file's path.
+    :return: A dictionary mapping "alias\\nshape" keys to statement entries (empty if the file doesn't exist or was
+             written by an incompatible version of standalorm).
+    """
+    try:
+        with open(path) as workload_file:
+            data = json.load(workload_file)
+    except (OSError, ValueError):
+        return {}
+
+    if data.get("version") != WORKLOAD_VERSION:
+        return {}
+
+    return {f"{entry['alias']}\n{entry['shape']}": entry for entry in data["statements"]}
+
+
+def get_workload_path(orm_settings: dict, user_root: str) -> str:
+    """
+    Gets the path of the workload file from the [advisor] table of orm-settings.toml.
+    """
+    return os.path.join(user_root, orm_settings.get("advisor", {}).get("workload_file", "workload.json"))
+
+
+def _add_wrapper(sender, connection, **kwargs):
+    """
+    Receiver for Django's ``connection_created`` signal. Installs the recorder on every new connection.
+    """
+    if _recorder is not None and _recorder not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_recorder)
+
+
+def install_recorder(orm_settings: dict, user_root: str):
+    """
+    Starts recording the workload, if ``record`` is true in the [advisor] table of orm-settings.toml. What's recorded
+    is merged into the workload file when the process exits.
+
+    :param orm_settings: A dictionary of standalorm's settings.
+    :param user_root: The project's root directory.
+    :return: The ``WorkloadRecorder``, or None if recording isn't enabled.
+    """
+    global _recorder
+
+    config = orm_settings.get("advisor", {})
+
+    if not config.get("record", False):
+        return None
+
+    if _recorder is None:
+        _recorder = WorkloadRecorder(config.get("max_statements", 1000))
+        atexit.register(_recorder.save, get_workload_path(orm_settings, user_root))
+
+    connection_created.connect(_add_wrapper, dispatch_uid="standalorm.advisor")
+
+    return _recorder
+
+
+def explain_full_scans(connection, sql: str, params) -> list:
+    """
+    Asks the database how it would run a statement, without running it.
+
+    :param connection: The Django connection to ask.
+    :param sql: The statement.
+    :param params: The statement's parameters.
+    :return: A list of (table or alias, plan detail) tuples, one for each table the plan reads in full.
+    """
+    scans = []
+
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+
+            for row in cursor.fetchall():
+                match = _sqlite_scan.match(row[-1])
+
+                if match:
+                    scans.append((match.group(2) or match.group(1), row[-1]))
+        elif connection.vendor == "postgresql":
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+            nodes = [(json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]]
+
+            while nodes:
+                node = nodes.pop()
+                nodes.extend(node.get("Plans", []))
+
+                if node["Node Type"] == "Seq Scan":
+                    detail = f"Seq Scan on {node['Relation Name']}"
+
+                    if "Filter" in node:
+                        detail += f" (Filter: {node['Filter']})"
+
+                    scans.append((node.get("Alias", node["Relation Name"]), detail))
+        else:
+            raise ValueError(f"The index advisor doesn't support {connection.display_name} databases.")
+
+    return scans
+
+
+def get_index_columns(sql: str, table: str, alias: str) -> list:
+    """
+    Works out which of a table's columns an index should cover to stop a statement from scanning it in full: the
+    columns it compares for equality (including join columns), then either one column it compares by range or the
+    columns it sorts by.
+
+    :param sql: The statement, as Django generated it (with quoted table and column names).
+    :param table: The name of the table.
+    :param alias: The name the statement refers to the table by (the same as ``table`` unless Django aliased it).
+    :return: A list of column names, which is empty if no index would help.
+    """
+    names = {table, alias}
+
+    where_start = max(sql.find(" WHERE "), 0)
+    end = _clause_end.search(sql, where_start)
+    conditions = _remove_negations(sql[:end.start() if end else len(sql)])
+
+    equality = [column for name, column in _equality_left.findall(conditions) + _equality_right.findall(conditions)
+                if name in names]
+    columns = list(dict.fromkeys(equality))
+
+    ranges = [column for name, column in _range.findall(conditions) if name in names and column not in columns]
+
+    if ranges:
+        columns.append(ranges[0])
+    else:
+        order_by = _order_by.search(sql)
+        sort_columns = _column.findall(order_by.group(1)) if order_by else []
+
+        # only helps if every sort column belongs to the table
+        if sort_columns and all(name in names for name, _ in sort_columns):
+            columns.extend(column for _, column in sort_columns if column not in columns)
+
+    return columns[:MAX_INDEX_COLUMNS]
+
+
+def _remove_negations(sql: str) -> str:
+    """
+    Removes the ``NOT (...)`` groups (which ``.exclude()`` generates) from a statement, since an index can't find the
+    rows that don't match the comparisons inside them.
+    """
+    match = _negation.search(sql)
+
+    while match:
+        depth, position = 1, match.end()
+
+        while depth and position < len(sql):
+            depth += {"(": 1, ")": -1}.get(sql[position], 0)
+            position += 1
+
+        sql = sql[:match.start()] + sql[position:]
+        match = _negation.search(sql, match.start())
+
+    return sql
+
+
+def _resolve_alias(sql: str, alias: str) -> str:
+    """
+    Gets the name of the table a statement refers to by an alias (Django aliases tables that are joined more than once).
+    """
+    for table, table_alias in _table_alias.findall(sql):
+        if alias in (table, table_alias):
+            return table
+
+    return alias
+
+
+def _get_existing_indexes(connection, model, state_models: dict) -> list:
+    """
+    Gets the column lists of a model's indexes: the ones in its database table and the ones its migrations create,
+    applied or not.
+    """
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+
+    indexes = [info["columns"] for info in constraints.values()
+               if (info.get("index") or info.get("unique") or info.get("primary_key")) and info["columns"]]
+
+    state = state_models.get((model._meta.app_label, model._meta.model_name))
+
+    if state is not None:
+        for index in state.options.get("indexes", []):
+            indexes.append([model._meta.get_field(name.lstrip("-")).column for name in index.fields])
+
+    return indexes
+
+
+def _count_rows(connection, table: str) -> int:
+    """
+    Gets a table's row count: exact on SQLite, the planner's estimate on PostgreSQL.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                           [connection.ops.quote_name(table)])
+        else:
+            cursor.execute(f"SELECT count(*) FROM {connection.ops.quote_name(table)}")
+
+        return int(cursor.fetchone()[0])
+
+
+def advise(workload: dict, top: int = 20, min_rows: int = 1000) -> tuple:
+    """
+    Explains the most expensive statements in a workload and proposes indexes for the full table scans it finds.
+
+    :param workload: The workload, as returned by ``read_workload()``.
+    :param top: How many statements to explain, ordered by total time.
+    :param min_rows: Full scans of tables with fewer rows than this are ignored.
+    :return: A tuple of the proposals and the statements that couldn't be explained. Each proposal is a dictionary
+             with the model, the names of the fields to index, the table's row count, the total time of the statements
+             it's for in milliseconds, and those statements with their plan details. Each unexplained statement is a
+             dictionary with its shape and the error.
+    """
+    from django.apps import apps
+    from django.db import connections
+    from django.db.migrations.loader import MigrationLoader
+
+    models = {model._meta.db_table: model for model in apps.get_models()}
+    state_models = MigrationLoader(None, ignore_no_migrations=True).project_state().models
+
+    statements = sorted(workload.values(), key=lambda entry: entry["total_ms"], reverse=True)
+    proposals, errors = {}, []
+    row_counts, existing = {}, {}
+
+    for entry in statements[:top]:
+        if entry["alias"] not in connections:
+            continue
+
+        connection = connections[entry["alias"]]
+
+        try:
+            scans = explain_full_scans(connection, entry["sql"], entry["params"])
+        except Exception as error:
+            errors.append({"shape": entry["shape"], "error": f"{type(error).__name__}: {error}"})
+            continue
+
+        for alias, detail in scans:
+            table = _resolve_alias(entry["sql"], alias)
+            model = models.get(table)
+
+            if model is None:
+                continue
+
+            columns = get_index_columns(entry["sql"], table, alias)
+
+            if not columns or columns == [model._meta.pk.column]:
+                continue
+
+            key = (entry["alias"], table)
+
+            if key not in row_counts:
+                row_counts[key] = _count_rows(connection, table)
+                existing[key] = _get_existing_indexes(connection, model, state_models)
+
+            # an existing index that starts with the same columns already serves the statement
+            if row_counts[key] < min_rows or any(index[:len(columns)] == columns for index in existing[key]):
+                continue
+
+            fields = {field.column: field.name for field in model._meta.concrete_fields}
+            proposal = proposals.setdefault((model, tuple(columns)), {
+                "model": model, "fields": [fields[column] for column in columns if column in fields],
+                "rows": row_counts[key], "total_ms": 0.0, "statements": [],
+            })
+            proposal["total_ms"] += entry["total_ms"]
+            proposal["statements"].append({"shape": entry["shape"], "count": entry["count"],
+                                           "total_ms": entry["total_ms"], "plan": detail})
+
+    # an index whose columns start another proposed index's columns isn't needed
+    kept = [proposal for (model, columns), proposal in proposals.items()
+            if len(proposal["fields"]) == len(columns)
+            and not any(other_model is model and len(other) > len(columns) and other[:len(columns)] == columns
+                        for other_model, other in proposals)]
+
+    return sorted(kept, key=lambda proposal: proposal["total_ms"], reverse=True), errors
+
+
+def make_index(model, fields: list):
+    """
+    Creates a named ``models.Index`` for a model's fields, named the way Django names indexes.
+    """
+    from django.db import models
+
+    index = models.Index(fields=fields)
+    index.set_name_with_model(model)
+
+    return index
+
+
+def write_migrations(proposals: list) -> list:
+    """
+    Writes an ``AddIndex`` migration for the proposed indexes into each affected app's migrations directory.
+
+    :param proposals: Proposals, as returned by ``advise()``.
+    :return: The paths of the migration files written.
+    """
+    from django.db import migrations
+    from django.db.migrations.autodetector import MigrationAutodetector
+    from django.db.migrations.loader import MigrationLoader
+    from django.db.migrations.writer import MigrationWriter
+
+    graph = MigrationLoader(None, ignore_no_migrations=True).graph
+    operations = {}
+
+    for proposal in proposals:
+        model = proposal["model"]
+        operations.setdefault(model._meta.app_label, []).append(
+            migrations.AddIndex(model_name=model._meta.model_name, index=make_index(model, proposal["fields"])))
+
+    paths = []
+
+    for app_label, app_operations in operations.items():
+        leaves = graph.leaf_nodes(app_label)
+
+        if not leaves:
+            raise ValueError(f"App '{app_label}' has no migrations to add the indexes after. "
+                             f"Run \"standalorm makemigrations\" first.")
+
+        number = (MigrationAutodetector.parse_number(leaves[-1][1]) or 0) + 1
+        migration = migrations.Migration(f"{number:04d}_advisor_indexes", app_label)
+        migration.dependencies = leaves
+        migration.operations = app_operations
+
+        writer = MigrationWriter(migration)
+
+        with open(writer.path, "w") as migration_file:
+            migration_file.write(writer.as_string())
+
+        paths.append(writer.path)
+
+    return paths
@@ -0,0 +1,253 @@
+"""
+An asyncio-friendly facade for running ORM queries from coroutines.
+
+Django's ORM is synchronous, so every call is run on a small pool of dedicated worker threads. Each worker keeps its
+own Django database connections between calls (subject to ``CONN_MAX_AGE``), so connection setup isn't repeated for
+every query, and the number of connections is bounded by the number of workers.
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import queue
+import threading
+
+import standalorm.utils as utils
+from django.db import close_old_connections, connections
+from django.db.models import QuerySet
+
+# put on a worker's queue to make it close its connections and exit
+_STOP = object()
+
+# put on an aiterate() queue after the last chunk
+_DONE = object()
+
+_default_executor = None
+_default_executor_lock = threading.Lock()
+
+
+class ORMExecutor:
+    """
+    A bounded pool of worker threads for running ORM calls.
+
+    After each call, the worker closes connections that have outlived their ``CONN_MAX_AGE`` or hit an unrecoverable
+    error (like Django does at the end of a request). When the executor shuts down, every worker closes all of its
+    connections.
+
+    It can be used as an async context manager, which shuts it down on exit::
+
+        async with ORMExecutor(max_workers=8) as executor:
+            books = await aorm(Book.objects.filter(author=author), executor=executor)
+
+    :param max_workers: The number of worker threads.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1.")
+
+        self.max_workers = max_workers
+        self._queue = queue.SimpleQueue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+
+            if item is _STOP:
+                connections.close_all()
+                return
+
+            future, function, args, kwargs = item
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                result = function(*args, **kwargs)
+            except BaseException as error:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+            finally:
+                close_old_connections()
+
+    def submit(self, function, *args, **kwargs) -> concurrent.futures.Future:
+        """
+        Schedules a function to run on one of the worker threads.
+
+        :param function: The function to run.
+        :param args: Positional arguments for ``function``.
+        :param kwargs: Keyword arguments for ``function``.
+        :return: A future for the function's result.
+        """
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Can't submit work to an ORMExecutor that has been shut down.")
+
+            # start the workers on first use
+            while len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._work, name=f"standalorm-aio-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+        future = concurrent.futures.Future()
+        self._queue.put((future, function, args, kwargs))
+
+        return future
+
+    async def run(self, function, *args, **kwargs):
+        """
+        Runs a function on one of the worker threads and waits for its result without blocking the event loop.
+
+        :param function: The function to run.
+        :param args: Positional arguments for ``function``.
+        :param kwargs: Keyword arguments for ``function``.
+        :return: The function's result.
+        """
+        return await asyncio.wrap_future(self.submit(function, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stops the workers once they've finished the work already submitted. Each worker closes its connections before
+        it exits.
+
+        :param wait: If True, block until every worker has exited.
+        """
+        with self._lock:
+            if self._shutdown:
+                return
+
+            self._shutdown = True
+
+            for _ in self._threads:
+                self._queue.put(_STOP)
+
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await asyncio.get_running_loop().run_in_executor(None, self.shutdown)
+
+
+def get_executor() -> ORMExecutor:
+    """
+    Gets the executor used when no other executor is given. It's created on first use with ``max_workers`` from the
+    [aio] table of orm-settings.toml (4 by default), and shut down when the interpreter exits.
+
+    :return: The default ``ORMExecutor``.
+    """
+    global _default_executor
+
+    with _default_executor_lock:
+        if _default_executor is None:
+            _default_executor = ORMExecutor(utils.get_settings().get("aio", {}).get("max_workers", 4))
+            atexit.register(_default_executor.shutdown)
+
+        return _default_executor
+
+
+def _evaluate(query, args, kwargs):
+    if isinstance(query, QuerySet):
+        return list(query)
+
+    return query(*args, **kwargs)
+
+
+async def aorm(query, *args, executor: ORMExecutor = None, **kwargs):
+    """
+    Runs ORM work from a coroutine without blocking the event loop::
+
+        books = await aorm(Book.objects.filter(author=author))
+        count = await aorm(Book.objects.filter(author=author).count)
+        book = await aorm(Book.objects.create, title="Dune")
+
+    :param query: A queryset, which is evaluated and returned as a list, or any callable that uses the ORM.
+    :param args: Positional arguments for ``query`` if it's a callable.
+    :param executor: The ``ORMExecutor`` to run the work on. Defaults to ``get_executor()``.
+    :param kwargs: Keyword arguments for ``query`` if it's a callable.
+    :return: The queryset's results or the callable's return value.
+    """
+    if not isinstance(query, QuerySet) and not callable(query):
+        raise TypeError(f"aorm() takes a queryset or a callable, not {type(query).__name__}.")
+
+    return await (executor or get_executor()).run(_evaluate, query, args, kwargs)
+
+
+async def aiterate(queryset: QuerySet, chunk_size: int = 1000, executor: ORMExecutor = None):
+    """
+    Iterates over a queryset from a coroutine, fetching ``chunk_size`` rows at a time::
+
+        async for book in aiterate(Book.objects.all()):
+            await upload(book)
+
+    The whole iteration runs on a single worker thread with ``.iterator(chunk_size=...)``, so server-side cursors
+    work. At most two chunks are buffered ahead of the consumer, so memory use stays flat however big the queryset is.
+    The worker is occupied until the iteration finishes or the async generator is closed.
+
+    :param queryset: The queryset to iterate over.
+    :param chunk_size: The number of rows fetched from the database at a time.
+    :param executor: The ``ORMExecutor`` to run the iteration on. Defaults to ``get_executor()``.
+    :return: An async generator of the queryset's results.
+    """
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue(maxsize=2)
+    stopped = threading.Event()
+
+    def put(item):
+        future = asyncio.run_coroutine_threadsafe(chunks.put(item), loop)
+
+        # wait for room in the queue, giving up if the consumer goes away
+        while True:
+            try:
+                return future.result(timeout=0.5)
+            except concurrent.futures.TimeoutError:
+                if stopped.is_set() or loop.is_closed():
+                    future.cancel()
+                    raise
+
+    def produce():
+        try:
+            chunk = []
+
+            for obj in queryset.iterator(chunk_size=chunk_size):
+                chunk.append(obj)
+
+                if len(chunk) >= chunk_size:
+                    if stopped.is_set():
+                        return
+                    put(chunk)
+                    chunk = []
+
+            if chunk and not stopped.is_set():
+                put(chunk)
+        finally:
+            if not stopped.is_set():
+                put(_DONE)
+
+    producer = (executor or get_executor()).submit(produce)
+
+    try:
+        while True:
+            chunk = await chunks.get()
+
+            if chunk is _DONE:
+                break
+
+            for obj in chunk:
+                yield obj
+
+        # re-raise anything that went wrong on the worker
+        await asyncio.wrap_future(producer)
+    finally:
+        stopped.set()
+
+        # make room so a producer waiting on a full queue notices it's been stopped
+        while not chunks.empty():
+            chunks.get_nowait()
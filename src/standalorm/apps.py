@@ -0,0 +1,152 @@
+"""
+App configurations that defer importing an app's models module until its models are first needed.
+"""
+
+import sys
+import threading
+from importlib import import_module
+from importlib.abc import MetaPathFinder
+from importlib.machinery import PathFinder
+
+from django.apps import AppConfig
+from django.apps.config import MODELS_MODULE_NAME
+from django.utils.module_loading import module_has_submodule
+
+# lazy subclasses created by make_lazy(), keyed by the AppConfig subclass they extend
+_lazy_classes = {}
+
+# set while the app registry clears its caches, which only needs the models that are already loaded
+_local = threading.local()
+
+
+class _ModelsModuleLoader:
+    """
+    Wraps the loader of a lazy app's models module so that, once the module has run, the other lazy apps its models
+    point at by name (e.g. ``ForeignKey("library.Author", ...)``) are loaded too and those relations resolve to model
+    classes. Doing this after the module has finished, rather than as each model is defined, means models modules that
+    import each other's models still work.
+    """
+
+    def __init__(self, loader, app_config: AppConfig):
+        self.loader = loader
+        self.app_config = app_config
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        self.loader.exec_module(module)
+        self.app_config.models_module = module
+
+        for app_label, _ in list(self.app_config.apps._pending_operations):
+            try:
+                app_config = self.app_config.apps.get_app_config(app_label)
+            except LookupError:
+                continue
+
+            if isinstance(app_config, LazyModelsMixin):
+                app_config.load_models_module()
+
+
+class _ModelsModuleFinder(MetaPathFinder):
+    """
+    Import hook that gives lazy apps' models modules a ``_ModelsModuleLoader``, whether they're imported by the user
+    or by ``LazyModelsMixin.load_models_module()``.
+    """
+
+    def __init__(self):
+        self.app_configs = {}
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname not in self.app_configs:
+            return None
+
+        spec = PathFinder.find_spec(fullname, path, target)
+
+        if spec is not None and spec.loader is not None:
+            spec.loader = _ModelsModuleLoader(spec.loader, self.app_configs[fullname])
+
+        return spec
+
+
+_finder = _ModelsModuleFinder()
+
+
+class LazyModelsMixin:
+    """
+    Mixin for ``AppConfig`` subclasses. ``import_models()`` (which Django calls during ``django.setup()``) skips
+    importing the app's models module. The module is imported instead the first time the user imports it themselves or
+    the first time the app's models are looked up through the app registry.
+
+    Looking up a model's reverse relations (which Django does when deleting, for example) loads every app, since any
+    of them could point at the model.
+    """
+
+    def import_models(self):
+        self.models = self.apps.all_models[self.label]
+        self.models_module = None
+
+    def load_models_module(self):
+        """
+        Imports the app's models module if it hasn't been imported yet. Importing it registers its models with the
+        app registry.
+        """
+        if self.models_module is None and module_has_submodule(self.module, MODELS_MODULE_NAME):
+            self.models_module = import_module(f"{self.name}.{MODELS_MODULE_NAME}")
+
+    def get_models(self, include_auto_created=False, include_swapped=False):
+        if not getattr(_local, "clearing_cache", False):
+            self.load_models_module()
+
+        yield from super().get_models(include_auto_created, include_swapped)
+
+    def get_model(self, model_name, require_ready=True):
+        self.load_models_module()
+        return super().get_model(model_name, require_ready)
+
+
+def make_lazy(app_config: AppConfig) -> AppConfig:
+    """
+    Converts an app configuration into one whose models module is imported lazily. The app's own ``AppConfig`` subclass
+    (if it has one) is kept, so its ``ready()`` method still runs.
+
+    :param app_config: An ``AppConfig`` instance that hasn't been added to the app registry yet.
+    :return: The same instance, now an instance of a subclass that also inherits from ``LazyModelsMixin``.
+    """
+    config_class = type(app_config)
+
+    if config_class not in _lazy_classes:
+        _lazy_classes[config_class] = type(f"Lazy{config_class.__name__}", (LazyModelsMixin, config_class), {})
+
+    app_config.__class__ = _lazy_classes[config_class]
+
+    _finder.app_configs[f"{app_config.name}.{MODELS_MODULE_NAME}"] = app_config
+
+    if _finder not in sys.meta_path:
+        sys.meta_path.insert(0, _finder)
+
+    return app_config
+
+
+def defer_model_loading(registry):
+    """
+    Stops an app registry from loading every lazy app's models whenever a model is registered. Django's registry
+    clears its caches after each new model by going through every app's models, which for lazy apps would mean
+    importing all of them as soon as one is imported. Must be called before the registry is populated.
+
+    :param registry: The app registry (``django.apps.apps``).
+    """
+    clear_cache = type(registry).clear_cache.__get__(registry)
+
+    def clear_cache_without_loading():
+        _local.clearing_cache = True
+
+        try:
+            clear_cache()
+        finally:
+            _local.clearing_cache = False
+
+    registry.clear_cache = clear_cache_without_loading
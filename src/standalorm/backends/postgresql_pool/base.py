@@ -0,0 +1,10 @@
+"""
+Django's PostgreSQL backend, with connections drawn from a standalorm connection pool.
+"""
+
+from django.db.backends.postgresql import base
+from standalorm.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,10 @@
+"""
+Django's SQLite backend, with connections drawn from a standalorm connection pool.
+"""
+
+from django.db.backends.sqlite3 import base
+from standalorm.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
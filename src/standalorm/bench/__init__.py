@@ -0,0 +1,5 @@
+"""
+standalorm's benchmark suite. Run it with ``standalorm bench``, or from Python with ``run_benchmarks()``.
+"""
+
+from .runner import run_benchmarks
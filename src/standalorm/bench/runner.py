@@ -0,0 +1,244 @@
+"""
+Runs the benchmark suite against a throwaway project so the results can be compared between runs, settings, and
+versions of standalorm and Django.
+
+Every benchmark runs in a fresh interpreter. The throwaway project gets its own copy of your orm-settings.toml (with
+its app and database swapped for the synthetic ones), so your settings changes show up in the results but your
+project and databases are never touched.
+"""
+
+import copy
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from importlib.metadata import PackageNotFoundError, version
+from tempfile import TemporaryDirectory
+
+import django
+import standalorm.utils as utils
+import toml
+from standalorm.bench.synthetic import APP_NAME, MODELS_SOURCE
+
+# the name of the PostgreSQL connection in the throwaway project's settings
+POSTGRESQL_CONNECTION = "bench-postgresql"
+
+_startup_script = ("import time\n"
+                   "start = time.perf_counter()\n"
+                   "import json, os, sys\n"
+                   "sys.path.insert(0, os.getcwd())\n"
+                   "from standalorm.orm_init import orm_init, get_startup_timings\n"
+                   "orm_init(os.path.join(os.getcwd(), '__main__.py'), fast={fast})\n"
+                   "print(json.dumps({{'in_script_ms': (time.perf_counter() - start) * 1000, "
+                   "'phases': get_startup_timings()}}))\n")
+
+
+class BenchmarkProject:
+    """
+    A throwaway project containing the synthetic app, created in a temporary directory.
+
+    :param root: The project's directory.
+    :param orm_settings: The settings to base the project's settings on.
+    """
+
+    def __init__(self, root: str, orm_settings: dict):
+        self.root = root
+        self.settings_path = os.path.join(root, "orm-settings.toml")
+
+        # created through the same path as "standalorm startapp"
+        utils.create_app(root, APP_NAME, MODELS_SOURCE)
+
+        self.orm_settings = copy.deepcopy(orm_settings)
+        self.orm_settings["config"] = {"app": APP_NAME, "db_name": "default"}
+
+        # only the synthetic database is registered, so no reads are routed to a replica
+        default = self.orm_settings["databases"]["default"]
+        default.pop("ROLE", None)
+        default["NAME"] = "bench.sqlite3"
+        self.orm_settings["databases"] = {"default": default}
+
+        self.save()
+
+        self.env = dict(os.environ, STANDALORM_SETTINGS=self.settings_path)
+        self.env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.dirname(utils.lib_root),
+                                                               os.getenv("PYTHONPATH")]))
+
+    def save(self):
+        with open(self.settings_path, "w") as settings_file:
+            toml.dump(self.orm_settings, settings_file)
+
+    def add_postgresql(self, env_var: str):
+        """
+        Registers a PostgreSQL connection configured by a URI environment variable.
+
+        :param env_var: The name of the environment variable.
+        """
+        self.orm_settings["databases"][POSTGRESQL_CONNECTION] = {"USE_ENV": True, "ENV_VAR": env_var}
+        self.save()
+
+    def use(self, connection: str):
+        """
+        Switches the project to a different connection.
+
+        :param connection: The connection's name.
+        """
+        self.orm_settings["config"]["db_name"] = connection
+        self.save()
+
+    def clear_settings_cache(self):
+        if os.path.exists(self.settings_path + ".cache"):
+            os.remove(self.settings_path + ".cache")
+
+    def run(self, args: list):
+        """
+        Runs a Python interpreter in the project's directory.
+
+        :param args: The interpreter's arguments.
+        :return: A tuple of the wall-clock time in milliseconds and the parsed JSON of the last line of output.
+        """
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, *args], cwd=self.root, env=self.env, capture_output=True, text=True)
+        wall_ms = (time.perf_counter() - start) * 1000
+
+        if result.returncode != 0:
+            lines = result.stderr.strip().splitlines()
+            raise RuntimeError(f"Benchmark failed: {lines[-1] if lines else f'exit status {result.returncode}'}")
+
+        output = result.stdout.strip().splitlines()
+
+        return wall_ms, json.loads(output[-1]) if output else None
+
+    def run_worker(self, benchmark: str, **kwargs):
+        """
+        Runs one of the benchmarks in ``standalorm.bench.worker``.
+
+        :param benchmark: The benchmark's name.
+        :param kwargs: The benchmark's arguments.
+        :return: The benchmark's results.
+        """
+        return self.run(["-m", "standalorm.bench.worker", benchmark, json.dumps(kwargs)])[1]
+
+
+def bench_startup(project: BenchmarkProject, fast: bool, repeat: int) -> dict:
+    """
+    Times ``orm_init()`` in fresh interpreters. The cold run is the first one after standalorm's settings cache has
+    been cleared; the warm runs follow it. (The operating system's file cache isn't cleared, so the cold run only
+    measures a cold start of standalorm, not of the machine.)
+
+    :param project: The project to run in.
+    :param fast: If True, time fast-startup mode.
+    :param repeat: The number of warm runs.
+    :return: The cold run's timings and the median timings of the warm runs.
+    """
+    args = ["-c", _startup_script.format(fast=fast)]
+
+    project.clear_settings_cache()
+    cold_wall_ms, cold = project.run(args)
+
+    warm = [project.run(args) for _ in range(repeat)]
+
+    return {
+        "cold": {"wall_ms": cold_wall_ms, **cold},
+        "warm": {
+            "runs": repeat,
+            "wall_ms": statistics.median(wall_ms for wall_ms, _ in warm),
+            "in_script_ms": statistics.median(timings["in_script_ms"] for _, timings in warm),
+            "phases": {phase: statistics.median(timings["phases"].get(phase, 0) for _, timings in warm)
+                       for phase in warm[0][1]["phases"]} if warm else {},
+        },
+    }
+
+
+def bench_database(project: BenchmarkProject, connection: str, label: str, rows, iterations: int, progress) -> dict:
+    """
+    Runs the migration, CRUD and bulk benchmarks against one database connection, then removes the synthetic tables.
+    """
+    project.use(connection)
+
+    progress(f"[{label}] migrations")
+    results = {"migrate": project.run_worker("migrate")}
+
+    try:
+        progress(f"[{label}] single-row CRUD ({iterations} iterations)")
+        results["crud"] = project.run_worker("crud", iterations=iterations)
+
+        results["bulk"] = []
+        for count in rows:
+            progress(f"[{label}] bulk_create and iterator ({count} rows)")
+            results["bulk"].append(project.run_worker("bulk", rows=count))
+    finally:
+        project.run_worker("teardown")
+
+    return results
+
+
+def get_metadata() -> dict:
+    """
+    Describes the environment the benchmarks ran in.
+    """
+    try:
+        standalorm_version = version("standalorm")
+    except PackageNotFoundError:
+        standalorm_version = None
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "standalorm": standalorm_version,
+        "django": django.get_version(),
+        "python": platform.python_version(),
+        "python_implementation": platform.python_implementation(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run_benchmarks(rows=(10000, 1000000), repeat: int = 5, iterations: int = 1000, postgresql_env: str = None,
+                   progress=None) -> dict:
+    """
+    Runs the whole benchmark suite.
+
+    :param rows: The row counts to run the bulk_create and iterator benchmarks at.
+    :param repeat: The number of warm ``orm_init()`` runs to take the median of.
+    :param iterations: The number of times each single-row CRUD operation is timed.
+    :param postgresql_env: The name of an environment variable holding a PostgreSQL connection URI. If given, the
+                           database benchmarks also run against that database. The synthetic app's tables are created
+                           in it and dropped afterwards.
+    :param progress: A function called with a description of each benchmark as it starts.
+    :return: A JSON-serializable dictionary of results.
+    """
+    progress = progress or (lambda message: None)
+
+    if postgresql_env and not os.getenv(postgresql_env):
+        raise ValueError(f"The environment variable {postgresql_env} isn't set.")
+
+    results = {
+        "metadata": get_metadata(),
+        "parameters": {"rows": list(rows), "repeat": repeat, "iterations": iterations,
+                       "postgresql": bool(postgresql_env)},
+    }
+
+    with TemporaryDirectory(prefix="standalorm-bench-") as root:
+        project = BenchmarkProject(root, utils.get_settings())
+
+        progress("interpreter startup baseline")
+        results["interpreter_ms"] = statistics.median(project.run(["-c", "pass"])[0] for _ in range(repeat))
+
+        results["startup"] = {}
+        for mode, fast in (("default", False), ("fast", True)):
+            progress(f"orm_init() startup ({mode} mode)")
+            results["startup"][mode] = bench_startup(project, fast, repeat)
+
+        results["databases"] = {"sqlite": bench_database(project, "default", "sqlite", rows, iterations, progress)}
+
+        if postgresql_env:
+            project.add_postgresql(postgresql_env)
+            results["databases"]["postgresql"] = bench_database(project, POSTGRESQL_CONNECTION, "postgresql", rows,
+                                                                iterations, progress)
+
+    return results
@@ -0,0 +1,48 @@
+"""
+The synthetic app the benchmarks run against.
+"""
+
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+APP_NAME = "standalorm_bench"
+
+# models.py of the synthetic app: a mix of the field types real tables tend to have, plus a foreign key
+MODELS_SOURCE = '''from django.db import models
+
+
+class Category(models.Model):
+    name = models.CharField(max_length=50)
+
+
+class Record(models.Model):
+    name = models.CharField(max_length=100)
+    quantity = models.IntegerField(default=0)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    ratio = models.FloatField(null=True)
+    active = models.BooleanField(default=True)
+    created = models.DateTimeField()
+    notes = models.TextField(blank=True)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+'''
+
+
+def make_record_kwargs(index: int, category) -> dict:
+    """
+    Builds the field values of a synthetic ``Record``. The values are derived from ``index`` so every run inserts the
+    same data.
+
+    :param index: The record's position in the run.
+    :param category: The ``Category`` the record belongs to.
+    :return: A dictionary of keyword arguments for ``Record()``.
+    """
+    return {
+        "name": f"record-{index}",
+        "quantity": index % 1000,
+        "price": Decimal(index % 100000) / 100,
+        "ratio": (index % 97) / 97 if index % 5 else None,
+        "active": index % 3 != 0,
+        "created": datetime(2021, 1, 1) + timedelta(seconds=index),
+        "notes": "" if index % 2 else f"notes for record {index}",
+        "category": category,
+    }
@@ -0,0 +1,148 @@
+"""
+Runs one benchmark in a fresh interpreter and prints its results as a line of JSON. The runner starts this module with
+``python -m standalorm.bench.worker BENCHMARK ARGUMENTS`` from the synthetic project's directory, where ARGUMENTS is a
+JSON object of keyword arguments for the benchmark.
+"""
+
+import json
+import os
+import statistics
+import sys
+import time
+
+from standalorm.bench.synthetic import APP_NAME, make_record_kwargs
+
+
+def _setup():
+    from standalorm.orm_init import setup
+
+    user_root = os.getcwd()
+    sys.path.insert(0, user_root)
+    setup(user_root)
+
+
+def _summarize(latencies: list) -> dict:
+    """
+    Summarizes a list of latencies in milliseconds.
+    """
+    return {
+        "mean_ms": statistics.mean(latencies),
+        "median_ms": statistics.median(latencies),
+        "p95_ms": statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0],
+        "max_ms": max(latencies),
+    }
+
+
+def _timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def migrate() -> dict:
+    """
+    Times creating and applying the synthetic app's migrations.
+    """
+    from django.core.management import call_command
+
+    _setup()
+
+    makemigrations_ms, _ = _timed(call_command, "makemigrations", APP_NAME, verbosity=0)
+    migrate_ms, _ = _timed(call_command, "migrate", verbosity=0)
+
+    return {"makemigrations_ms": makemigrations_ms, "migrate_ms": migrate_ms}
+
+
+def crud(iterations: int = 1000) -> dict:
+    """
+    Times single-row creates, primary key lookups, updates and deletes, each in its own autocommitted statement.
+    """
+    _setup()
+
+    from standalorm_bench.models import Category, Record
+
+    category = Category.objects.create(name="crud")
+    latencies = {"create": [], "get": [], "update": [], "delete": []}
+
+    for index in range(iterations):
+        elapsed, record = _timed(Record.objects.create, **make_record_kwargs(index, category))
+        latencies["create"].append(elapsed)
+
+        elapsed, record = _timed(Record.objects.get, pk=record.pk)
+        latencies["get"].append(elapsed)
+
+        record.quantity += 1
+        latencies["update"].append(_timed(record.save)[0])
+
+        latencies["delete"].append(_timed(record.delete)[0])
+
+    category.delete()
+
+    return {operation: _summarize(values) for operation, values in latencies.items()}
+
+
+def bulk(rows: int, batch_size: int = 1000, chunk_size: int = 2000) -> dict:
+    """
+    Times inserting ``rows`` rows with ``bulk_create()`` and reading them back with ``iterator()``. Rows are built and
+    inserted 10,000 at a time inside one transaction, so memory use doesn't grow with ``rows``; building the model
+    instances is included in the insert time, since real loads have to do it too.
+    """
+    from django.db import transaction
+
+    _setup()
+
+    from standalorm_bench.models import Category, Record
+
+    Record.objects.all().delete()
+    category = Category.objects.create(name="bulk")
+
+    start = time.perf_counter()
+
+    with transaction.atomic():
+        for offset in range(0, rows, 10000):
+            indexes = range(offset, min(rows, offset + 10000))
+            Record.objects.bulk_create([Record(**make_record_kwargs(index, category)) for index in indexes],
+                                       batch_size=batch_size)
+
+    insert_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    read = sum(1 for _ in Record.objects.all().iterator(chunk_size=chunk_size))
+    iterate_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    read_values = sum(1 for _ in Record.objects.values_list("pk", "name", "price").iterator(chunk_size=chunk_size))
+    values_seconds = time.perf_counter() - start
+
+    Record.objects.all().delete()
+    category.delete()
+
+    return {
+        "rows": rows,
+        "bulk_create_seconds": insert_seconds,
+        "bulk_create_rows_per_second": rows / insert_seconds,
+        "iterator_seconds": iterate_seconds,
+        "iterator_rows_per_second": read / iterate_seconds,
+        "values_list_iterator_seconds": values_seconds,
+        "values_list_iterator_rows_per_second": read_values / values_seconds,
+    }
+
+
+def teardown() -> dict:
+    """
+    Removes the synthetic app's tables.
+    """
+    from django.core.management import call_command
+
+    _setup()
+    call_command("migrate", APP_NAME, "zero", verbosity=0)
+
+    return {}
+
+
+BENCHMARKS = {"migrate": migrate, "crud": crud, "bulk": bulk, "teardown": teardown}
+
+
+if __name__ == "__main__":
+    results = BENCHMARKS[sys.argv[1]](**json.loads(sys.argv[2] if len(sys.argv) > 2 else "{}"))
+    print(json.dumps(results))
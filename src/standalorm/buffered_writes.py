@@ -0,0 +1,395 @@
+"""
+A unit of work that buffers ``save()`` and ``delete()`` calls and writes them as a few bulk statements.
+
+Loops that save or delete one object at a time pay for a round trip (and, outside a transaction, a commit) per object.
+Inside a unit of work, those calls are collected instead, and written in one transaction per connection when the unit
+of work ends or its buffer fills up::
+
+    with unit_of_work():
+        for row in rows:
+            book = Book.objects.get(isbn=row["isbn"])
+            book.price = row["price"]
+            book.save()  # buffered; written with bulk_update() at the end
+
+Each flush inserts new objects with ``bulk_create()``, updates existing ones with ``bulk_update()`` (grouped by the
+fields being saved), and deletes with ``DELETE ... WHERE pk IN (...)``. Inserts and updates run parents before
+children, following foreign keys, and deletes run children before parents. An object whose foreign key points at a
+buffered, not-yet-inserted object gets the parent's primary key once the parent is inserted.
+
+Things to keep in mind:
+
+* Objects are buffered by reference, so what's written is their state at flush time.
+* ``pre_save``/``post_save`` signals aren't sent for buffered inserts and updates, the same as for ``bulk_create()``.
+* ``save()`` and ``delete()`` return before anything is written, so database errors are raised by the flush.
+* If the block raises, writes still in the buffer are discarded; writes from earlier flushes have been committed.
+* Models that use multi-table inheritance, and ``delete(keep_parents=True)`` calls, are written straight away.
+* New objects have their primary keys after the flush. SQLite can't return them from a bulk insert with Django 3.2,
+  so they're worked out from the rowid each INSERT statement ends on (the rows of one statement get consecutive rowids,
+  and the flush's transaction keeps other writers out). Other databases that can't return them (MySQL) insert new
+  objects with an auto-incrementing primary key one statement at a time, still without sending signals.
+* ``Model.objects.create()`` and ``get_or_create()`` call ``save()``, so inside a unit of work the objects they return
+  have no primary key until the flush (and ``get_or_create()`` can't see objects created earlier in the buffer).
+* Buffers belong to the thread that opened the unit of work. Flushing by time only happens on a ``save()`` or
+  ``delete()`` call, never in the background.
+"""
+
+import threading
+import time
+from contextlib import ContextDecorator
+from graphlib import CycleError, TopologicalSorter
+
+from django.db import connections, router, transaction
+from django.db.models import AutoField, Model
+
+# Model.save() and Model.delete() as Django defines them
+_original_save = Model.save
+_original_delete = Model.delete
+
+_local = threading.local()
+_patch_lock = threading.Lock()
+
+
+def _buffered_save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+    current = getattr(_local, "current", None)
+
+    if current is None or not current.handles(type(self)):
+        return _original_save(self, force_insert=force_insert, force_update=force_update, using=using,
+                              update_fields=update_fields)
+
+    current.add_save(self, using, update_fields, force_insert, force_update)
+
+
+def _buffered_delete(self, using=None, keep_parents=False):
+    current = getattr(_local, "current", None)
+
+    if current is None or keep_parents or not current.handles(type(self)):
+        return _original_delete(self, using=using, keep_parents=keep_parents)
+
+    # lets Django raise its usual error for objects that were never saved
+    if self.pk is None and not current.is_buffered(self):
+        return _original_delete(self, using=using, keep_parents=keep_parents)
+
+    current.add_delete(self, using)
+
+
+def _install_patches():
+    """
+    Routes ``Model.save()`` and ``Model.delete()`` through the calling thread's unit of work, if it has one. Calling
+    this more than once is harmless. Models that override ``save()`` or ``delete()`` still run their own code first,
+    as long as it calls ``super()``.
+    """
+    with _patch_lock:
+        Model.save = _buffered_save
+        Model.delete = _buffered_delete
+
+
+def _resolve_relations(obj) -> bool:
+    """
+    Copies the primary keys of related objects that have been saved since they were assigned into the object's
+    foreign key columns (what ``Model.save()`` does before saving).
+
+    :return: False if a related object still hasn't been saved.
+    """
+    for field in obj._meta.concrete_fields:
+        if not field.is_relation or not field.is_cached(obj):
+            continue
+
+        related = field.get_cached_value(obj)
+
+        if related is None:
+            continue
+
+        if related.pk is None:
+            return False
+
+        if getattr(obj, field.attname) is None:
+            setattr(obj, field.attname, getattr(related, field.target_field.attname))
+
+    return True
+
+
+def _dependency_order(models) -> list:
+    """
+    Sorts models so every model comes after the models its foreign keys point at. Models in a foreign key cycle are
+    returned in the order they were given.
+    """
+    models = list(models)
+    graph = {model: {field.related_model._meta.concrete_model for field in model._meta.concrete_fields
+                     if field.is_relation and field.related_model._meta.concrete_model in models
+                     and field.related_model._meta.concrete_model is not model}
+             for model in models}
+
+    try:
+        return list(TopologicalSorter(graph).static_order())
+    except CycleError:
+        return models
+
+
+class UnitOfWork(ContextDecorator):
+    """
+    Buffers ``save()`` and ``delete()`` calls on models from the installed apps and writes them in bulk. See the
+    module's documentation.
+
+    :param max_size: How many buffered objects trigger a flush.
+    :param max_delay: How many seconds after the first buffered write a flush is triggered (checked on each
+                      ``save()`` and ``delete()``). If None, only ``max_size`` and the end of the unit of work trigger
+                      flushes.
+    :param batch_size: The most objects written per statement. If None, Django picks a size the database can take.
+    :param models: The models to buffer. If None, every model from the installed apps is buffered.
+    """
+
+    def __init__(self, max_size: int = 1000, max_delay: float = None, batch_size: int = None, models=None):
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.batch_size = batch_size
+        self.models = None if models is None else {model._meta.concrete_model for model in models}
+
+        self.stats = {"flushes": 0, "inserted": 0, "updated": 0, "deleted": 0}
+
+        self._saves = {}  # id(instance) -> [instance, alias, update_fields or None, is_insert]
+        self._deletes = {}  # id(instance) -> (instance, alias)
+        self._first_buffered = None
+        self._outer = None
+        self._app_labels = set()
+
+    def __enter__(self):
+        from django.apps import apps
+
+        _install_patches()
+
+        self._app_labels = {app_config.label for app_config in apps.get_app_configs()}
+        self._outer = getattr(_local, "current", None)
+        _local.current = self
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.current = self._outer
+
+        if exc_type is None:
+            self.flush()
+        else:
+            self.discard()
+
+        return False
+
+    def handles(self, model) -> bool:
+        """
+        Checks whether writes to a model are buffered.
+        """
+        meta = model._meta
+
+        if meta.parents:
+            return False
+
+        return meta.concrete_model in self.models if self.models is not None else meta.app_label in self._app_labels
+
+    def is_buffered(self, instance) -> bool:
+        """
+        Checks whether an object has a buffered ``save()`` or ``delete()``.
+        """
+        return id(instance) in self._saves or id(instance) in self._deletes
+
+    def __len__(self):
+        return len(self._saves) + len(self._deletes)
+
+    def add_save(self, instance, using=None, update_fields=None, force_insert=False, force_update=False):
+        """
+        Buffers a ``save()`` call.
+        """
+        # Django treats saving no fields as a no-op
+        if update_fields is not None and not update_fields:
+            return
+
+        key = id(instance)
+
+        # the object has to be deleted before it can be saved again
+        if key in self._deletes:
+            self.flush()
+
+        alias = using or router.db_for_write(type(instance), instance=instance)
+        is_insert = force_insert or (instance._state.adding and not force_update)
+        update_fields = None if update_fields is None else set(update_fields)
+
+        if key in self._saves:
+            entry = self._saves[key]
+
+            # saving some fields after saving all of them still saves all of them
+            entry[2] = None if entry[2] is None or update_fields is None else entry[2] | update_fields
+        else:
+            self._saves[key] = [instance, alias, update_fields, is_insert]
+
+        self._after_add()
+
+    def add_delete(self, instance, using=None):
+        """
+        Buffers a ``delete()`` call.
+        """
+        key = id(instance)
+        entry = self._saves.pop(key, None)
+
+        # an object that was never written doesn't need deleting
+        if entry is not None and entry[3] and instance._state.adding:
+            return
+
+        self._deletes[key] = (instance, using or router.db_for_write(type(instance), instance=instance))
+        self._after_add()
+
+    def _after_add(self):
+        now = time.monotonic()
+
+        if self._first_buffered is None:
+            self._first_buffered = now
+
+        if len(self) >= self.max_size or (self.max_delay is not None and now - self._first_buffered >= self.max_delay):
+            self.flush()
+
+    def discard(self):
+        """
+        Empties the buffer without writing anything.
+        """
+        self._saves = {}
+        self._deletes = {}
+        self._first_buffered = None
+
+    def flush(self):
+        """
+        Writes everything in the buffer, in one transaction per connection.
+        """
+        saves, deletes = self._saves, self._deletes
+        self.discard()
+
+        if not saves and not deletes:
+            return
+
+        aliases = {entry[1] for entry in saves.values()} | {alias for _, alias in deletes.values()}
+
+        for alias in sorted(aliases):
+            inserts, updates, removals = {}, {}, {}
+
+            for instance, entry_alias, update_fields, is_insert in saves.values():
+                if entry_alias == alias:
+                    group = inserts if is_insert else updates
+                    group.setdefault(instance._meta.concrete_model, []).append((instance, update_fields))
+
+            for instance, entry_alias in deletes.values():
+                if entry_alias == alias:
+                    removals.setdefault(instance._meta.concrete_model, []).append(instance)
+
+            with transaction.atomic(using=alias):
+                for model in _dependency_order(set(inserts) | set(updates)):
+                    if model in inserts:
+                        self._insert(model, [obj for obj, _ in inserts[model]], alias)
+                    if model in updates:
+                        self._update(model, updates[model], alias)
+
+                for model in reversed(_dependency_order(removals)):
+                    self._delete(model, removals[model], alias)
+
+        self.stats["flushes"] += 1
+
+    def _insert(self, model, objs: list, alias: str):
+        connection = connections[alias]
+        can_return_pks = connection.features.can_return_rows_from_bulk_insert
+        generated_pk = isinstance(model._meta.pk, AutoField)
+        pending = objs
+
+        while pending:
+            ready = [obj for obj in pending if _resolve_relations(obj)]
+
+            if not ready:
+                raise ValueError(f"save() prohibited to prevent data loss due to an unsaved related object on a "
+                                 f"{model.__name__} in a unit of work.")
+
+            # objects need their primary keys once they're saved (to be saved again, or for other objects to point
+            # at), and some databases can't return them from a bulk insert
+            keyless = [] if can_return_pks or not generated_pk else [obj for obj in ready if obj.pk is None]
+            bulk = [obj for obj in ready if obj.pk is not None] if keyless else ready
+
+            if bulk:
+                model._base_manager.using(alias).bulk_create(bulk, batch_size=self.batch_size)
+
+            if keyless and connection.vendor == "sqlite":
+                self._insert_by_rowid(model, keyless, connection)
+            else:
+                for obj in keyless:
+                    obj._save_table(cls=model, force_insert=True, using=alias)
+                    obj._state.adding, obj._state.db = False, alias
+
+            self.stats["inserted"] += len(ready)
+
+            ready_ids = {id(obj) for obj in ready}
+            pending = [obj for obj in pending if id(obj) not in ready_ids]
+
+    def _insert_by_rowid(self, model, objs: list, connection):
+        """
+        Bulk inserts objects into an SQLite table whose primary key is its rowid, and gives them their primary keys.
+        """
+        fields = [field for field in model._meta.concrete_fields if not isinstance(field, AutoField)]
+        batch_size = max(connection.ops.bulk_batch_size(fields, objs), 1)
+
+        if self.batch_size:
+            batch_size = min(batch_size, self.batch_size)
+
+        manager = model._base_manager.using(connection.alias)
+
+        for start in range(0, len(objs), batch_size):
+            batch = objs[start:start + batch_size]
+
+            # one statement per batch, so its rows' rowids are the ones just before the last
+            manager.bulk_create(batch, batch_size=len(batch))
+
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT last_insert_rowid()")
+                last = cursor.fetchone()[0]
+
+            for pk, obj in zip(range(last - len(batch) + 1, last + 1), batch):
+                obj.pk = pk
+                obj._state.adding, obj._state.db = False, connection.alias
+
+    def _update(self, model, entries: list, alias: str):
+        all_fields = frozenset(field.name for field in model._meta.concrete_fields if not field.primary_key)
+        groups = {}
+
+        for obj, update_fields in entries:
+            if not _resolve_relations(obj):
+                raise ValueError(f"save() prohibited to prevent data loss due to an unsaved related object on a "
+                                 f"{model.__name__} in a unit of work.")
+
+            groups.setdefault(all_fields if update_fields is None else frozenset(update_fields), []).append(obj)
+
+        for fields, objs in groups.items():
+            if not fields:
+                continue
+
+            # bulk_update() doesn't call pre_save(), which is what fills in auto_now fields
+            for field in model._meta.concrete_fields:
+                if field.name in fields and getattr(field, "auto_now", False):
+                    for obj in objs:
+                        field.pre_save(obj, add=False)
+
+            model._base_manager.using(alias).bulk_update(objs, sorted(fields), batch_size=self.batch_size)
+            self.stats["updated"] += len(objs)
+
+    def _delete(self, model, objs: list, alias: str):
+        batch_size = self.batch_size or connections[alias].ops.bulk_batch_size(["pk"], objs) or len(objs)
+
+        for start in range(0, len(objs), batch_size):
+            batch = objs[start:start + batch_size]
+
+            # goes through Django's collector, so on_delete rules and delete signals behave as they do for delete()
+            model._base_manager.using(alias).filter(pk__in=[obj.pk for obj in batch]).delete()
+
+            for obj in batch:
+                setattr(obj, model._meta.pk.attname, None)
+
+        self.stats["deleted"] += len(objs)
+
+
+def unit_of_work(max_size: int = 1000, max_delay: float = None, batch_size: int = None, models=None) -> UnitOfWork:
+    """
+    Buffers ``save()`` and ``delete()`` calls and writes them in bulk. See ``UnitOfWork``.
+
+    :return: A ``UnitOfWork`` that can be used as a context manager or a decorator.
+    """
+    return UnitOfWork(max_size, max_delay, batch_size, models)
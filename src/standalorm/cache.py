@@ -0,0 +1,307 @@
+"""
+An opt-in cache for query results, invalidated automatically when the tables a query reads from are written to.
+"""
+
+import hashlib
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+
+from django.apps import apps
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+
+# statements that change a table's contents
+_write_statement = re.compile(r"^\s*(INSERT|UPDATE|DELETE|REPLACE|TRUNCATE|ALTER|DROP)\b", re.IGNORECASE)
+
+_cache = None
+
+
+class QueryCache:
+    """
+    A two-tier cache of query results. The first tier is an in-memory LRU cache; the optional second tier is an SQLite
+    database on disk, which survives between runs and holds entries evicted from memory. Entries expire ``ttl``
+    seconds after they're stored. Results are stored pickled, so callers never share model instances.
+
+    :param max_entries: The most entries kept in memory.
+    :param ttl: How many seconds an entry stays valid (0 means forever).
+    :param disk_path: The path of the on-disk tier's SQLite database, or None to keep everything in memory.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300, disk_path: str = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._memory = OrderedDict()  # key -> (expires, tables, pickled value)
+        self._lock = threading.Lock()
+        self._disk = None
+
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expirations": 0,
+                         "invalidations": 0}
+
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False, isolation_level=None)
+            self._disk.execute("PRAGMA journal_mode = WAL")
+            self._disk.execute("CREATE TABLE IF NOT EXISTS entries "
+                               "(key TEXT PRIMARY KEY, tables TEXT, expires REAL, value BLOB)")
+
+    def _expires(self, ttl: float = None) -> float:
+        ttl = self.ttl if ttl is None else ttl
+        return time.time() + ttl if ttl else float("inf")
+
+    def get(self, key: str):
+        """
+        Looks up a cached value.
+
+        :param key: The entry's key.
+        :return: A tuple of whether the key was found and the value (None if it wasn't found).
+        """
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return True, pickle.loads(entry[2])
+
+                del self._memory[key]
+                self.counters["expirations"] += 1
+
+            if self._disk is not None:
+                row = self._disk.execute("SELECT tables, expires, value FROM entries WHERE key = ?", (key,)).fetchone()
+
+                if row is not None and row[1] > now:
+                    self._store_in_memory(key, (row[1], frozenset(row[0].strip("|").split("|")), row[2]))
+                    self.counters["disk_hits"] += 1
+                    return True, pickle.loads(row[2])
+
+            self.counters["misses"] += 1
+            return False, None
+
+    def _store_in_memory(self, key: str, entry: tuple):
+        """
+        Adds an entry to the in-memory tier, evicting the least recently used entries (to disk, if there's a disk
+        tier) once it's full. Must be called with the lock held.
+        """
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+
+        while len(self._memory) > self.max_entries:
+            evicted_key, evicted = self._memory.popitem(last=False)
+            self.counters["evictions"] += 1
+            self._store_on_disk(evicted_key, evicted)
+
+    def _store_on_disk(self, key: str, entry: tuple):
+        if self._disk is not None:
+            expires, tables, value = entry
+            self._disk.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                               (key, f"|{'|'.join(sorted(tables))}|", expires, value))
+
+    def set(self, key: str, tables, value, ttl: float = None):
+        """
+        Stores a value.
+
+        :param key: The entry's key.
+        :param tables: The names of the database tables the value was read from.
+        :param value: The value. It must be picklable.
+        :param ttl: How many seconds the entry stays valid. Defaults to the cache's ``ttl``.
+        """
+        entry = (self._expires(ttl), frozenset(tables), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+        with self._lock:
+            self._store_in_memory(key, entry)
+            self._store_on_disk(key, entry)
+
+    def invalidate_tables(self, tables):
+        """
+        Removes every entry that was read from any of the given tables.
+
+        :param tables: Database table names.
+        """
+        tables = set(tables)
+
+        if not tables:
+            return
+
+        with self._lock:
+            stale = [key for key, entry in self._memory.items() if entry[1] & tables]
+
+            for key in stale:
+                del self._memory[key]
+
+            self.counters["invalidations"] += len(stale)
+
+            if self._disk is not None:
+                for table in tables:
+                    self._disk.execute("DELETE FROM entries WHERE tables LIKE ?", (f"%|{table}|%",))
+
+    def clear(self):
+        """
+        Removes every entry from both tiers.
+        """
+        with self._lock:
+            self._memory.clear()
+
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM entries")
+
+    def stats(self) -> dict:
+        """
+        Gets the cache's counters.
+
+        :return: A dictionary with the number of entries in memory and the counts of memory hits, disk hits, misses,
+                 LRU evictions, TTL expirations and invalidated entries.
+        """
+        with self._lock:
+            return {"entries": len(self._memory), **self.counters}
+
+
+def _get_table_names() -> set:
+    return {model._meta.db_table for model in apps.get_models(include_auto_created=True)}
+
+
+def get_tables(sql: str, connection) -> set:
+    """
+    Finds the tables of installed models that a SQL statement mentions, including tables only referenced by
+    subqueries.
+
+    :param sql: A SQL statement.
+    :param connection: The Django database connection the statement is for (used to quote table names).
+    :return: A set of table names.
+    """
+    return {table for table in _get_table_names() if connection.ops.quote_name(table) in sql}
+
+
+def _invalidate_tables(tables: set):
+    if _cache is not None:
+        _cache.invalidate_tables(tables)
+
+
+def _invalidate(tables: set, connection):
+    """
+    Invalidates cached results read from any of the given tables, which have just been written to on ``connection``.
+    Inside a transaction, they're invalidated again when it commits: until then, other connections still read the
+    rows as they were before the write, and may cache them.
+    """
+    if _cache is None or not tables:
+        return
+
+    _cache.invalidate_tables(tables)
+
+    if connection.in_atomic_block:
+        # one callback per transaction collects the tables; it's dropped along with the transaction on a rollback
+        pending = connection.__dict__.get("_standalorm_invalidation")
+
+        if pending is None or not any(entry[1] is pending for entry in connection.run_on_commit):
+            pending = connection._standalorm_invalidation = partial(_invalidate_tables, set())
+            transaction.on_commit(pending, using=connection.alias)
+
+        pending.args[0].update(tables)
+
+
+def _invalidate_on_write(execute, sql, params, many, context):
+    """
+    Execute wrapper that invalidates cached results for every table a write statement touches. This covers writes that
+    don't send signals, like ``bulk_create()``, ``update()`` and raw SQL.
+    """
+    result = execute(sql, params, many, context)
+
+    if _cache is not None and _write_statement.match(sql):
+        _invalidate(get_tables(sql, context["connection"]), context["connection"])
+
+    return result
+
+
+def _add_wrapper(sender, connection, **kwargs):
+    if _invalidate_on_write not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_invalidate_on_write)
+
+
+def _invalidate_model(sender, using, **kwargs):
+    _invalidate({sender._meta.db_table}, connections[using])
+
+
+def install_cache(orm_settings: dict, user_root: str):
+    """
+    Creates the query cache from the [cache] table of orm-settings.toml (``max_entries``, ``ttl``, and ``disk_path``,
+    a path relative to ``user_root``) and hooks up its invalidation. Does nothing unless ``enabled`` is true.
+
+    :param orm_settings: A dictionary of standalorm's settings.
+    :param user_root: The directory the user's script is being run from.
+    :return: The ``QueryCache``, or None if the cache isn't enabled.
+    """
+    global _cache
+
+    config = orm_settings.get("cache", {})
+
+    if not config.get("enabled", False):
+        return None
+
+    if _cache is None:
+        disk_path = config.get("disk_path")
+        _cache = QueryCache(config.get("max_entries", 1024), config.get("ttl", 300),
+                            os.path.join(user_root, disk_path) if disk_path else None)
+
+    post_save.connect(_invalidate_model, dispatch_uid="standalorm.cache.post_save")
+    post_delete.connect(_invalidate_model, dispatch_uid="standalorm.cache.post_delete")
+    connection_created.connect(_add_wrapper, dispatch_uid="standalorm.cache")
+
+    return _cache
+
+
+def get_cache():
+    """
+    Gets the query cache.
+
+    :return: The ``QueryCache``, or None if the cache isn't enabled.
+    """
+    return _cache
+
+
+def cached(queryset, ttl: float = None) -> list:
+    """
+    Evaluates a queryset, returning cached results if the same query (same SQL and parameters on the same connection)
+    has been run before and none of the tables it reads from have been written to since::
+
+        countries = cached(Country.objects.filter(active=True))
+
+    If the cache isn't enabled, or the connection is inside a transaction, the queryset is simply evaluated: results
+    read inside a transaction may include its uncommitted writes, and it may still be rolled back.
+
+    :param queryset: The queryset to evaluate. Its results must be picklable.
+    :param ttl: How many seconds to cache the results for. Defaults to the cache's ``ttl``.
+    :return: A list of the queryset's results.
+    """
+    connection = connections[queryset.db]
+
+    if _cache is None or connection.in_atomic_block:
+        return list(queryset)
+
+    sql, params = queryset.query.clone().get_compiler(using=queryset.db).as_sql()
+
+    key = hashlib.sha1(repr((queryset.db, sql, tuple(params))).encode()).hexdigest()
+    found, value = _cache.get(key)
+
+    if not found:
+        value = list(queryset)
+        _cache.set(key, get_tables(sql, connection), value, ttl)
+
+    return value
+
+
+def cache_stats() -> dict:
+    """
+    Gets the query cache's counters. See ``QueryCache.stats()``.
+
+    :return: A dictionary of counters (empty if the cache isn't enabled).
+    """
+    return _cache.stats() if _cache is not None else {}
@@ -2,25 +2,38 @@
 standalorm's command line interface.
 """
 
+import json
 import os
 import subprocess
 import sys
+import time
 import uuid
 from tempfile import TemporaryDirectory
 
 import click
 import colorama
+import standalorm.dumper as dumper
+import standalorm.loader as loader
 import standalorm.utils as utils
 import toml
 from colorama import Fore
+from django.core.exceptions import FieldDoesNotExist
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError
+from standalorm.databases import ROLE_CHOICES
 from standalorm.db_makers import make_new_db
-from path import Path
+from standalorm.migration_status import (get_applied_migrations, get_migration_names, get_pending_migrations,
+                                         remove_snapshot, write_snapshot)
+from standalorm.orm_init import setup
 
 colorama.init(autoreset=True)
 
 lib_root = os.path.dirname(__file__)
 user_root = os.getcwd()
 
+# a project-local orm-settings.toml in the current directory (or one of its parents) takes precedence
+project_settings = utils.use_project_settings(user_root)
+
 orm_settings = utils.get_settings()
 
 
@@ -56,6 +69,30 @@ def about(show_license=False):
             print(f"\n{license_file.read()}\n")
 
 
+@cli.command()
+def init():
+    """
+    Create a project-local orm-settings.toml in the current directory.
+
+    The new file starts out as a copy of the settings currently in use. From then on, standalorm's commands run in
+    this directory (or below it), and scripts in it that call orm_init(), use it instead of the global settings file,
+    so projects on the same machine no longer share apps and connections.
+    """
+    path = os.path.join(user_root, utils.SETTINGS_FILENAME)
+
+    if os.path.exists(path):
+        print(Fore.RED + f"\n{path} already exists.\n", file=sys.stderr)
+        exit()
+
+    settings = dict(orm_settings, config=dict(orm_settings["config"]))
+    settings["config"].setdefault("apps", [])
+
+    utils.use_settings(path)
+    utils.save_settings(settings)
+
+    print(f"\nCreated {path}.\n")
+
+
 @cli.command()
 @click.argument("app_name", required=False, default="db")
 @click.option("--no-create", "-nc", "no_create", is_flag=True,
@@ -66,55 +103,375 @@ def startapp(app_name: str, no_create: bool = False):
     Create a Django app in your project's root directory.
 
     APP_NAME is the name you want to assign to your app. If left empty, this will default to "db".
+
+    With a project-local orm-settings.toml (see "standalorm init"), the new app is added to the project's apps and
+    becomes the current app, which commands like "standalorm migrate" work on by default. Otherwise, it replaces the
+    current app.
     """
-    orm_settings["config"]["app"] = app_name  # set app name
+    config = orm_settings["config"]
 
-    if not no_create:
-        # create app directory
-        app_path = os.path.join(user_root, app_name)
-        os.mkdir(app_path)
+    if project_settings:
+        # keep the project's other apps installed (leaving out placeholders that were never created)
+        config["apps"] = [name for name in utils.get_apps(orm_settings)
+                          if name != app_name and os.path.isdir(os.path.join(user_root, *name.split(".")))]
 
-        # populate app directory with __init__.py and models.py
-        with Path(app_path):
-            open("__init__.py", "w")
+    config["app"] = app_name  # set app name
 
-            with open("models.py", "w") as models:
-                with open(os.path.join(lib_root, "models_template.py")) as template:
-                    models.write(template.read())
+    if not no_create:
+        utils.create_app(user_root, app_name)
 
     utils.save_settings()
 
     print(f"\nApp '{app_name}' started successfully.\n")
 
+    if not project_settings:
+        print(f"To keep several apps, or settings for this project only, run "
+              f"{Fore.CYAN + 'standalorm init' + Fore.RESET} first.\n")
+
+
+def get_app_name(app_name: str = None) -> str:
+    """
+    Gets the app a command should work on, exiting with an error if it isn't one of the project's apps.
+
+    :param app_name: The name of the app passed to the command, or None for the current app.
+    :return: The app's name.
+    """
+    if app_name is None:
+        return orm_settings["config"]["app"]
+
+    if app_name not in utils.get_apps(orm_settings):
+        print(Fore.RED + f"\n'{app_name}' isn't one of this project's apps "
+                         f"({', '.join(utils.get_apps(orm_settings))}).\n", file=sys.stderr)
+        exit()
+
+    return app_name
+
+
+def setup_django():
+    """
+    Configures Django in-process for the project in the current working directory so management commands can be run
+    through ``call_command()`` instead of a separate ``manage.py`` interpreter.
+    """
+    if user_root not in sys.path:
+        sys.path.insert(0, user_root)
+
+    setup(user_root)
+
 
 @cli.command()
-def makemigrations():
+@click.option("--app", "-a", "app_name", default=None, help="The app to work on. Defaults to the current app.")
+def makemigrations(app_name: str = None):
     """
     Create database migrations.
     """
-    app_name = orm_settings["config"]["app"]
-    os.environ["USER_ROOT"] = user_root
-    utils.set_pythonpath(user_root)
+    app_name = get_app_name(app_name)
+    setup_django()
 
-    with Path(lib_root):
-        print()
-        subprocess.run(f"python manage.py makemigrations {app_name}")
-        print()
+    print()
+    call_command("makemigrations", app_name)
+    print()
 
 
 @cli.command()
-def migrate():
+@click.option("--check", "check", is_flag=True,
+              help="Don't apply anything; exit with status 1 if there are unapplied migrations. This reads the "
+                   "migration recorder table and only loads the migration graph if something looks unapplied.")
+@click.option("--database", "database", default="default", show_default=True,
+              help="The alias of the connection to migrate: 'default' (the current connection) or the name of a "
+                   "connection with a role.")
+@click.option("--online", "online", is_flag=True,
+              help="Apply schema changes to large tables without locking them for the duration (PostgreSQL and SQLite "
+                   "only). See the standalorm.online module for what each operation is turned into.")
+@click.option("--dry-run", "dry_run", is_flag=True,
+              help="With --online, show how each pending operation would be applied and what it would lock, "
+                   "without changing anything.")
+@click.option("--batch-size", type=int, default=1000, show_default=True,
+              help="With --online, the number of rows copied or backfilled per batch.")
+@click.option("--throttle", type=float, default=0.0, show_default=True,
+              help="With --online, how many seconds to pause between batches.")
+@click.option("--app", "-a", "app_name", default=None, help="The app to work on. Defaults to the current app.")
+def migrate(check: bool = False, database: str = "default", online: bool = False, dry_run: bool = False,
+            batch_size: int = 1000, throttle: float = 0.0, app_name: str = None):
     """
     Apply database migrations.
     """
-    app_name = orm_settings["config"]["app"]
-    os.environ["USER_ROOT"] = user_root
-    utils.set_pythonpath(user_root)
+    app_name = get_app_name(app_name)
+    migrations_dir = os.path.join(user_root, app_name, "migrations")
+    setup_django()
 
-    with Path(lib_root):
-        print()
-        subprocess.run(f"python manage.py migrate {app_name}")
-        print()
+    pending = get_pending_migrations(app_name, migrations_dir, database)
+
+    if check:
+        if pending:
+            print(Fore.YELLOW + f"\n{len(pending)} unapplied migration(s) for app '{app_name}':\n")
+            for name in pending:
+                print(f"* {name}")
+            print()
+            sys.exit(1)
+
+        print("\nNo migrations to apply.\n")
+        return
+
+    # with nothing pending, skip loading the migration graph altogether
+    if not pending and get_migration_names(migrations_dir):
+        print("\nNo migrations to apply.\n")
+        return
+
+    if online or dry_run:
+        from standalorm.online import OnlineMigrator
+
+        def show_progress(step, done, total):
+            print(f"\r  {step}: {done} of ~{max(done, total)} rows", end="", flush=True)
+
+        try:
+            migrator = OnlineMigrator(app_name, database, batch_size, throttle, progress=show_progress)
+        except ValueError as error:
+            print(Fore.RED + f"\n{error}\n", file=sys.stderr)
+            exit()
+
+        if dry_run:
+            print(f"\nOnline migration plan for app '{app_name}' (nothing will be changed):\n")
+            print("\n".join(migrator.describe()))
+            print()
+            return
+
+        print(f"\nApplying {len(pending)} migration(s) online...\n")
+        applied = migrator.migrate()
+        print(f"\n\nApplied {applied} migration(s).\n")
+        return
+
+    print()
+    call_command("migrate", app_name, database=database)
+    print()
+
+
+@cli.group()
+def migrations():
+    """
+    Manage your app's migration snapshot.
+
+    A snapshot records your app's migration plan, keyed by a hash of your migration files.
+    While it's up to date, "standalorm migrate" works out what's pending from the snapshot and the database's
+    migration table alone, and returns without loading the migration graph when nothing is. Any change to your
+    migration files makes the snapshot stale, after which it's ignored until you take a new one.
+    """
+    pass
+
+
+@migrations.command()
+@click.option("--squash", "squash", is_flag=True,
+              help="Squash all of your app's migrations into one before taking the snapshot.")
+@click.option("--database", "database", default="default", show_default=True,
+              help="The alias of the connection to report the applied migrations of.")
+@click.option("--app", "-a", "app_name", default=None, help="The app to work on. Defaults to the current app.")
+def snapshot(squash: bool = False, database: str = "default", app_name: str = None):
+    """
+    Take a snapshot of your app's migrations.
+    """
+    app_name = get_app_name(app_name)
+    migrations_dir = os.path.join(user_root, app_name, "migrations")
+    setup_django()
+
+    if not get_migration_names(migrations_dir):
+        print(Fore.RED + f"\nApp '{app_name}' has no migrations to snapshot.\n", file=sys.stderr)
+        exit()
+
+    if squash:
+        from django.db.migrations.loader import MigrationLoader
+
+        leaves = [name for app, name in MigrationLoader(None).graph.leaf_nodes() if app == app_name]
+
+        try:
+            print()
+            call_command("squashmigrations", app_name, leaves[-1], interactive=False)
+        except CommandError as error:
+            print(Fore.RED + f"\nYour migrations couldn't be squashed. ({error})\n", file=sys.stderr)
+            exit()
+
+    start = time.perf_counter()
+    snapshot_info = write_snapshot(app_name, migrations_dir)
+    elapsed = (time.perf_counter() - start) * 1000
+
+    print(f"\nSnapshot of {len(snapshot_info['plan'])} migration(s) for app '{app_name}' taken in {elapsed:.0f} ms "
+          f"({len(get_applied_migrations(app_name, database))} applied to '{database}').\n")
+
+
+@migrations.command()
+@click.option("--app", "-a", "app_name", default=None, help="The app to work on. Defaults to the current app.")
+def clear(app_name: str = None):
+    """
+    Delete your app's migration snapshot.
+    """
+    app_name = get_app_name(app_name)
+
+    if remove_snapshot(os.path.join(user_root, app_name, "migrations")):
+        print(f"\nSnapshot for app '{app_name}' deleted.\n")
+    else:
+        print(f"\nApp '{app_name}' has no snapshot.\n")
+
+
+@cli.command("profile-startup")
+@click.option("--fast", "fast", is_flag=True, help="Profile orm_init() in fast-startup mode.")
+@click.option("--imports", "-i", "top_imports", type=int, default=10, show_default=True,
+              help="How many of the slowest imports to list.")
+def profile_startup(fast: bool = False, top_imports: int = 10):
+    """
+    Show where the time goes when a script calls orm_init().
+
+    orm_init() is run in a fresh Python interpreter in the current working directory, so the numbers reflect a cold
+    start of a real script.
+    """
+    script = ("import json, os, sys\n"
+              "sys.path.insert(0, os.getcwd())\n"
+              "from standalorm.orm_init import orm_init, get_startup_timings\n"
+              f"orm_init(os.path.join(os.getcwd(), '__main__.py'), fast={fast})\n"
+              "print(json.dumps(get_startup_timings()))\n")
+
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", script],
+                            cwd=user_root, capture_output=True, text=True)
+    wall_time = (time.perf_counter() - start) * 1000
+
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        error = errors[-1] if errors else f"The process exited with status {result.returncode}."
+        print(Fore.RED + f"\norm_init() failed:\n\n{error}\n", file=sys.stderr)
+        exit()
+
+    timings = json.loads(result.stdout.splitlines()[-1])
+
+    # -X importtime lines look like "import time:  self [us] |  cumulative | imported package"
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        imports.append((int(self_us) / 1000, int(cumulative_us) / 1000, module.strip()))
+
+    print(f"\nStartup profile for orm_init() (fast mode {'on' if fast else 'off'}):\n")
+
+    for phase, ms in timings.items():
+        print(f"  {phase:<20}{ms:>10.1f} ms")
+
+    print(f"  {'total (in script)':<20}{sum(timings.values()):>10.1f} ms")
+    print(f"  {'total (interpreter)':<20}{wall_time:>10.1f} ms")
+
+    if top_imports > 0:
+        print("\nSlowest imports (self time, cumulative time):\n")
+
+        for self_ms, cumulative_ms, module in sorted(imports, reverse=True)[:top_imports]:
+            print(f"  {module:<40}{self_ms:>8.1f} ms{cumulative_ms:>10.1f} ms")
+
+    print()
+
+
+@cli.command()
+@click.option("--rows", "-r", "rows", type=click.IntRange(1), multiple=True, default=(10000, 1000000),
+              show_default=True,
+              help="A row count to run the bulk_create and iterator benchmarks at. Can be given more than once.")
+@click.option("--repeat", type=click.IntRange(1), default=5, show_default=True,
+              help="How many warm orm_init() runs to take the median of.")
+@click.option("--iterations", type=click.IntRange(1), default=1000, show_default=True,
+              help="How many times to time each single-row CRUD operation.")
+@click.option("--postgresql-env", "postgresql_env", default=None,
+              help="The name of an environment variable holding a PostgreSQL connection URI. If given, the database "
+                   "benchmarks also run against that database (the benchmark's tables are dropped afterwards).")
+@click.option("--output", "-o", "output", type=click.Path(dir_okay=False), default=None,
+              help="Write the results to this file instead of standard output.")
+def bench(rows: tuple = (10000, 1000000), repeat: int = 5, iterations: int = 1000, postgresql_env: str = None,
+          output: str = None):
+    """
+    Benchmark standalorm's startup, migration, CRUD and bulk paths.
+
+    The benchmarks run against a synthetic app in a throwaway project that uses a copy of your settings, so your
+    project and databases aren't touched. Results are written as JSON for comparing runs.
+    """
+    from standalorm.bench import run_benchmarks
+
+    def show_progress(message):
+        print(f"Running benchmark: {message}", file=sys.stderr)
+
+    try:
+        results = run_benchmarks(rows, repeat, iterations, postgresql_env, progress=show_progress)
+    except (ValueError, RuntimeError) as error:
+        print(Fore.RED + f"\n{error}\n", file=sys.stderr)
+        exit()
+
+    if output:
+        with open(output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+        print(f"\nBenchmark results written to {output}.\n", file=sys.stderr)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+@cli.command()
+@click.argument("model")
+@click.argument("file", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "-f", "file_format", type=click.Choice(["csv", "jsonl"]),
+              help="The file's format. Inferred from the file extension if omitted.")
+@click.option("--batch-size", "-b", type=int, default=1000, show_default=True, help="Rows per INSERT statement.")
+@click.option("--transaction-size", "-t", type=int, default=10000, show_default=True, help="Rows per transaction.")
+@click.option("--conflict", "-c", type=click.Choice(loader.CONFLICT_CHOICES), default="error", show_default=True,
+              help="What to do with rows that conflict with existing rows.")
+@click.option("--key", "-k", default=None,
+              help="The field used to match rows to existing rows with --conflict update. Defaults to the primary key.")
+def load(model: str, file: str, file_format: str = None, batch_size: int = 1000, transaction_size: int = 10000,
+         conflict: str = "error", key: str = None):
+    """
+    Load rows from a CSV or JSONL file into a model.
+
+    MODEL is the name of a model in your app (e.g. "Book"). FILE is the path to the file. Columns are matched to the
+    model's fields by name.
+    """
+    setup_django()
+
+    def show_progress(rows, elapsed):
+        print(f"\r{rows} rows loaded ({rows / elapsed if elapsed else 0:.0f} rows/sec)", end="", flush=True)
+
+    try:
+        rows = loader.load(model, file, file_format, batch_size=batch_size, transaction_size=transaction_size,
+                           conflict=conflict, key=key, progress=show_progress)
+    except (LookupError, ValueError, IntegrityError) as error:
+        print(Fore.RED + f"\n{error}\n", file=sys.stderr)
+        exit()
+
+    print(f"\n\nLoaded {rows} rows into {model}.\n")
+
+
+@cli.command()
+@click.argument("model")
+@click.argument("output", type=click.Path())
+@click.option("--format", "-f", "file_format", type=click.Choice(dumper.FORMAT_CHOICES), default="csv",
+              show_default=True, help="The output format. 'columns' writes one binary file per field to a directory.")
+@click.option("--fields", "fields", default=None, help="A comma-separated list of the fields to export.")
+@click.option("--chunk-size", type=int, default=2000, show_default=True,
+              help="Rows fetched from the database at a time.")
+@click.option("--page-size", type=int, default=100000, show_default=True,
+              help="Rows per keyset page (and between resume checkpoints).")
+@click.option("--resume", "-r", "resume", is_flag=True, help="Continue an interrupted dump to OUTPUT.")
+def dump(model: str, output: str, file_format: str = "csv", fields: str = None, chunk_size: int = 2000,
+         page_size: int = 100000, resume: bool = False):
+    """
+    Export a model's rows to a file.
+
+    MODEL is the name of a model in your app (e.g. "Book"). OUTPUT is the path of the file (or, for the columns
+    format, the directory) to write to. Memory use stays constant no matter how big the table is.
+    """
+    setup_django()
+
+    def show_progress(rows, elapsed):
+        print(f"\r{rows} rows written ({rows / elapsed if elapsed else 0:.0f} rows/sec)", end="", flush=True)
+
+    try:
+        rows = dumper.dump(model, output, file_format, fields.split(",") if fields else None, chunk_size, page_size,
+                           resume, progress=show_progress)
+    except (LookupError, ValueError, FieldDoesNotExist) as error:
+        print(Fore.RED + f"\n{error}\n", file=sys.stderr)
+        exit()
+
+    print(f"\n\nWrote {rows} rows from {model} to {output}.\n")
 
 
 @cli.command()
@@ -331,6 +688,170 @@ def remove(db: str):
         print(f"\nDatabase connection '{db}' successfully removed.\n")
 
 
+@db.command()
+@click.argument("db", default="")
+@click.argument("role", default="", type=click.Choice(ROLE_CHOICES + ("",), case_sensitive=False))
+def role(db: str, role: str):
+    """
+    Assign a role to a database connection.
+
+    Every connection with a role is registered under its own name (as well as the current connection, which is always
+    registered as "default"). Writes go to the connection with the "primary" role, or the current connection if no
+    other connection is the primary. Reads are spread across connections with the "replica" role. Only one connection
+    can be the primary, so assigning it to one connection takes it away from any other. Connections with the
+    "readonly" role are left out of routing; use them explicitly with .using() for reports and analytics. They're
+    opened read-only and reject writes.
+
+    DB is the name of the connection. ROLE is "primary", "replica", "readonly", or "none" (to remove the connection's
+    role).
+    You'll be prompted for these values if you don't specify them.
+    """
+    db = db.casefold()
+    db_choices = utils.get_connection_list(include_default=False)
+
+    # prompt user for connection name if not specified in command line
+    if not db and db_choices:
+        db = utils.selection_prompt("Which database connection would you like to assign a role to?", db_choices)
+
+    if db not in db_choices:
+        if not db_choices:
+            print(Fore.RED + "\nThere are currently no database connections you can assign a role to.\n")
+        elif db == "default":
+            print(Fore.RED + "\nYou can't assign a role to the default database connection.\n")
+        else:
+            print(Fore.RED + "\nThere's no database connection with that name.\n")
+        return
+
+    if not role:
+        role = utils.selection_prompt("Which role should this connection have?", list(ROLE_CHOICES))
+
+    role = role.casefold()
+
+    if role == "none":
+        orm_settings["databases"][db].pop("ROLE", None)
+    else:
+        if role == "primary":
+            # there can only be one primary
+            for info in orm_settings["databases"].values():
+                if info.get("ROLE") == "primary":
+                    info.pop("ROLE")
+
+        orm_settings["databases"][db]["ROLE"] = role
+
+    utils.save_settings()
+
+    print(f"\nDatabase connection '{db}' now has the role '{role}'.\n")
+
+
+@db.command()
+@click.option("--timeout", type=float, default=10.0, show_default=True,
+              help="How many seconds each connection's test query may run for (PostgreSQL only).")
+@click.option("--json", "as_json", is_flag=True, help="Print the results as JSON.")
+def check(timeout: float = 10.0, as_json: bool = False):
+    """
+    Check that every database connection is configured correctly and reachable.
+
+    Every connection in orm-settings.toml is checked in parallel, including the URIs of connections configured by
+    environment variables. Exits with status 1 if any connection fails, so it can gate scheduled jobs.
+    """
+    from standalorm.connections import check_connections
+
+    results = check_connections(orm_settings, user_root, timeout)
+
+    if as_json:
+        print(json.dumps(results, indent=2))
+    else:
+        print()
+
+        for name, result in results.items():
+            if result["ok"]:
+                print(f"* {name}: " + Fore.GREEN + "OK" + Fore.RESET +
+                      f" (connected in {result['connect_ms']:.1f} ms, test query took {result['query_ms']:.1f} ms)")
+            else:
+                print(f"* {name}: " + Fore.RED + "FAILED" + Fore.RESET + f" ({result['error']})")
+
+        print()
+
+    if not all(result["ok"] for result in results.values()):
+        sys.exit(1)
+
+
+@db.command()
+@click.option("--top", "-t", "top", type=int, default=20, show_default=True,
+              help="How many of the workload's statements to explain, ordered by total time.")
+@click.option("--min-rows", type=int, default=1000, show_default=True,
+              help="Ignore full scans of tables with fewer rows than this.")
+@click.option("--dry-run", "dry_run", is_flag=True, help="Print the proposals without writing a migration.")
+@click.option("--clear", "clear_workload", is_flag=True, help="Delete the recorded workload and exit.")
+def advise(top: int = 20, min_rows: int = 1000, dry_run: bool = False, clear_workload: bool = False):
+    """
+    Propose indexes based on the recorded query workload.
+
+    Set record = true in the [advisor] table of orm-settings.toml and run your scripts to record a workload. This
+    command then explains its most expensive statements, and for each full scan of a large table, proposes an index
+    and writes a migration that adds it. Add the printed Meta.indexes entries to your models before running
+    "standalorm makemigrations" again, or Django will want to remove the indexes.
+    """
+    from standalorm import advisor
+
+    workload_path = advisor.get_workload_path(orm_settings, user_root)
+
+    if clear_workload:
+        if os.path.exists(workload_path):
+            os.remove(workload_path)
+
+        print("\nWorkload cleared.\n")
+        return
+
+    workload = advisor.read_workload(workload_path)
+
+    if not workload:
+        print(Fore.YELLOW + f"\nNo workload has been recorded at {workload_path}. Set record = true in the [advisor] "
+                            f"table of orm-settings.toml and run your scripts first.\n")
+        return
+
+    setup_django()
+
+    proposals, errors = advisor.advise(workload, top, min_rows)
+
+    print(f"\nExplained the top {min(top, len(workload))} of {len(workload)} recorded statement(s).\n")
+
+    for error in errors:
+        print(Fore.YELLOW + f"Couldn't explain {error['shape']}\n  {error['error']}\n")
+
+    if not proposals:
+        print("No indexes to propose.\n")
+        return
+
+    for proposal in proposals:
+        model = proposal["model"]
+
+        print(f"{model._meta.label} ({proposal['rows']} rows, {proposal['total_ms']:.1f} ms of recorded time):")
+        print("    " + Fore.CYAN + f"models.Index(fields={proposal['fields']!r}, "
+                                   f"name={advisor.make_index(model, proposal['fields']).name!r})")
+
+        for statement in proposal["statements"]:
+            print(f"  * {statement['plan']}, {statement['count']} time(s), {statement['total_ms']:.1f} ms: "
+                  f"{statement['shape']}")
+
+        print()
+
+    if dry_run:
+        return
+
+    try:
+        paths = advisor.write_migrations(proposals)
+    except ValueError as error:
+        print(Fore.RED + f"\n{error}\n", file=sys.stderr)
+        exit()
+
+    for path in paths:
+        print(f"Wrote {os.path.relpath(path, user_root)}")
+
+    print(f"\nApply the indexes with {Fore.CYAN + 'standalorm migrate' + Fore.RESET}, and add the entries above to "
+          f"each model's Meta.indexes.\n")
+
+
 @db.command()
 @click.option("--current", "-c", "current", is_flag=True, help="List only the current connection.")
 def ls(current: bool = False):
@@ -342,7 +863,8 @@ def ls(current: bool = False):
     connections = utils.get_connection_list(include_default=True, current=current)
 
     for conn in connections:
-        print(f"* {conn}")
+        role = orm_settings["databases"][conn].get("ROLE")
+        print(f"* {conn}" + (f" ({role})" if role else ""))
 
     print()
 
@@ -0,0 +1,180 @@
+"""
+Low-memory ways to read large numbers of rows: compact rows and columns.
+
+A model instance carries a ``__dict__``, a ``_state`` object, and the cost of ``Model.__init__()``. For scans that
+only read values, ``compact()`` yields rows of a small tuple class with named fields, generated once per model,
+instead::
+
+    for book in compact(Book.objects.filter(published__year=2020)):
+        total += book.price
+
+``columns()`` goes further and reads a queryset a chunk at a time into one buffer per field, which is what aggregation
+code usually wants anyway::
+
+    for chunk in columns(Book.objects.all(), ["price", "pages"]):
+        total += sum(chunk["price"])
+
+Non-nullable integer, float and boolean fields are read into ``array.array`` buffers (8 bytes per value, or 1 for
+booleans), which support the buffer protocol, so ``numpy.frombuffer(chunk["price"])`` wraps one without copying. Every
+other field is read into a list. Values go through the same conversions (``from_db_value()`` and the database
+backend's converters) as they do for model instances.
+"""
+
+import array
+import threading
+from operator import itemgetter
+
+from standalorm.dumper import ARRAY_TYPECODES, get_column_encoding
+
+# generated row classes, keyed by model and field names
+_row_classes = {}
+_row_classes_lock = threading.Lock()
+
+
+class CompactRow(tuple):
+    """
+    Base class of the row classes ``compact()`` generates. Rows are tuples with no ``__dict__`` (``__slots__`` is
+    empty) and a read-only attribute per field, named after the field's attribute name (``author_id`` rather than
+    ``author`` for foreign keys). Field attributes take precedence over tuple's ``count()`` and ``index()``.
+
+    Each subclass has a ``__model__`` attribute pointing at the model it was generated for and a ``__fields__`` tuple
+    of the field attribute names, which no Django field can be named.
+    """
+
+    __slots__ = ()
+
+    __fields__ = ()
+    __model__ = None
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={value!r}" for name, value in zip(self.__fields__, self))
+        return f"{type(self).__name__}({values})"
+
+    @property
+    def pk(self):
+        return getattr(self, self.__model__._meta.pk.attname)
+
+    def _asdict(self) -> dict:
+        """
+        Converts the row into a dictionary mapping field attribute names to values.
+        """
+        return dict(zip(self.__fields__, self))
+
+
+def _get_fields(model, fields) -> list:
+    """
+    Looks up the fields to read: the named fields, or every concrete field if none are named.
+    """
+    opts = model._meta
+
+    return [opts.get_field(name) for name in fields] if fields else list(opts.concrete_fields)
+
+
+def _new_buffers(read_fields: list) -> dict:
+    """
+    Creates an empty buffer for each field: an ``array.array`` where the field's values fit in one, a list otherwise.
+    """
+    buffers = {}
+
+    for field in read_fields:
+        typecode = ARRAY_TYPECODES.get(get_column_encoding(field))
+        buffers[field.attname] = array.array(typecode) if typecode else []
+
+    return buffers
+
+
+def get_row_class(model, fields=None) -> type:
+    """
+    Gets the compact row class for a model and a set of its fields, generating it the first time it's asked for.
+
+    :param model: The model.
+    :param fields: The names of the fields the rows hold. If None, the rows hold every concrete field.
+    :return: A subclass of ``CompactRow``.
+    """
+    names = tuple(field.attname for field in _get_fields(model, fields))
+    clashes = [name for name in names if name in vars(CompactRow)]
+
+    if clashes:
+        raise ValueError(f"{model.__name__} can't be read into compact rows, since its {', '.join(clashes)} field(s) "
+                         f"would hide the CompactRow attributes of the same name.")
+    key = (model, names)
+
+    with _row_classes_lock:
+        if key not in _row_classes:
+            namespace = {name: property(itemgetter(index), doc=f"The {name} field.")
+                         for index, name in enumerate(names)}
+            namespace.update({"__slots__": (), "__fields__": names, "__model__": model, "__module__": model.__module__})
+
+            _row_classes[key] = type(f"{model.__name__}Row", (CompactRow,), namespace)
+
+        return _row_classes[key]
+
+
+def compact(queryset, fields: list = None, chunk_size: int = 2000):
+    """
+    Iterates over a queryset's rows as compact row objects instead of model instances (see
+    ``CompactRow``). Rows are fetched ``chunk_size`` at a time, so memory use doesn't grow with the number of rows.
+
+    :param queryset: The queryset to read. Its filters, ordering and slicing are kept; ``only()``, ``defer()``,
+                     ``values()`` and ``select_related()`` are overridden.
+    :param fields: The names of the fields to read. If None, every concrete field is read.
+    :param chunk_size: How many rows to fetch from the database at a time.
+    :return: A generator of row objects.
+    """
+    row_class = get_row_class(queryset.model, fields)
+
+    # tuple.__new__() builds each row in C, without running any Python code per field
+    make_row = tuple.__new__
+
+    for values in queryset.values_list(*row_class.__fields__).iterator(chunk_size=chunk_size):
+        yield make_row(row_class, values)
+
+
+def columns(queryset, fields: list = None, chunk_size: int = 10000):
+    """
+    Reads a queryset a chunk at a time, column by column.
+
+    :param queryset: The queryset to read.
+    :param fields: The names of the fields to read. If None, every concrete field is read.
+    :param chunk_size: How many rows go in each chunk.
+    :return: A generator of dictionaries, one per chunk, mapping field attribute names to ``array.array`` buffers
+             (non-nullable integer, float and boolean fields) or lists (everything else).
+    """
+    read_fields = _get_fields(queryset.model, fields)
+    chunk = _new_buffers(read_fields)
+    buffers = list(chunk.values())
+    rows = 0
+
+    for values in queryset.values_list(*chunk).iterator(chunk_size=chunk_size):
+        for buffer, value in zip(buffers, values):
+            buffer.append(value)
+
+        rows += 1
+
+        if rows == chunk_size:
+            yield chunk
+
+            chunk = _new_buffers(read_fields)
+            buffers = list(chunk.values())
+            rows = 0
+
+    if rows:
+        yield chunk
+
+
+def load_columns(queryset, fields: list = None, chunk_size: int = 10000) -> dict:
+    """
+    Reads a whole queryset column by column (see ``columns()``).
+
+    :param queryset: The queryset to read.
+    :param fields: The names of the fields to read. If None, every concrete field is read.
+    :param chunk_size: How many rows to fetch from the database at a time.
+    :return: A dictionary mapping field attribute names to ``array.array`` buffers or lists holding every row's value.
+    """
+    result = _new_buffers(_get_fields(queryset.model, fields))
+
+    for chunk in columns(queryset, fields, chunk_size):
+        for name, buffer in chunk.items():
+            result[name].extend(buffer)
+
+    return result
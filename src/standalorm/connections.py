@@ -0,0 +1,147 @@
+"""
+Helpers for managing the lifetime of database connections in scripts that don't have Django's request cycle.
+"""
+
+import time
+from contextlib import ContextDecorator
+
+import django
+from django.db import close_old_connections, connections
+
+
+def close_unusable_connections():
+    """
+    Closes every open connection on the current thread that is configured with ``CONN_HEALTH_CHECKS`` and fails
+    Django's liveness check, so the next query opens a fresh connection instead of failing. Connections inside a
+    transaction are left alone.
+
+    Django 4.1 and later do this check on their own, so this only does anything on older versions.
+    """
+    if django.VERSION >= (4, 1):
+        return
+
+    for connection in connections.all():
+        if (connection.connection is not None and connection.settings_dict.get("CONN_HEALTH_CHECKS")
+                and not connection.in_atomic_block and not connection.is_usable()):
+            connection.close()
+
+
+class ConnectionScope(ContextDecorator):
+    """
+    Marks the boundaries of a unit of work, the same way Django marks the start and end of a request.
+
+    On entry, connections that have gone bad are closed (see ``close_unusable_connections()``). On both entry and exit,
+    connections that have outlived their ``CONN_MAX_AGE`` or hit an unrecoverable error are closed. Connections that
+    are still within their ``CONN_MAX_AGE`` are kept open for the next unit of work.
+
+    Use it as a context manager around each iteration of a long-running loop::
+
+        while True:
+            with connection_scope():
+                process_next_job()
+
+    or as a decorator on the function that does the work::
+
+        @connection_scope()
+        def process_next_job():
+            ...
+    """
+
+    def __enter__(self):
+        close_unusable_connections()
+        close_old_connections()
+        return self
+
+    def __exit__(self, *exc_info):
+        close_old_connections()
+        return False
+
+
+def connection_scope() -> ConnectionScope:
+    """
+    Marks the boundaries of a unit of work. See ``ConnectionScope``.
+
+    :return: A ``ConnectionScope`` that can be used as a context manager or a decorator.
+    """
+    return ConnectionScope()
+
+
+def check_connections(orm_settings: dict, user_root: str, timeout: float = 10.0) -> dict:
+    """
+    Checks that every connection in orm-settings.toml is configured correctly and can reach its database. The
+    connections are checked in parallel, each on its own thread, and closed again afterwards.
+
+    Unlike ``orm_init()``, this doesn't stop at the first misconfigured connection, so it can be run before a batch of
+    jobs starts to catch every problem at once.
+
+    :param orm_settings: A dictionary of standalorm's settings.
+    :param user_root: The directory the user's script is being run from. SQLite paths are relative to it.
+    :param timeout: How many seconds each connection's readiness query may run for (PostgreSQL only).
+    :return: A dictionary mapping each connection's name to a dictionary with its engine, whether the check passed
+             ("ok"), how long connecting and the readiness query took in milliseconds ("connect_ms" and "query_ms"),
+             and what went wrong ("error"), if anything.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.conf import settings
+    from django.core.exceptions import ImproperlyConfigured
+    from django.db.utils import ConnectionHandler
+    from standalorm.databases import build_database
+    from standalorm.pragmas import install_pragma_hook
+    from standalorm.readonly import install_readonly_hook
+    from standalorm.warmup import run_readiness_query
+
+    # only connection-level settings are needed, and standalorm's own settings module would stop at the first
+    # connection it can't build
+    if not settings.configured:
+        settings.configure()
+
+    install_pragma_hook()
+    install_readonly_hook()
+
+    results = {}
+    databases = {}
+
+    for name, info in orm_settings["databases"].items():
+        results[name] = {"engine": info.get("ENGINE"), "ok": False, "connect_ms": None, "query_ms": None,
+                         "error": None}
+
+        try:
+            databases[name] = build_database(info, orm_settings, user_root, name)
+        except ImproperlyConfigured as error:
+            results[name]["error"] = str(error)
+            continue
+
+        results[name]["engine"] = databases[name].get("ENGINE")
+
+    # a handler of our own, so the checks don't touch Django's connections; it insists on a "default" alias
+    handler = ConnectionHandler({"default": {"ENGINE": "django.db.backends.dummy"}, **databases})
+
+    def check(name: str):
+        result = results[name]
+        wrapper = None
+
+        try:
+            # loading the backend fails if its database driver isn't installed
+            wrapper = handler[name]
+
+            start = time.perf_counter()
+            wrapper.ensure_connection()
+            result["connect_ms"] = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            run_readiness_query(wrapper, timeout)
+            result["query_ms"] = (time.perf_counter() - start) * 1000
+
+            result["ok"] = True
+        except Exception as error:
+            result["error"] = f"{type(error).__name__}: {str(error).strip()}"
+        finally:
+            if wrapper is not None:
+                wrapper.close()
+
+    if databases:
+        with ThreadPoolExecutor(max_workers=min(len(databases), 16)) as executor:
+            list(executor.map(check, databases))
+
+    return results
@@ -0,0 +1,325 @@
+"""
+Functions for turning the connections in orm-settings.toml into Django's DATABASES setting.
+"""
+
+import copy
+import os
+import tempfile
+from urllib.request import pathname2url
+
+from django.core.exceptions import ImproperlyConfigured
+from standalorm.pragmas import get_profile
+from standalorm.retry import get_policy
+
+ROLE_CHOICES = ("primary", "replica", "readonly", "none")
+
+# the pooled backend that replaces each engine when a connection has POOL settings
+POOLED_ENGINES = {
+    "django.db.backends.postgresql": "standalorm.backends.postgresql_pool",
+    "django.db.backends.postgresql_psycopg2": "standalorm.backends.postgresql_pool",
+    "django.db.backends.sqlite3": "standalorm.backends.sqlite3_pool",
+}
+
+# the values libpq accepts for the sslmode query parameter of a PostgreSQL URI
+SSL_MODES = ("disable", "allow", "prefer", "require", "verify-ca", "verify-full")
+
+# the spellings of "true" accepted in a URI's query parameters
+TRUE_VALUES = ("1", "true", "yes", "on")
+
+# query parameters of a URI that become keys of the connection's POOL settings
+POOL_PARAMETERS = {"pool_min_size": "min_size", "pool_max_size": "max_size", "pool_timeout": "timeout",
+                   "pool_max_idle": "max_idle"}
+
+# parsed URIs, keyed by environment variable and URI, so each one is only parsed and checked once per process
+_env_cache = {}
+
+
+def get_tmpfs_dir() -> str:
+    """
+    Gets a directory backed by memory rather than disk: /dev/shm where it exists, and the system's temporary directory
+    otherwise.
+
+    :return: A directory path.
+    """
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+def get_sqlite_name(db_info: dict, name: str, user_root: str) -> str:
+    """
+    Works out the NAME Django should open for an SQLite connection.
+
+    * ":memory:" is an in-memory database private to each thread's connection, or, if the connection has
+      ``SHARED = true``, one shared by every thread (a named shared-cache URI, so different connections don't share a
+      database by accident).
+    * URIs (names starting with "file:") are passed to SQLite as they are.
+    * Paths are relative to ``user_root``, or, if the connection has ``TMPFS = true``, to a memory-backed temporary
+      directory (see ``get_tmpfs_dir()``), which is faster for throwaway databases but doesn't survive a reboot.
+
+    :param db_info: The connection's settings.
+    :param name: The connection's name.
+    :param user_root: The directory the user's script is being run from.
+    :return: The database name.
+    """
+    db_name = db_info["NAME"]
+
+    if db_name == ":memory:":
+        return f"file:standalorm-{name}?mode=memory&cache=shared" if db_info.pop("SHARED", False) else db_name
+
+    if db_name.startswith("file:"):
+        return db_name
+
+    return os.path.join(get_tmpfs_dir() if db_info.pop("TMPFS", False) else user_root, db_name)
+
+
+def _get_number(options: dict, key: str, number_type, env_var: str):
+    """
+    Removes a query parameter from a parsed URI's OPTIONS and converts it to a number.
+    """
+    value = options.pop(key)
+
+    try:
+        number = number_type(value)
+    except ValueError:
+        raise ImproperlyConfigured(f"The '{key}' parameter of the URI in {env_var} must be a number, not '{value}'.")
+
+    if number < 0 and not (key == "conn_max_age" and number == -1):
+        raise ImproperlyConfigured(f"The '{key}' parameter of the URI in {env_var} can't be negative.")
+
+    return number
+
+
+def parse_env_uri(env_var: str, name: str = "default") -> dict:
+    """
+    Reads a connection URI from an environment variable (see ``standalorm db add --env``), checks it, and converts it
+    into database settings. Each URI is only parsed once per process.
+
+    Besides the parameters the database driver understands (which are passed through in OPTIONS), the URI's query
+    string can contain:
+
+    * ``sslmode``, ``sslrootcert``, ``sslcert`` and ``sslkey`` (PostgreSQL), which are checked before being passed on:
+      the mode has to be one libpq knows, and the files have to exist.
+    * ``ssl=true``, shorthand for ``sslmode=require`` on PostgreSQL.
+    * ``connect_timeout`` in seconds, and ``statement_timeout`` in milliseconds (PostgreSQL).
+    * ``conn_max_age`` (-1 for no limit) and ``conn_health_checks``, which become CONN_MAX_AGE and CONN_HEALTH_CHECKS.
+    * ``pool_min_size``, ``pool_max_size``, ``pool_timeout`` and ``pool_max_idle``, which become the POOL settings.
+
+    For example::
+
+        postgresql://app@db.internal/sales?sslmode=verify-full&connect_timeout=5&pool_max_size=20
+
+    :param env_var: The name of the environment variable.
+    :param name: The name of the connection, for error messages.
+    :return: A dictionary of database settings Django understands. ImproperlyConfigured is raised if the variable
+             isn't set or the URI in it is invalid.
+    """
+    uri = os.getenv(env_var, "").strip()
+
+    if not uri:
+        raise ImproperlyConfigured(f"The database connection '{name}' is configured by the environment variable "
+                                   f"{env_var}, which isn't set.")
+
+    if (env_var, uri) in _env_cache:
+        return copy.deepcopy(_env_cache[env_var, uri])
+
+    # only imported when it's needed, since it's otherwise dead weight at startup
+    import dj_database_url
+
+    try:
+        db_info = dj_database_url.parse(uri)
+    except KeyError as error:
+        raise ImproperlyConfigured(f"The URI in {env_var} has an unsupported scheme {error}. Supported schemes are "
+                                   f"{', '.join(sorted(dj_database_url.SCHEMES))}.")
+    except ValueError as error:
+        raise ImproperlyConfigured(f"The URI in {env_var} is invalid: {error}.")
+
+    engine = db_info["ENGINE"]
+    options = db_info.pop("OPTIONS", {})
+    is_postgresql = "postgresql" in engine or "postgis" in engine
+
+    if not db_info["NAME"]:
+        raise ImproperlyConfigured(f"The URI in {env_var} doesn't name a database.")
+
+    if "conn_max_age" in options:
+        db_info["CONN_MAX_AGE"] = _get_number(options, "conn_max_age", int, env_var)
+
+    if "conn_health_checks" in options:
+        db_info["CONN_HEALTH_CHECKS"] = options.pop("conn_health_checks").casefold() in TRUE_VALUES
+
+    pool = {setting: _get_number(options, key, float if key in ("pool_timeout", "pool_max_idle") else int, env_var)
+            for key, setting in POOL_PARAMETERS.items() if key in options}
+
+    if pool:
+        db_info["POOL"] = pool
+
+    if "connect_timeout" in options:
+        timeout = _get_number(options, "connect_timeout", int, env_var)
+        options["timeout" if engine == "django.db.backends.sqlite3" else "connect_timeout"] = timeout
+
+    if "statement_timeout" in options:
+        if not is_postgresql:
+            raise ImproperlyConfigured(f"The 'statement_timeout' parameter of the URI in {env_var} is only supported "
+                                       f"for PostgreSQL.")
+
+        timeout = _get_number(options, "statement_timeout", int, env_var)
+        options["options"] = f"{options.get('options', '')} -c statement_timeout={timeout}".strip()
+
+    if is_postgresql:
+        if options.pop("ssl", "false").casefold() in TRUE_VALUES:
+            options.setdefault("sslmode", "require")
+
+        if options.get("sslmode", "prefer") not in SSL_MODES:
+            raise ImproperlyConfigured(f"The URI in {env_var} has an invalid sslmode '{options['sslmode']}'. Valid "
+                                       f"modes are {', '.join(SSL_MODES)}.")
+
+        for key in ("sslrootcert", "sslcert", "sslkey"):
+            if key in options and not os.path.isfile(os.path.expanduser(options[key])):
+                raise ImproperlyConfigured(f"The {key} file given by the URI in {env_var} doesn't exist: "
+                                           f"{options[key]}")
+
+    db_info["OPTIONS"] = options
+    _env_cache[env_var, uri] = db_info
+
+    return copy.deepcopy(db_info)
+
+
+def make_readonly(db_info: dict) -> dict:
+    """
+    Adjusts a connection's settings for the "readonly" role, which is meant for reporting and analytics queries that
+    shouldn't hold write locks or slow down the connections that write. The database itself is asked to refuse writes
+    where it can, and ``standalorm.readonly`` rejects them before they're sent either way.
+
+    * SQLite databases are opened with ``mode=ro`` and ``PRAGMA query_only``. In-memory databases can't be opened
+      read-only, so they only get the PRAGMA. The journal mode is left as the file has it, since changing it is a
+      write.
+    * PostgreSQL sessions default to read-only, repeatable-read transactions, so every query in an ``atomic()`` block
+      sees the same snapshot of the data.
+    * ``STATEMENT_TIMEOUT`` (in milliseconds, if the connection has it) becomes PostgreSQL's statement_timeout. On
+      SQLite, queries that run for longer are interrupted (see ``standalorm.readonly``).
+
+    :param db_info: The connection's settings, after they've been converted into settings Django understands.
+    :return: The same dictionary, adjusted.
+    """
+    db_info["READONLY"] = True
+    engine = db_info.get("ENGINE", "")
+
+    if engine == "django.db.backends.sqlite3":
+        name = db_info["NAME"]
+
+        if "mode=memory" not in name and name != ":memory:":
+            if name.startswith("file:"):
+                db_info["NAME"] = name if "mode=" in name else f"{name}{'&' if '?' in name else '?'}mode=ro"
+            else:
+                db_info["NAME"] = f"file:{pathname2url(name)}?mode=ro"
+
+        pragmas = {key: value for key, value in db_info.get("PRAGMAS", {}).items() if key != "journal_mode"}
+        db_info["PRAGMAS"] = {**pragmas, "query_only": 1}
+    elif "postgresql" in engine or "postgis" in engine:
+        session_settings = ["default_transaction_read_only=on", "default_transaction_isolation=repeatable\\ read"]
+
+        if db_info.get("STATEMENT_TIMEOUT"):
+            session_settings.append(f"statement_timeout={int(db_info.pop('STATEMENT_TIMEOUT'))}")
+
+        options = db_info.setdefault("OPTIONS", {})
+        session_settings = " ".join(f"-c {setting}" for setting in session_settings)
+        options["options"] = f"{options.get('options', '')} {session_settings}".strip()
+
+    return db_info
+
+
+def build_database(info: dict, orm_settings: dict, user_root: str, name: str = "default") -> dict:
+    """
+    Converts a connection from orm-settings.toml into an entry for Django's DATABASES setting.
+
+    :param info: The connection's settings, as stored under [databases] in orm-settings.toml.
+    :param orm_settings: A dictionary of standalorm's settings.
+    :param user_root: The directory the user's script is being run from. SQLite paths are relative to it.
+    :param name: The connection's name.
+    :return: A dictionary of database settings Django understands.
+    """
+    db_info = copy.deepcopy(info)
+    role = db_info.pop("ROLE", None)
+
+    # ascertain filepath and PRAGMA profile for sqlite database if applicable
+    if db_info.get("ENGINE") == "django.db.backends.sqlite3":
+        db_info["NAME"] = get_sqlite_name(db_info, name, user_root)
+        db_info["PRAGMAS"] = get_profile(orm_settings, db_info.pop("PRAGMA_PROFILE", ""))
+
+    if db_info.get("USE_ENV", False):
+        env_info = parse_env_uri(db_info["ENV_VAR"], name)
+        env_info["OPTIONS"].update(db_info.get("OPTIONS", {}))
+
+        # settings in orm-settings.toml take precedence over the URI's, and the URI can't hold standalorm's own
+        for key in ("CONN_MAX_AGE", "CONN_HEALTH_CHECKS", "POOL", "READONLY", "STATEMENT_TIMEOUT"):
+            if key in db_info:
+                env_info[key] = db_info[key]
+
+        db_info = env_info
+
+    # resolve the connection's retry policy (see standalorm.retry), which Django passes through untouched
+    db_info["RETRY"] = get_policy(orm_settings, info.get("RETRY_POLICY", ""))
+    db_info.pop("RETRY_POLICY", None)
+
+    if role == "readonly":
+        make_readonly(db_info)
+
+    # draw connections from a client-side pool if the connection has POOL settings
+    if db_info.get("POOL") and db_info.get("ENGINE") in POOLED_ENGINES:
+        db_info["ENGINE"] = POOLED_ENGINES[db_info["ENGINE"]]
+
+    # TOML has no null, so -1 stands in for Django's "keep the connection open indefinitely" (None)
+    if db_info.get("CONN_MAX_AGE") == -1:
+        db_info["CONN_MAX_AGE"] = None
+
+    return db_info
+
+
+def get_roles(orm_settings: dict) -> dict:
+    """
+    Gets the connections that have been assigned a role (see ``standalorm db role``).
+
+    :param orm_settings: A dictionary of standalorm's settings.
+    :return: A dictionary mapping connection names to their roles ("primary", "replica" or "readonly").
+    """
+    return {name: info["ROLE"] for name, info in orm_settings["databases"].items()
+            if info.get("ROLE") in ("primary", "replica", "readonly")}
+
+
+def build_databases(orm_settings: dict, user_root: str) -> dict:
+    """
+    Builds Django's DATABASES setting. The current connection (see ``standalorm db switch``) is registered under the
+    "default" alias, and every other connection with a role is registered under its own name.
+
+    :param orm_settings: A dictionary of standalorm's settings.
+    :param user_root: The directory the user's script is being run from.
+    :return: A dictionary mapping connection aliases to database settings.
+    """
+    current = orm_settings["config"]["db_name"]
+    databases = {"default": build_database(orm_settings["databases"][current], orm_settings, user_root, current)}
+
+    for name in get_roles(orm_settings):
+        if name != current:
+            databases[name] = build_database(orm_settings["databases"][name], orm_settings, user_root, name)
+
+    return databases
+
+
+def build_router_settings(orm_settings: dict) -> dict:
+    """
+    Builds the settings ``standalorm.routers.PrimaryReplicaRouter`` reads from Django's STANDALORM_ROUTER setting.
+
+    Writes go to the connection with the "primary" role, or to the current connection if no connection has that role.
+    Reads are spread across the connections with the "replica" role.
+
+    :param orm_settings: A dictionary of standalorm's settings.
+    :return: A dictionary with the primary's alias, a list of replica aliases, and the read-your-writes window.
+    """
+    current = orm_settings["config"]["db_name"]
+    roles = get_roles(orm_settings)
+
+    primaries = [name for name, role in roles.items() if role == "primary" and name != current]
+
+    return {
+        "primary": primaries[0] if primaries else "default",
+        "replicas": [name for name, role in roles.items() if role == "replica" and name != current],
+        "sticky_seconds": orm_settings.get("router", {}).get("sticky_seconds", 0),
+    }
@@ -9,6 +9,7 @@ from getpass import getpass
 
 import click
 import django
+import standalorm.utils as utils
 from colorama import Fore
 from pathvalidate import is_valid_filepath
 
@@ -37,6 +38,78 @@ def env_config() -> dict:
     return db_info
 
 
+def persistence_config(keepalive_options: bool) -> dict:
+    """
+    Prompts for how long connections should be kept open for reuse and how they should be kept healthy.
+
+    :param keepalive_options: If True, also prompt for a connect timeout and TCP keepalive settings (PostgreSQL only).
+    :return: A dictionary of connection settings to merge into the connection's information.
+    """
+    print("\nHow many seconds should standalorm keep a connection open for reuse? Reusing connections skips the \n"
+          "network, TLS and authentication handshake on every unit of work. Enter 0 to close connections after \n"
+          "each unit of work or -1 to keep them open indefinitely.")
+
+    conn_max_age = click.prompt("> ", prompt_suffix="", type=int, default=0, show_default=False)
+
+    db_info = {"CONN_MAX_AGE": conn_max_age}
+
+    if conn_max_age != 0:
+        db_info["CONN_HEALTH_CHECKS"] = click.confirm(
+            "\nCheck that a connection is still alive before reusing it? (Recommended if the database server or \n"
+            "something between it and you drops idle connections.)", default=True, prompt_suffix="\n> ")
+
+    if keepalive_options:
+        print("\nHow many seconds should standalorm wait for a new connection before giving up? (Enter 0 to wait \n"
+              "indefinitely.)")
+
+        options = {"connect_timeout": click.prompt("> ", prompt_suffix="", type=int, default=10, show_default=False)}
+
+        if click.confirm("\nSend TCP keepalives so dropped connections are detected?", default=True,
+                         prompt_suffix="\n> "):
+            print("\nHow many seconds can a connection sit idle before the first keepalive is sent?")
+
+            options.update({
+                "keepalives": 1,
+                "keepalives_idle": click.prompt("> ", prompt_suffix="", type=int, default=60, show_default=False),
+                "keepalives_interval": 10,
+                "keepalives_count": 5,
+            })
+
+        db_info["OPTIONS"] = options
+
+    return db_info
+
+
+def readonly_config(statement_timeout: bool) -> dict:
+    """
+    Prompts for whether the connection is only for reading, e.g. for reports and analytics that shouldn't hold write
+    locks or compete with the connections that write.
+
+    :param statement_timeout: If True, also prompt for a statement timeout (PostgreSQL and SQLite only).
+    :return: A dictionary of connection settings to merge into the connection's information.
+    """
+    readonly = click.confirm("\nWill this connection only be used for reading (e.g. reports and analytics)? If so, \n"
+                             "standalorm will open it read-only, reject writes made through it, and give each \n"
+                             "transaction a consistent snapshot of the data. (You can change this later with \n"
+                             "'standalorm db role'.)", default=False, prompt_suffix="\n> ")
+
+    if not readonly:
+        return {}
+
+    db_info = {"ROLE": "readonly"}
+
+    if statement_timeout:
+        print("\nHow many milliseconds can a query on this connection run for before it's cancelled? (Enter 0 to let \n"
+              "queries run for as long as they take.)")
+
+        timeout = click.prompt("> ", prompt_suffix="", type=int, default=0, show_default=False)
+
+        if timeout > 0:
+            db_info["STATEMENT_TIMEOUT"] = timeout
+
+    return db_info
+
+
 def oracle(use_env: bool) -> dict:
     """
     Creates a new Oracle database connection.
@@ -72,6 +145,8 @@ def oracle(use_env: bool) -> dict:
             "threaded": threaded}
     })
 
+    db_info.update(persistence_config(keepalive_options=False))
+
     return db_info
 
 
@@ -108,6 +183,8 @@ def postgresql(use_env: bool) -> dict:
             "PORT": input("Port: "),
         }
 
+    db_info.update(persistence_config(keepalive_options=True))
+
     return db_info
 
 
@@ -146,11 +223,17 @@ def sqlite() -> dict:
 
     print(f"\nEnter the path to an SQLite3 (.sqlite3) database. The path must be relative to {user_root}.\n"
           f"If no SQLite3 database exists at this path, standalorm will create one for you the first time you "
-          f"apply migrations.\n")
+          f"apply migrations.\n"
+          f"\n"
+          f"Enter :memory: instead to keep the database in memory. In-memory databases are fast, but they're gone \n"
+          f"as soon as your script exits, so they're best for test suites and other throwaway jobs.\n")
 
     while True:
         path = input("> ")
 
+        if path == ":memory:":
+            break
+
         if not validate_filepath(path):  # validate filepath per OS requirements
             print("\nThat's not a valid filepath.")
             print("Enter the path to an SQLite3 database:")
@@ -171,6 +254,30 @@ def sqlite() -> dict:
         "NAME": path
     }
 
+    if path == ":memory:":
+        # a private in-memory database per thread, or one every thread shares
+        db_info["SHARED"] = click.confirm("\nShare the in-memory database between threads? (If you don't, each thread \n"
+                                          "gets its own empty database.)", default=True, prompt_suffix="\n> ")
+    else:
+        db_info["TMPFS"] = click.confirm(f"\nKeep the database file in memory-backed temporary storage (tmpfs) \n"
+                                         f"instead of {user_root}? It'll be faster, but it won't survive a \n"
+                                         f"reboot.", default=False, prompt_suffix="\n> ")
+
+    print("\nChoose a performance profile for this connection. The profile's PRAGMA settings (journal mode, \n"
+          "synchronous, memory map size, cache size, temp store and busy timeout) will be applied every time \n"
+          "standalorm opens the database. Profiles are defined under [pragma_profiles] in orm-settings.toml.\n"
+          "\n"
+          "* durable: WAL journaling and full fsync on commit. Safe for concurrent readers and writers.\n"
+          "* fast-bulk: WAL journaling with fsync disabled and a large cache. Best for bulk loads you can redo.\n"
+          "* read-mostly: WAL journaling with a large memory map. Best for many concurrent readers.\n"
+          "* none: leave SQLite's defaults alone.")
+
+    profiles = list(utils.get_settings().get("pragma_profiles", {}).keys())
+    profile = utils.selection_prompt("Choose a profile:", profiles + ["none"])
+
+    if profile != "none":
+        db_info["PRAGMA_PROFILE"] = profile
+
     return db_info
 
 
@@ -190,4 +297,8 @@ def make_new_db(database, use_env) -> dict:
     else:
         db_info = sqlite()
 
+    # a read-only in-memory database would always be empty
+    if db_info.get("NAME") != ":memory:":
+        db_info.update(readonly_config(statement_timeout=database != "oracle"))
+
     return db_info
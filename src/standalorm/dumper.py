@@ -0,0 +1,304 @@
+"""
+Streams the rows of a model's table out to CSV, JSONL or column files in constant memory.
+"""
+
+import array
+import csv
+import json
+import os
+import struct
+import sys
+import time
+
+import standalorm.utils as utils
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router
+
+FORMAT_CHOICES = ("csv", "jsonl", "columns")
+
+INTEGER_TYPES = {
+    "AutoField", "BigAutoField", "SmallAutoField", "IntegerField", "BigIntegerField", "SmallIntegerField",
+    "PositiveIntegerField", "PositiveSmallIntegerField", "PositiveBigIntegerField",
+}
+
+# column file encodings and the array typecodes they're written with
+ARRAY_TYPECODES = {"int64": "q", "float64": "d", "bool": "b"}
+
+# length prefix written in place of a text value's length when the value is NULL
+NULL_LENGTH = -1
+
+
+class CSVWriter:
+    """
+    Writes rows to a CSV file with a header row. NULL values are written as empty cells.
+    """
+
+    def __init__(self, path: str, columns: list, append: bool):
+        self.file = open(path, "a" if append else "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+
+        if not append:
+            self.writer.writerow(columns)
+
+    def write(self, rows: list):
+        self.writer.writerows(rows)
+
+    def offsets(self) -> dict:
+        self.file.flush()
+        return {"": self.file.tell()}
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+class JSONLWriter:
+    """
+    Writes rows to a JSON Lines file, one object per row.
+    """
+
+    def __init__(self, path: str, columns: list, append: bool):
+        self.file = open(path, "a" if append else "w", encoding="utf-8")
+        self.columns = columns
+
+    def write(self, rows: list):
+        for row in rows:
+            self.file.write(json.dumps(dict(zip(self.columns, row)), cls=DjangoJSONEncoder))
+            self.file.write("\n")
+
+    def offsets(self) -> dict:
+        self.file.flush()
+        return {"": self.file.tell()}
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+class ColumnWriter:
+    """
+    Writes each column to its own binary file inside a directory, along with a schema.json file describing them.
+
+    Non-nullable integer, float and boolean columns are written as packed arrays of int64, float64 or int8 values in
+    the machine's native byte order (recorded in schema.json). Every other column is written as a sequence of UTF-8
+    strings, each preceded by its length as a little-endian int32; NULL is written as a length of -1 with no string.
+    """
+
+    def __init__(self, path: str, columns: list, append: bool, encodings: list):
+        os.makedirs(path, exist_ok=True)
+
+        self.encodings = encodings
+        self.files = [open(os.path.join(path, f"{column}.col"), "ab" if append else "wb") for column in columns]
+
+        if not append:
+            schema = {
+                "byteorder": sys.byteorder,
+                "columns": [{"name": column, "encoding": encoding} for column, encoding in zip(columns, encodings)],
+            }
+
+            with open(os.path.join(path, "schema.json"), "w") as schema_file:
+                json.dump(schema, schema_file, indent=4)
+
+    def write(self, rows: list):
+        for index, (file, encoding) in enumerate(zip(self.files, self.encodings)):
+            if encoding in ARRAY_TYPECODES:
+                array.array(ARRAY_TYPECODES[encoding], (row[index] for row in rows)).tofile(file)
+            else:
+                chunks = []
+                for row in rows:
+                    value = row[index]
+                    if value is None:
+                        chunks.append(struct.pack("<i", NULL_LENGTH))
+                    else:
+                        encoded = str(value).encode()
+                        chunks.append(struct.pack("<i", len(encoded)))
+                        chunks.append(encoded)
+                file.write(b"".join(chunks))
+
+    def offsets(self) -> dict:
+        for file in self.files:
+            file.flush()
+        return {os.path.basename(file.name): file.tell() for file in self.files}
+
+    def sync(self):
+        for file in self.files:
+            file.flush()
+            os.fsync(file.fileno())
+
+    def close(self):
+        for file in self.files:
+            file.close()
+
+
+def get_column_encoding(field) -> str:
+    """
+    Decides how a field's values are encoded in the "columns" format.
+
+    :param field: A concrete model field.
+    :return: "int64", "float64", "bool" or "text".
+    """
+    internal_type = field.get_internal_type()
+
+    if field.is_relation:
+        internal_type = field.target_field.get_internal_type()
+
+    if field.null:
+        return "text"
+    if internal_type in INTEGER_TYPES:
+        return "int64"
+    if internal_type == "FloatField":
+        return "float64"
+    if internal_type == "BooleanField":
+        return "bool"
+
+    return "text"
+
+
+def _state_path(path: str) -> str:
+    return f"{path.rstrip(os.sep)}.state"
+
+
+def _read_state(path: str):
+    """
+    Reads the resume state of an interrupted dump.
+
+    :param path: The dump's output path.
+    :return: A dictionary describing how far the dump got, or None if there's nothing to resume.
+    """
+    try:
+        with open(_state_path(path)) as state_file:
+            return json.load(state_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _truncate(path: str, file_format: str, offsets: dict):
+    """
+    Cuts output files back to the offsets recorded in the resume state, discarding anything written after the last
+    completed page.
+    """
+    for name, offset in offsets.items():
+        file_path = os.path.join(path, name) if file_format == "columns" else path
+
+        with open(file_path, "r+b") as file:
+            file.truncate(offset)
+
+
+def dump(model, path: str, file_format: str = "csv", fields: list = None, chunk_size: int = 2000,
+         page_size: int = 100000, resume: bool = False, using: str = None, progress=None) -> int:
+    """
+    Exports a model's rows to a file (or, for the "columns" format, a directory) without loading the table into memory.
+
+    Rows are read in primary key order, one page of ``page_size`` rows at a time, using keyset pagination
+    (``WHERE pk > last_pk``). Each page is streamed with ``.iterator(chunk_size=...)``, which uses a named server-side
+    cursor on PostgreSQL. After every page, the output is flushed to disk and the last primary key written is recorded
+    in a ``.state`` file next to the output, so an interrupted dump can pick up where it left off with
+    ``resume=True``. The state file is deleted once the dump completes.
+
+    :param model: A model class, or the name of a model as accepted by ``standalorm.utils.get_model()``.
+    :param path: The output path.
+    :param file_format: "csv", "jsonl" or "columns" (see ``ColumnWriter``).
+    :param fields: The names of the fields to export. Defaults to all concrete fields. The primary key is always
+                   exported.
+    :param chunk_size: The number of rows fetched from the database at a time.
+    :param page_size: The number of rows per keyset page (and between resume checkpoints).
+    :param resume: If True and an interrupted dump to ``path`` can be resumed, continue it instead of starting over.
+    :param using: The alias of the database connection to use. Defaults to the one Django's routers pick for reads.
+    :param progress: An optional function called after each page with the number of rows written so far and the
+                     number of seconds elapsed.
+    :return: The total number of rows in the output.
+    """
+    if file_format not in FORMAT_CHOICES:
+        raise ValueError(f"file_format must be one of {', '.join(FORMAT_CHOICES)}, not {file_format!r}.")
+
+    if isinstance(model, str):
+        model = utils.get_model(model)
+
+    opts = model._meta
+    using = using or router.db_for_read(model)
+
+    export_fields = [opts.get_field(name) for name in fields] if fields else list(opts.concrete_fields)
+    if opts.pk not in export_fields:
+        export_fields.insert(0, opts.pk)
+
+    columns = [field.attname for field in export_fields]
+    pk_index = export_fields.index(opts.pk)
+
+    state = _read_state(path) if resume else None
+
+    if state is not None and (state["format"] != file_format or state["columns"] != columns):
+        raise ValueError("The interrupted dump was started with a different format or different fields.")
+
+    if state is not None:
+        _truncate(path, file_format, state["offsets"])
+        last_pk = opts.pk.to_python(state["last_pk"])
+        written = state["rows"]
+    else:
+        last_pk = None
+        written = 0
+
+    append = state is not None
+
+    if file_format == "columns":
+        writer = ColumnWriter(path, columns, append, [get_column_encoding(field) for field in export_fields])
+    elif file_format == "jsonl":
+        writer = JSONLWriter(path, columns, append)
+    else:
+        writer = CSVWriter(path, columns, append)
+
+    queryset = model._default_manager.using(using).order_by("pk").values_list(*columns)
+    start = time.perf_counter()
+
+    try:
+        while True:
+            page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            page_rows = 0
+            chunk = []
+
+            for row in page[:page_size].iterator(chunk_size=chunk_size):
+                chunk.append(row)
+
+                if len(chunk) >= chunk_size:
+                    writer.write(chunk)
+                    page_rows += len(chunk)
+                    last_pk = chunk[-1][pk_index]
+                    chunk = []
+
+            if chunk:
+                writer.write(chunk)
+                page_rows += len(chunk)
+                last_pk = chunk[-1][pk_index]
+
+            if not page_rows:
+                break
+
+            written += page_rows
+            writer.sync()
+
+            state = {
+                "format": file_format,
+                "columns": columns,
+                "last_pk": opts.pk.get_prep_value(last_pk),
+                "rows": written,
+                "offsets": writer.offsets(),
+            }
+            utils.atomic_write(_state_path(path), json.dumps(state, cls=DjangoJSONEncoder).encode())
+
+            if progress is not None:
+                progress(written, time.perf_counter() - start)
+
+            if page_rows < page_size:
+                break
+    finally:
+        writer.close()
+
+    if os.path.exists(_state_path(path)):
+        os.remove(_state_path(path))
+
+    return written
@@ -0,0 +1,242 @@
+"""
+Query instrumentation for scripts that run outside Django's request cycle: per-statement timing, row counts, call
+sites, N+1 query detection, and a slow query log.
+"""
+
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+import django
+from django.db.backends.signals import connection_created
+
+# upper bounds (in milliseconds) of the latency histogram's buckets; the last bucket catches everything slower
+HISTOGRAM_BOUNDS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# frames from these directories are skipped when working out which line of the user's code ran a query
+_internal_dirs = (os.path.dirname(django.__file__), os.path.dirname(__file__))
+
+_in_list = re.compile(r"\((?:%s, )+%s\)")
+_whitespace = re.compile(r"\s+")
+
+slow_query_logger = logging.getLogger("standalorm.slow_queries")
+
+_instrument = None
+
+
+def get_sql_shape(sql: str) -> str:
+    """
+    Normalizes a SQL statement so statements that only differ in their parameters (including the number of parameters
+    in an IN list) have the same shape.
+
+    :param sql: A SQL statement with parameter placeholders, as passed to ``cursor.execute()``.
+    :return: The statement's shape.
+    """
+    return _in_list.sub("(%s, ...)", _whitespace.sub(" ", sql.strip()))
+
+
+def get_call_site() -> str:
+    """
+    Finds the line of the user's code that caused the current query to run.
+
+    :return: A string of the form "path/to/file.py:42 in function_name", or "<unknown>" if every frame on the stack
+             belongs to Django or standalorm.
+    """
+    frame = sys._getframe(1)
+
+    while frame is not None:
+        filename = frame.f_code.co_filename
+
+        if not filename.startswith(_internal_dirs) and not filename.startswith("<frozen"):
+            return f"{filename}:{frame.f_lineno} in {frame.f_code.co_name}"
+
+        frame = frame.f_back
+
+    return "<unknown>"
+
+
+class QueryInstrument:
+    """
+    A Django execute wrapper that records statistics about every statement run through the connections it's installed
+    on. Statements are grouped by shape (see ``get_sql_shape()``).
+
+    :param slow_query_ms: Statements that take at least this many milliseconds are written to the slow query log.
+    :param n_plus_one_threshold: A SELECT shape run this many times from the same line of code is reported as a likely
+                                 N+1 query.
+    """
+
+    def __init__(self, slow_query_ms: float = 100, n_plus_one_threshold: int = 10):
+        self.slow_query_ms = slow_query_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Discards everything recorded so far.
+        """
+        with self._lock:
+            self._shapes = {}
+            self._site_counts = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            rowcount = getattr(context["cursor"], "rowcount", -1)
+            self.record(context["connection"].alias, sql, params, elapsed_ms, rowcount)
+
+    def record(self, alias: str, sql: str, params, elapsed_ms: float, rowcount: int):
+        """
+        Records one executed statement.
+
+        :param alias: The alias of the connection the statement ran on.
+        :param sql: The statement.
+        :param params: The statement's parameters.
+        :param elapsed_ms: How long the statement took, in milliseconds.
+        :param rowcount: The cursor's rowcount after the statement ran (-1 if the driver doesn't know it).
+        """
+        shape = get_sql_shape(sql)
+        site = get_call_site()
+
+        with self._lock:
+            stats = self._shapes.get(shape)
+
+            if stats is None:
+                stats = self._shapes[shape] = {
+                    "count": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0,
+                    "histogram": [0] * (len(HISTOGRAM_BOUNDS) + 1), "call_sites": Counter(), "aliases": Counter(),
+                }
+
+            stats["count"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            stats["rows"] += max(rowcount, 0)
+            stats["histogram"][bisect_left(HISTOGRAM_BOUNDS, elapsed_ms)] += 1
+            stats["call_sites"][site] += 1
+            stats["aliases"][alias] += 1
+
+            if shape.startswith("SELECT"):
+                self._site_counts[shape, site] += 1
+
+        if elapsed_ms >= self.slow_query_ms:
+            slow_query_logger.warning("%.1f ms [%s] %s params=%r at %s", elapsed_ms, alias, sql, params, site)
+
+    def stats(self) -> dict:
+        """
+        Gets the statistics recorded so far.
+
+        :return: A dictionary mapping each statement shape to a dictionary of its execution count, total, mean and
+                 maximum latency in milliseconds, total rows reported by the driver, latency histogram (a list of
+                 counts per bucket; see ``HISTOGRAM_BOUNDS``), and counts per call site and connection alias.
+        """
+        with self._lock:
+            return {
+                shape: {
+                    **stats,
+                    "mean_ms": stats["total_ms"] / stats["count"],
+                    "histogram": list(stats["histogram"]),
+                    "call_sites": dict(stats["call_sites"]),
+                    "aliases": dict(stats["aliases"]),
+                }
+                for shape, stats in self._shapes.items()
+            }
+
+    def n_plus_one(self) -> list:
+        """
+        Gets the likely N+1 queries recorded so far: SELECT shapes run at least ``n_plus_one_threshold`` times from the
+        same line of code, which almost always means a query inside a loop.
+
+        :return: A list of dictionaries with each query's shape, call site, and count, most repeated first.
+        """
+        with self._lock:
+            return [
+                {"shape": shape, "call_site": site, "count": count}
+                for (shape, site), count in self._site_counts.most_common()
+                if count >= self.n_plus_one_threshold
+            ]
+
+
+def _add_wrapper(sender, connection, **kwargs):
+    """
+    Receiver for Django's ``connection_created`` signal. Installs the instrument on every new connection.
+    """
+    if _instrument is not None and _instrument not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_instrument)
+
+
+def install_instrumentation(orm_settings: dict, user_root: str) -> QueryInstrument:
+    """
+    Starts recording every statement run through Django's database connections. Settings are read from the
+    [instrumentation] table of orm-settings.toml: ``slow_query_ms``, ``slow_query_log`` (a path relative to
+    ``user_root``; leave it out to disable the log file) and ``n_plus_one_threshold``.
+
+    :param orm_settings: A dictionary of standalorm's settings.
+    :param user_root: The directory the user's script is being run from.
+    :return: The installed instrument.
+    """
+    global _instrument
+
+    config = orm_settings.get("instrumentation", {})
+
+    if _instrument is None:
+        _instrument = QueryInstrument(config.get("slow_query_ms", 100), config.get("n_plus_one_threshold", 10))
+
+        if config.get("slow_query_log"):
+            handler = logging.FileHandler(os.path.join(user_root, config["slow_query_log"]))
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            slow_query_logger.addHandler(handler)
+            slow_query_logger.setLevel(logging.WARNING)
+
+    connection_created.connect(_add_wrapper, dispatch_uid="standalorm.instrumentation")
+
+    return _instrument
+
+
+def get_instrument():
+    """
+    Gets the instrument installed by ``orm_init(__file__, instrument=True)``.
+
+    :return: A ``QueryInstrument``, or None if instrumentation isn't enabled.
+    """
+    return _instrument
+
+
+def query_stats() -> dict:
+    """
+    Gets the statistics recorded by the installed instrument. See ``QueryInstrument.stats()``.
+
+    :return: A dictionary of statistics per statement shape (empty if instrumentation isn't enabled).
+    """
+    return _instrument.stats() if _instrument is not None else {}
+
+
+def report(top: int = 10) -> str:
+    """
+    Formats a human-readable summary of the hottest statements and likely N+1 queries.
+
+    :param top: How many statement shapes to include, ordered by total time.
+    :return: The report.
+    """
+    if _instrument is None:
+        return "Query instrumentation is not enabled. Call orm_init(__file__, instrument=True)."
+
+    stats = sorted(_instrument.stats().items(), key=lambda item: item[1]["total_ms"], reverse=True)
+    lines = [f"{'total ms':>10} {'count':>7} {'mean ms':>9} {'max ms':>9}  statement"]
+
+    for shape, shape_stats in stats[:top]:
+        lines.append(f"{shape_stats['total_ms']:>10.1f} {shape_stats['count']:>7} {shape_stats['mean_ms']:>9.2f} "
+                     f"{shape_stats['max_ms']:>9.2f}  {shape}")
+
+    for pattern in _instrument.n_plus_one():
+        lines.append(f"\nLikely N+1 query ({pattern['count']} times at {pattern['call_site']}):\n  {pattern['shape']}")
+
+    return "\n".join(lines)
@@ -0,0 +1,362 @@
+"""
+Streams rows from CSV and JSONL files into models in bulk.
+"""
+
+import csv
+import io
+import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+from itertools import islice
+
+import standalorm.utils as utils
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
+from standalorm.pragmas import apply_pragmas, get_profile
+
+CONFLICT_CHOICES = ("error", "ignore", "update")
+
+# field types whose database values can be written to PostgreSQL's COPY text format with str()
+COPY_FIELD_TYPES = {
+    "AutoField", "BigAutoField", "SmallAutoField", "IntegerField", "BigIntegerField", "SmallIntegerField",
+    "PositiveIntegerField", "PositiveSmallIntegerField", "PositiveBigIntegerField", "FloatField", "DecimalField",
+    "CharField", "TextField", "SlugField", "EmailField", "URLField", "BooleanField", "NullBooleanField", "DateField",
+    "DateTimeField", "TimeField", "UUIDField", "ForeignKey", "OneToOneField",
+}
+
+
+def read_rows(path: str, file_format: str = None):
+    """
+    Lazily reads rows from a CSV or JSONL file. Only one row is held in memory at a time.
+
+    :param path: The path to the file.
+    :param file_format: "csv" or "jsonl". If omitted, the format is inferred from the file's extension.
+    :return: A generator of dictionaries mapping column names to values.
+    """
+    if file_format is None:
+        file_format = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}.get(os.path.splitext(path)[1].lower())
+
+    if file_format == "csv":
+        with open(path, newline="", encoding="utf-8") as file:
+            yield from csv.DictReader(file)
+    elif file_format == "jsonl":
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        raise ValueError(f"Can't tell what format {path} is in. Use a .csv or .jsonl file or specify the format.")
+
+
+def batched(iterable, size: int):
+    """
+    Splits an iterable into lists of at most ``size`` items without reading it all into memory.
+
+    :param iterable: Any iterable.
+    :param size: The maximum number of items per batch.
+    :return: A generator of lists.
+    """
+    iterator = iter(iterable)
+
+    while True:
+        batch = list(islice(iterator, size))
+
+        if not batch:
+            return
+
+        yield batch
+
+
+def _make_converter(field):
+    """
+    Creates a function that converts a raw value read from a file into the Python value ``field`` expects.
+
+    :param field: A concrete model field.
+    :return: A function taking a raw value and returning the converted value.
+    """
+    to_python = field.to_python
+
+    # CSV files can't represent None, so an empty cell means None wherever the field allows it
+    empty_means_none = field.null or not field.empty_strings_allowed
+
+    def convert(value):
+        if value is None or (value == "" and empty_means_none):
+            return None
+        return to_python(value)
+
+    return convert
+
+
+@lru_cache(maxsize=None)
+def get_field_converters(model) -> dict:
+    """
+    Gets the converters used to turn a file's columns into field values for a model. The result is cached per model,
+    so the fields are only inspected once.
+
+    :param model: A model class.
+    :return: A dictionary mapping column names (each field's name, attribute name and database column name) to tuples
+             of the field's attribute name and a converter function.
+    """
+    converters = {}
+
+    for field in model._meta.concrete_fields:
+        converter = (field.attname, _make_converter(field))
+
+        for column in (field.name, field.attname, field.column):
+            converters[column] = converter
+
+    return converters
+
+
+def convert_rows(model, rows, with_fields: bool = False):
+    """
+    Converts rows read from a file into unsaved model instances. Columns that don't match a field are ignored.
+
+    :param model: A model class.
+    :param rows: An iterable of dictionaries mapping column names to raw values.
+    :param with_fields: If True, each instance is paired with the attribute names of the fields its row had a value
+                        for (see ``load_objects()``).
+    :return: A generator of model instances, or of (instance, attribute names) tuples if ``with_fields`` is True.
+    """
+    converters = get_field_converters(model)
+
+    for number, row in enumerate(rows, 1):
+        values = {}
+
+        for column, value in row.items():
+            if column in converters:
+                attname, convert = converters[column]
+
+                try:
+                    values[attname] = convert(value)
+                except ValidationError as error:
+                    raise ValueError(f"Row {number} has an invalid value for {column}: {' '.join(error.messages)}")
+
+        obj = model(**values)
+
+        yield (obj, frozenset(values)) if with_fields else obj
+
+
+@contextmanager
+def sqlite_bulk_profile(connection):
+    """
+    Temporarily applies the "fast-bulk" PRAGMA profile from orm-settings.toml to an SQLite connection, then restores
+    the connection's previous settings. The journal mode is left alone, since changing it needs exclusive access to the
+    database.
+
+    :param connection: A Django SQLite database connection.
+    """
+    pragmas = get_profile(utils.get_settings(), "fast-bulk")
+    pragmas.pop("journal_mode", None)
+
+    with connection.cursor() as cursor:
+        previous = {}
+        for name in pragmas:
+            cursor.execute(f"PRAGMA {name}")
+            previous[name] = cursor.fetchone()[0]
+
+    apply_pragmas(connection, pragmas)
+
+    try:
+        yield
+    finally:
+        apply_pragmas(connection, previous)
+
+
+def _copy_value(value) -> str:
+    """
+    Formats a value for PostgreSQL's COPY text format.
+
+    :param value: A database value.
+    :return: The formatted value.
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def can_copy(model, connection) -> bool:
+    """
+    Checks whether instances of a model can be inserted using PostgreSQL's COPY instead of INSERT.
+
+    :param model: A model class.
+    :param connection: A Django database connection.
+    :return: True if the connection is a PostgreSQL connection whose driver supports ``copy_expert()`` (psycopg2) and
+             every field of the model has a type COPY can handle.
+    """
+    if connection.vendor != "postgresql":
+        return False
+
+    with connection.cursor() as cursor:
+        if not hasattr(cursor.cursor, "copy_expert"):
+            return False
+
+    return all(field.get_internal_type() in COPY_FIELD_TYPES for field in model._meta.concrete_fields)
+
+
+def copy_insert(model, objs: list, connection):
+    """
+    Inserts model instances using PostgreSQL's ``COPY ... FROM STDIN``. Like ``bulk_create()``, this doesn't call
+    ``save()`` or send any signals.
+
+    :param model: A model class.
+    :param objs: A list of unsaved instances of ``model``.
+    :param connection: A Django PostgreSQL database connection.
+    """
+    opts = model._meta
+    fields = [field for field in opts.concrete_fields
+              if not (field.primary_key and getattr(objs[0], field.attname) is None)]
+
+    buffer = io.StringIO()
+
+    for obj in objs:
+        values = (field.get_db_prep_save(field.pre_save(obj, True), connection) for field in fields)
+        buffer.write("\t".join(_copy_value(value) for value in values))
+        buffer.write("\n")
+
+    buffer.seek(0)
+
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(field.column) for field in fields)
+
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {quote(opts.db_table)} ({columns}) FROM STDIN", buffer)
+
+
+def _upsert(model, entries: list, key: str, using: str, batch_size: int):
+    """
+    Updates the instances in ``entries`` whose key already exists in the database and creates the rest. When several
+    instances share a key, the last one wins.
+
+    :param model: A model class.
+    :param entries: A list of (unsaved instance of ``model``, attribute names of the fields to update or None for
+                    every field) tuples.
+    :param key: The name of the field that identifies existing rows.
+    :param using: The alias of the database connection to use.
+    :param batch_size: The number of rows per statement.
+    """
+    key_attname = model._meta.get_field(key).attname
+    all_fields = frozenset(field.attname for field in model._meta.concrete_fields if not field.primary_key)
+
+    # instances without a key can't match anything, so they're all created
+    by_key = {}
+    keyless = []
+
+    for obj, fields in entries:
+        value = getattr(obj, key_attname)
+
+        if value is None:
+            keyless.append(obj)
+        else:
+            by_key.pop(value, None)
+            by_key[value] = (obj, fields)
+
+    existing = dict(model._default_manager.using(using).filter(**{f"{key}__in": list(by_key)})
+                    .values_list(key, "pk"))
+
+    groups = {}
+    to_create = keyless
+
+    for value, (obj, fields) in by_key.items():
+        pk = existing.get(value)
+
+        if pk is None:
+            to_create.append(obj)
+        else:
+            obj.pk = pk
+
+            # only the fields the row had a value for are written, so the rest of the existing row is left alone
+            fields = all_fields if fields is None else all_fields & fields
+            groups.setdefault(fields - {key_attname}, []).append(obj)
+
+    for fields, objs in groups.items():
+        if fields:
+            names = [field.name for field in model._meta.concrete_fields if field.attname in fields]
+            model._default_manager.using(using).bulk_update(objs, names, batch_size=batch_size)
+
+    if to_create:
+        model._default_manager.using(using).bulk_create(to_create, batch_size=batch_size)
+
+
+def load_objects(model, objs, batch_size: int = 1000, transaction_size: int = 10000, conflict: str = "error",
+                 key: str = None, using: str = None, progress=None) -> int:
+    """
+    Inserts model instances in bulk. Instances are inserted ``batch_size`` at a time and committed every
+    ``transaction_size`` instances, so memory use stays flat no matter how many instances there are.
+
+    On SQLite, the "fast-bulk" PRAGMA profile is applied for the duration of the load. On PostgreSQL, ``COPY`` is
+    used instead of ``INSERT`` when ``conflict`` is "error" and psycopg2 is installed.
+
+    :param model: A model class.
+    :param objs: An iterable of unsaved instances of ``model``. Each item can also be an (instance, attribute names)
+                 tuple, in which case only those fields are written when the instance updates an existing row.
+    :param batch_size: The number of rows per INSERT statement.
+    :param transaction_size: The number of rows per transaction.
+    :param conflict: What to do with rows that conflict with existing rows: "error" raises an IntegrityError,
+                     "ignore" skips them, and "update" updates the existing rows instead (a row that appears more than
+                     once in a transaction is only written once, with its last values).
+    :param key: The name of the field used to match rows to existing rows when ``conflict`` is "update". Defaults to
+                the primary key.
+    :param using: The alias of the database connection to use. Defaults to the one Django's routers pick for writes.
+    :param progress: An optional function called after each transaction with the number of rows loaded so far and the
+                     number of seconds elapsed.
+    :return: The number of rows loaded (including rows skipped because of ``conflict="ignore"``).
+    """
+    if conflict not in CONFLICT_CHOICES:
+        raise ValueError(f"conflict must be one of {', '.join(CONFLICT_CHOICES)}, not {conflict!r}.")
+
+    using = using or router.db_for_write(model)
+    connection = connections[using]
+    manager = model._default_manager.using(using)
+    key = key or model._meta.pk.name
+    use_copy = conflict == "error" and can_copy(model, connection)
+
+    loaded = 0
+    start = time.perf_counter()
+
+    bulk_profile = sqlite_bulk_profile(connection) if connection.vendor == "sqlite" else nullcontext()
+
+    with bulk_profile:
+        for chunk in batched(objs, transaction_size):
+            entries = [item if isinstance(item, tuple) else (item, None) for item in chunk]
+            chunk = [obj for obj, _ in entries]
+
+            with transaction.atomic(using=using):
+                if use_copy:
+                    for batch in batched(chunk, batch_size):
+                        copy_insert(model, batch, connection)
+                elif conflict == "update":
+                    _upsert(model, entries, key, using, batch_size)
+                else:
+                    manager.bulk_create(chunk, batch_size=batch_size, ignore_conflicts=conflict == "ignore")
+
+            loaded += len(chunk)
+
+            if progress is not None:
+                progress(loaded, time.perf_counter() - start)
+
+    return loaded
+
+
+def load(model, path: str, file_format: str = None, **kwargs) -> int:
+    """
+    Streams a CSV or JSONL file into a model. Each row becomes one instance of the model; columns are matched to
+    fields by name, attribute name (e.g. "author_id") or database column name, and columns that don't match a field
+    are ignored. With ``conflict="update"``, existing rows only have the fields the file has values for updated.
+
+    :param model: A model class, or the name of a model as accepted by ``standalorm.utils.get_model()``.
+    :param path: The path to the file.
+    :param file_format: "csv" or "jsonl". If omitted, the format is inferred from the file's extension.
+    :param kwargs: Passed on to ``load_objects()``.
+    :return: The number of rows loaded.
+    """
+    if isinstance(model, str):
+        model = utils.get_model(model)
+
+    return load_objects(model, convert_rows(model, read_rows(path, file_format), with_fields=True), **kwargs)
@@ -5,5 +5,8 @@ import sys
 if __name__ == "__main__":
     os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
     from django.core.management import execute_from_command_line
+    from standalorm.pragmas import install_pragma_hook
+
+    install_pragma_hook()
 
     execute_from_command_line(sys.argv)
@@ -0,0 +1,195 @@
+"""
+Functions for checking whether an app has unapplied migrations without loading its full migration graph, and for
+snapshotting the graph so even that check doesn't have to guess.
+"""
+
+import hashlib
+import os
+import pickle
+import pkgutil
+
+import django
+import standalorm.utils as utils
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+
+# the snapshot's file name inside an app's migrations directory
+SNAPSHOT_FILENAME = ".standalorm-snapshot.pickle"
+
+
+def get_migration_names(migrations_dir: str) -> set:
+    """
+    Gets the names of the migration modules in a migrations directory, using the same rules Django's migration loader
+    uses to discover them (modules starting with "_" or "~" are skipped). The modules themselves aren't imported.
+
+    :param migrations_dir: The path to an app's migrations directory.
+    :return: A set of migration names. The set is empty if the directory doesn't exist.
+    """
+    if not os.path.isdir(migrations_dir):
+        return set()
+
+    return {
+        name for _, name, is_pkg in pkgutil.iter_modules([migrations_dir])
+        if not is_pkg and name[0] not in "_~"
+    }
+
+
+def get_migrations_hash(migrations_dir: str) -> str:
+    """
+    Hashes the names and contents of every migration module in a migrations directory (plus its __init__.py), so
+    adding, removing, renaming or editing a migration changes the hash.
+
+    :param migrations_dir: The path to an app's migrations directory.
+    :return: A hex digest.
+    """
+    digest = hashlib.sha256(django.get_version().encode())
+
+    for name in sorted(get_migration_names(migrations_dir) | {"__init__"}):
+        path = os.path.join(migrations_dir, f"{name}.py")
+
+        if os.path.exists(path):
+            digest.update(name.encode() + b"\0")
+
+            with open(path, "rb") as module:
+                digest.update(module.read())
+
+    return digest.hexdigest()
+
+
+def write_snapshot(app_name: str, migrations_dir: str) -> dict:
+    """
+    Loads an app's migration graph once and saves what later runs need from it to the app's migrations directory: the
+    app's migrations in the order they apply, with the migrations each squashed migration replaces.
+
+    :param app_name: The name of the Django app.
+    :param migrations_dir: The path to the app's migrations directory.
+    :return: The snapshot.
+    """
+    from django.db.migrations.loader import MigrationLoader
+
+    # loaded without a connection, so squashed migrations always stand in for the migrations they replace
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+
+    leaves = [key for key in loader.graph.leaf_nodes() if key[0] == app_name]
+    plan = []
+
+    for leaf in leaves:
+        plan.extend(key for key in loader.graph.forwards_plan(leaf) if key[0] == app_name and key not in plan)
+
+    snapshot = {
+        "hash": get_migrations_hash(migrations_dir),
+        "app": app_name,
+        "plan": [name for _, name in plan],
+        "replaces": {key[1]: [name for _, name in loader.graph.nodes[key].replaces]
+                     for key in plan if loader.graph.nodes[key].replaces},
+    }
+
+    utils.atomic_write(os.path.join(migrations_dir, SNAPSHOT_FILENAME),
+                       pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL))
+
+    return snapshot
+
+
+def read_snapshot(app_name: str, migrations_dir: str):
+    """
+    Reads an app's migration snapshot (see ``write_snapshot()``).
+
+    :param app_name: The name of the Django app.
+    :param migrations_dir: The path to the app's migrations directory.
+    :return: The snapshot, or None if there isn't one or the migration files have changed since it was taken.
+    """
+    try:
+        with open(os.path.join(migrations_dir, SNAPSHOT_FILENAME), "rb") as snapshot_file:
+            snapshot = pickle.load(snapshot_file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError, TypeError):
+        return None
+
+    if snapshot.get("app") != app_name or snapshot.get("hash") != get_migrations_hash(migrations_dir):
+        return None
+
+    return snapshot
+
+
+def remove_snapshot(migrations_dir: str) -> bool:
+    """
+    Deletes an app's migration snapshot.
+
+    :param migrations_dir: The path to the app's migrations directory.
+    :return: True if there was a snapshot to delete.
+    """
+    try:
+        os.remove(os.path.join(migrations_dir, SNAPSHOT_FILENAME))
+    except FileNotFoundError:
+        return False
+
+    return True
+
+
+def get_applied_migrations(app_name: str, using: str = "default") -> set:
+    """
+    Reads the names of an app's applied migrations from the database's migration recorder table.
+
+    :param app_name: The name of the Django app.
+    :param using: The alias of the database connection to check.
+    :return: A set of migration names. The set is empty if the recorder table doesn't exist yet.
+    """
+    recorder = MigrationRecorder(connections[using])
+
+    if not recorder.has_table():
+        return set()
+
+    return {name for app, name in recorder.applied_migrations() if app == app_name}
+
+
+def get_unrecorded_migrations(app_name: str, migrations_dir: str, using: str = "default") -> list:
+    """
+    Compares the migration files on disk against the rows in the database's migration recorder table.
+
+    This is a quick check, not an exact one: a squashed migration whose replaced migrations have all been applied can
+    show up as unrecorded. ``get_pending_migrations()`` uses it to skip loading the migration graph in the common case
+    where everything has already been applied.
+
+    :param app_name: The name of the Django app.
+    :param migrations_dir: The path to the app's migrations directory.
+    :param using: The alias of the database connection to check.
+    :return: A sorted list of migration names that don't appear in the recorder table.
+    """
+    on_disk = get_migration_names(migrations_dir)
+
+    if not on_disk:
+        return []
+
+    return sorted(on_disk - get_applied_migrations(app_name, using))
+
+
+def get_pending_migrations(app_name: str, migrations_dir: str, using: str = "default") -> list:
+    """
+    Gets the migrations that ``migrate`` would apply for an app. If the app has an up-to-date snapshot (see
+    ``write_snapshot()``), the answer comes from the snapshot and the recorder table alone. Otherwise, the migration
+    graph is only loaded if the recorder table suggests something might be pending.
+
+    :param app_name: The name of the Django app.
+    :param migrations_dir: The path to the app's migrations directory.
+    :param using: The alias of the database connection to check.
+    :return: A list of migration names in the order they would be applied.
+    """
+    snapshot = read_snapshot(app_name, migrations_dir)
+
+    if snapshot is not None:
+        applied = get_applied_migrations(app_name, using)
+
+        # a squashed migration counts as applied once everything it replaces has been
+        return [name for name in snapshot["plan"] if name not in applied
+                and not (snapshot["replaces"].get(name) and applied.issuperset(snapshot["replaces"][name]))]
+
+    if not get_unrecorded_migrations(app_name, migrations_dir, using):
+        return []
+
+    # something looks unapplied; confirm it against the real migration plan
+    from django.db.migrations.executor import MigrationExecutor
+
+    executor = MigrationExecutor(connections[using])
+    targets = [key for key in executor.loader.graph.leaf_nodes() if key[0] == app_name]
+    plan = executor.migration_plan(targets)
+
+    return [migration.name for migration, backwards in plan if not backwards]
@@ -0,0 +1,482 @@
+"""
+Online migrations: applying schema changes to large tables without locking them for the duration.
+
+Operations that have an online strategy are rewritten; every other operation is applied the usual way.
+
+* PostgreSQL: ``AddIndex`` becomes ``CREATE INDEX CONCURRENTLY``. ``AddField`` (for plain columns) adds the column
+  without a default, sets the default for new rows only, backfills existing rows in batches, then adds ``NOT NULL``
+  through a ``CHECK`` constraint that's validated without blocking writes.
+* SQLite: ``AddField`` with a constant default uses ``ALTER TABLE ... ADD COLUMN``, which doesn't touch existing rows
+  (the default stays in the table definition, where Django ignores it).
+  Operations Django would apply by rebuilding the table (``AlterField``, ``RemoveField``, and so on) rebuild it online
+  instead: the new table is filled in batches while triggers copy concurrent writes across, then the tables are
+  swapped, and the new table's indexes built, in one transaction.
+
+Each online operation commits as it goes, so a migration that fails partway through is left partly applied, like any
+non-atomic migration.
+"""
+
+import copy
+import time
+from contextlib import contextmanager
+
+from django.db import connections, transaction
+from django.db.migrations import operations
+
+# operations Django's SQLite backend applies by rebuilding the whole table
+_SQLITE_REBUILD_OPERATIONS = (operations.AddField, operations.AlterField, operations.RemoveField,
+                              operations.AddConstraint, operations.RemoveConstraint)
+
+# the strategies an operation can be applied with, and what each one locks
+STRATEGIES = {
+    "standard": "applied normally: {table} is locked ({lock}) until the operation finishes",
+    "concurrent_index": "CREATE INDEX CONCURRENTLY: reads and writes to {table} continue while the index builds",
+    "add_column": "ADD COLUMN without rewriting rows: {table} is locked ({lock}) for milliseconds",
+    "add_column_backfill": "ADD COLUMN, then {batches} backfill batches of up to {batch_size} rows, each locking only "
+                           "its own rows; NOT NULL is added through a CHECK constraint validated without blocking "
+                           "writes",
+    "rebuild": "online table rebuild: {batches} copy batches of up to {batch_size} rows, each holding the write "
+               "lock briefly, then a swap transaction that also builds the indexes",
+}
+
+
+class OnlineMigrator:
+    """
+    Applies an app's pending migrations online.
+
+    :param app_name: The name of the Django app.
+    :param using: The alias of the database connection to migrate.
+    :param batch_size: The number of rows copied or backfilled per batch (and per transaction).
+    :param throttle: How many seconds to pause between batches, to leave room for the rest of the workload.
+    :param lock_timeout: How many seconds a PostgreSQL schema change waits for its lock before giving up, so it never
+                         queues behind a long transaction while blocking everything queued behind it.
+    :param progress: A function called with a description of the current step, the rows done, and the total rows
+                     (an estimate) as batches complete.
+    """
+
+    def __init__(self, app_name: str, using: str = "default", batch_size: int = 1000, throttle: float = 0.0,
+                 lock_timeout: float = 5.0, progress=None):
+        from django.db.migrations.executor import MigrationExecutor
+
+        self.app_name = app_name
+        self.connection = connections[using]
+        self.batch_size = batch_size
+        self.throttle = throttle
+        self.lock_timeout = lock_timeout
+        self.progress = progress or (lambda step, done, total: None)
+
+        if self.connection.vendor not in ("postgresql", "sqlite"):
+            raise ValueError(f"Online migrations are only supported on PostgreSQL and SQLite, not "
+                             f"{self.connection.vendor}.")
+
+        self.executor = MigrationExecutor(self.connection)
+
+    def get_plan(self) -> list:
+        """
+        Works out how each pending operation would be applied, without changing anything.
+
+        :return: A list of ``(migration, operation, strategy, from_state, to_state)`` tuples in the order they'd run.
+        """
+        targets = [key for key in self.executor.loader.graph.leaf_nodes() if key[0] == self.app_name]
+        state = self.executor._create_project_state(with_applied_migrations=True)
+        plan = []
+
+        for migration, backwards in self.executor.migration_plan(targets):
+            for operation in migration.operations:
+                from_state = state.clone()
+                operation.state_forwards(migration.app_label, state)
+                plan.append((migration, operation, self.get_strategy(migration.app_label, operation, from_state,
+                                                                     state), from_state, state.clone()))
+
+        return plan
+
+    def get_strategy(self, app_label: str, operation, from_state, to_state) -> str:
+        """
+        Chooses how to apply an operation (one of the keys of ``STRATEGIES``).
+        """
+        if not hasattr(operation, "model_name") or (app_label, operation.model_name_lower) not in from_state.models:
+            return "standard"
+
+        model = from_state.apps.get_model(app_label, operation.model_name)
+        new_model = to_state.apps.get_model(app_label, operation.model_name)
+
+        old_field = model._meta.get_field(operation.name) \
+            if isinstance(operation, (operations.AlterField, operations.RemoveField)) else None
+        new_field = self._get_new_field(operation, new_model) \
+            if isinstance(operation, (operations.AddField, operations.AlterField)) else None
+
+        if self.connection.vendor == "postgresql":
+            if isinstance(operation, operations.AddIndex):
+                return "concurrent_index"
+            if isinstance(operation, operations.AddField) and self._is_plain_column(new_field):
+                return "add_column_backfill"
+            return "standard"
+
+        if not isinstance(operation, _SQLITE_REBUILD_OPERATIONS):
+            return "standard"
+
+        # tables whose primary key changes, and many-to-many fields (which have tables of their own), are left alone
+        if model._meta.pk.column != new_model._meta.pk.column \
+                or any(field is not None and field.many_to_many for field in (old_field, new_field)):
+            return "standard"
+
+        if isinstance(operation, operations.AlterField):
+            editor = self.connection.schema_editor()
+
+            # changes Django doesn't touch the table for, and plain column renames, are already fast
+            if not editor._field_should_be_altered(old_field, new_field) or (
+                    old_field.column != new_field.column and not old_field.is_relation
+                    and editor.column_sql(model, old_field) == editor.column_sql(new_model, new_field)):
+                return "standard"
+
+        if isinstance(operation, operations.AddField) and self._is_plain_column(new_field):
+            constant_default = new_field.has_default() and not callable(new_field.default) \
+                and new_field.default is not None
+
+            if constant_default or (new_field.null and not new_field.has_default()):
+                return "add_column"
+
+        return "rebuild"
+
+    @staticmethod
+    def _get_new_field(operation, model):
+        """
+        Gets the field an ``AddField`` or ``AlterField`` operation leaves a model with. ``AddField`` with
+        ``preserve_default=False`` (how makemigrations writes one-off defaults) leaves the default out of the migration
+        state, so it's put back from the operation, as Django's ``AddField.database_forwards()`` does.
+        """
+        field = model._meta.get_field(operation.name)
+
+        if isinstance(operation, operations.AddField) and not operation.preserve_default:
+            field = copy.copy(field)
+            field.default = operation.field.default
+
+        return field
+
+    @staticmethod
+    def _is_plain_column(field) -> bool:
+        return (field.concrete and not field.is_relation and not field.primary_key and not field.unique
+                and not field.db_index)
+
+    def _get_table(self, app_label: str, operation, state):
+        if not hasattr(operation, "model_name") or (app_label, operation.model_name_lower) not in state.models:
+            return None
+
+        return state.apps.get_model(app_label, operation.model_name)._meta.db_table
+
+    def estimate_rows(self, table: str) -> int:
+        """
+        Estimates the number of rows in a table quickly (from the planner's statistics on PostgreSQL, and the largest
+        rowid on SQLite), without scanning it.
+
+        :param table: The table's name.
+        :return: The estimated number of rows (0 if the table doesn't exist yet).
+        """
+        if table not in self.connection.introspection.table_names():
+            return 0
+
+        with self.connection.cursor() as cursor:
+            if self.connection.vendor == "postgresql":
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)",
+                               [self.connection.ops.quote_name(table)])
+            else:
+                cursor.execute(f"SELECT max(rowid) FROM {self.connection.ops.quote_name(table)}")
+
+            row = cursor.fetchone()
+
+        return max(row[0] or 0, 0) if row else 0
+
+    def describe(self) -> list:
+        """
+        Describes what applying the pending migrations online would do and lock, without changing anything.
+
+        :return: A list of lines of text.
+        """
+        lines = []
+
+        for migration, operation, strategy, from_state, to_state in self.get_plan():
+            table = self._get_table(migration.app_label, operation, from_state) \
+                or self._get_table(migration.app_label, operation, to_state)
+            rows = self.estimate_rows(table) if table else 0
+            lock = "ACCESS EXCLUSIVE" if self.connection.vendor == "postgresql" else "database write lock"
+
+            lines.append(f"{migration.app_label}.{migration.name}: {operation.describe()}")
+            lines.append("    " + STRATEGIES[strategy].format(
+                table=table or "the affected tables", lock=lock, batch_size=self.batch_size,
+                batches=-(-rows // self.batch_size) if rows else 0,
+            ))
+            lines.append(f"    estimated rows in {table}: {rows}" if table else "    no existing rows affected")
+
+        return lines
+
+    def migrate(self) -> int:
+        """
+        Applies the pending migrations, recording each one as applied once all of its operations have run.
+
+        :return: The number of migrations applied.
+        """
+        applied = 0
+        current = None
+
+        for migration, operation, strategy, from_state, to_state in self.get_plan():
+            if current is not None and migration is not current:
+                self.executor.record_migration(current)
+                applied += 1
+
+            current = migration
+            getattr(self, f"_apply_{strategy}")(migration, operation, from_state, to_state)
+
+        if current is not None:
+            self.executor.record_migration(current)
+            applied += 1
+
+        return applied
+
+    def _pause(self):
+        if self.throttle:
+            time.sleep(self.throttle)
+
+    def _batch_bounds(self, cursor, table: str, pk: str):
+        """
+        Yields ``(low, high)`` primary key bounds of consecutive batches of a table. Each batch covers rows with
+        ``low < pk <= high``; None means unbounded.
+        """
+        low = None
+
+        while True:
+            where = f"WHERE {pk} > %s " if low is not None else ""
+            cursor.execute(f"SELECT {pk} FROM {table} {where}ORDER BY {pk} LIMIT 1 OFFSET %s",
+                           ([low] if low is not None else []) + [self.batch_size - 1])
+            row = cursor.fetchone()
+            high = row[0] if row else None
+
+            yield low, high
+
+            if high is None:
+                return
+
+            low = high
+
+    @staticmethod
+    def _range_sql(pk: str, low, high) -> tuple:
+        conditions, params = [], []
+
+        if low is not None:
+            conditions.append(f"{pk} > %s")
+            params.append(low)
+        if high is not None:
+            conditions.append(f"{pk} <= %s")
+            params.append(high)
+
+        return " AND ".join(conditions) or "1 = 1", params
+
+    def _column_exists(self, table: str, column: str) -> bool:
+        with self.connection.cursor() as cursor:
+            return column in {info.name for info in self.connection.introspection.get_table_description(cursor, table)}
+
+    def _apply_standard(self, migration, operation, from_state, to_state):
+        with self.connection.schema_editor(atomic=migration.atomic) as editor:
+            operation.database_forwards(migration.app_label, editor, from_state, to_state)
+
+    @contextmanager
+    def _lock_timeout(self):
+        """
+        Sets PostgreSQL's lock_timeout for the session while the block runs, and resets it afterwards. (``SET LOCAL``
+        isn't an option, since some of the statements can't run inside a transaction.)
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"SET lock_timeout = '{int(self.lock_timeout * 1000)}ms'")
+
+        try:
+            yield
+        finally:
+            with self.connection.cursor() as cursor:
+                cursor.execute("RESET lock_timeout")
+
+    def _apply_concurrent_index(self, migration, operation, from_state, to_state):
+        model = to_state.apps.get_model(migration.app_label, operation.model_name)
+
+        with self.connection.schema_editor(atomic=False) as editor, self._lock_timeout():
+            try:
+                editor.add_index(model, operation.index, concurrently=True)
+            except Exception:
+                # a failed concurrent build leaves an invalid index behind
+                editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {editor.quote_name(operation.index.name)}")
+                raise
+
+    def _apply_add_column(self, migration, operation, from_state, to_state):
+        model = to_state.apps.get_model(migration.app_label, operation.model_name)
+        field = self._get_new_field(operation, model)
+
+        # a column left behind by an earlier, interrupted run is kept
+        if self._column_exists(model._meta.db_table, field.column):
+            return
+
+        with self.connection.schema_editor(atomic=False) as editor:
+            definition, params = editor.column_sql(model, field)
+            default = editor.effective_default(field)
+
+            # SQLite doesn't take parameters in schema changes, so the default is written out as a literal
+            if default is not None:
+                definition += f" DEFAULT {editor.quote_value(default)}"
+
+            editor.execute(editor.sql_create_column % {
+                "table": editor.quote_name(model._meta.db_table),
+                "column": editor.quote_name(field.column),
+                "definition": definition,
+            }, None)
+
+    def _apply_add_column_backfill(self, migration, operation, from_state, to_state):
+        model = to_state.apps.get_model(migration.app_label, operation.model_name)
+        field = self._get_new_field(operation, model)
+
+        nullable = copy.copy(field)
+        nullable.null = True
+
+        with self.connection.schema_editor(atomic=False) as editor:
+            table = editor.quote_name(model._meta.db_table)
+            column = editor.quote_name(field.column)
+            pk = editor.quote_name(model._meta.pk.column)
+            default = editor.effective_default(field)
+
+            with self._lock_timeout(), self.connection.cursor() as cursor:
+                # a column left behind by an earlier, interrupted run is kept, and its backfill picks up where it was
+                if not self._column_exists(model._meta.db_table, field.column):
+                    definition, params = editor.column_sql(model, nullable)
+                    cursor.execute(editor.sql_create_column % {"table": table, "column": column,
+                                                               "definition": definition}, params)
+
+                if default is not None:
+                    # new rows get the default from here on, so the backfill only has to cover existing rows
+                    cursor.execute(f"ALTER TABLE {table} ALTER COLUMN {column} SET DEFAULT %s", [default])
+
+                    total = self.estimate_rows(model._meta.db_table)
+                    done = 0
+
+                    for low, high in self._batch_bounds(cursor, table, pk):
+                        condition, range_params = self._range_sql(pk, low, high)
+
+                        with transaction.atomic(using=self.connection.alias):
+                            cursor.execute(f"UPDATE {table} SET {column} = %s WHERE {condition} AND {column} IS NULL",
+                                           [default] + range_params)
+                            done += cursor.rowcount
+
+                        self.progress(f"backfilling {model._meta.db_table}.{field.column}", done, total)
+                        self._pause()
+
+                if not field.null:
+                    # shortened (before quoting) to fit PostgreSQL's limit on identifier lengths
+                    check = editor.quote_name(editor._create_index_name(model._meta.db_table, [field.column],
+                                                                        suffix="_not_null"))
+
+                    cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {check} CHECK ({column} IS NOT NULL) NOT VALID")
+                    cursor.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {check}")
+                    cursor.execute(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL")
+                    cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {check}")
+
+                if default is not None:
+                    # Django doesn't use database defaults
+                    cursor.execute(f"ALTER TABLE {table} ALTER COLUMN {column} DROP DEFAULT")
+
+    def _apply_rebuild(self, migration, operation, from_state, to_state):
+        old_model = from_state.apps.get_model(migration.app_label, operation.model_name)
+        new_model = to_state.apps.get_model(migration.app_label, operation.model_name)
+
+        table_name = old_model._meta.db_table
+        temp_name = f"new__{table_name}"
+        quote = self.connection.ops.quote_name
+        table, temp, pk = quote(table_name), quote(temp_name), quote(old_model._meta.pk.column)
+
+        with self.connection.schema_editor(atomic=False) as editor:
+            # map each of the new table's columns to the old column it's copied from and the default for NULLs
+            old_fields = {field.name: field for field in old_model._meta.local_concrete_fields}
+            mapping = {}
+
+            for field in new_model._meta.local_concrete_fields:
+                if isinstance(operation, operations.AddField) and field.name == operation.name:
+                    field = self._get_new_field(operation, new_model)
+
+                old_field = old_fields.get(field.name)
+                default = editor.quote_value(editor.effective_default(field))
+
+                if old_field is None:
+                    mapping[field.column] = (None, default)
+                elif old_field.null and not field.null:
+                    mapping[field.column] = (quote(old_field.column), default)
+                else:
+                    mapping[field.column] = (quote(old_field.column), None)
+
+            def values(row: str) -> str:
+                """
+                Builds the new table's column values from a row of the old table (``row`` is "NEW." in triggers).
+                """
+                return ", ".join(
+                    default if column is None else f"coalesce({row}{column}, {default})" if default else row + column
+                    for column, default in mapping.values()
+                )
+
+            columns = ", ".join(quote(column) for column in mapping)
+            updates = ", ".join(f"{quote(column)} = excluded.{quote(column)}" for column in mapping)
+            upsert = (f"INSERT INTO {temp} ({columns}) VALUES ({values('NEW.')}) "
+                      f"ON CONFLICT({pk}) DO UPDATE SET {updates}")
+
+            # create the new table under a temporary name; its indexes are created once it has the real name (as
+            # Django's own table rebuilds do), since index names are derived from the table name
+            new_model._meta.db_table = temp_name
+            try:
+                editor.create_model(new_model)
+                deferred_sql, editor.deferred_sql = editor.deferred_sql, []
+            finally:
+                new_model._meta.db_table = table_name
+
+            for sql in deferred_sql:
+                if hasattr(sql, "rename_table_references"):
+                    sql.rename_table_references(temp_name, table_name)
+
+            # triggers that mirror writes made to the old table during the copy
+            triggers = {
+                f"{temp_name}_insert": f"AFTER INSERT ON {table} BEGIN {upsert}; END",
+                f"{temp_name}_update": f"AFTER UPDATE ON {table} BEGIN DELETE FROM {temp} WHERE {pk} = OLD.{pk}; "
+                                       f"{upsert}; END",
+                f"{temp_name}_delete": f"AFTER DELETE ON {table} BEGIN DELETE FROM {temp} WHERE {pk} = OLD.{pk}; END",
+            }
+
+            try:
+                with self.connection.cursor() as cursor:
+                    for trigger, definition in triggers.items():
+                        cursor.execute(f"CREATE TRIGGER {quote(trigger)} {definition}")
+
+                    total = self.estimate_rows(table_name)
+                    done = 0
+
+                    for low, high in self._batch_bounds(cursor, table, pk):
+                        condition, params = self._range_sql(pk, low, high)
+
+                        # rows the triggers already copied are newer, so they're left as they are
+                        with transaction.atomic(using=self.connection.alias):
+                            # literal defaults in the column mapping may contain "%"
+                            select = f"INSERT INTO {temp} ({columns}) SELECT {values('')} FROM {table}"
+                            cursor.execute(select.replace("%", "%%") + f" WHERE {condition} ON CONFLICT({pk}) "
+                                                                       f"DO NOTHING", params)
+                            done += cursor.rowcount
+
+                        self.progress(f"copying {table_name}", done, total)
+                        self._pause()
+
+                    with transaction.atomic(using=self.connection.alias):
+                        for trigger in triggers:
+                            cursor.execute(f"DROP TRIGGER {quote(trigger)}")
+
+                        cursor.execute(f"DROP TABLE {table}")
+                        cursor.execute(f"ALTER TABLE {temp} RENAME TO {table}")
+
+                        for sql in deferred_sql:
+                            editor.execute(sql)
+            except Exception:
+                with self.connection.cursor() as cursor:
+                    for trigger in triggers:
+                        cursor.execute(f"DROP TRIGGER IF EXISTS {quote(trigger)}")
+                    cursor.execute(f"DROP TABLE IF EXISTS {temp}")
+                raise
+
+            # the schema editor checks foreign keys into and out of the new table when it exits
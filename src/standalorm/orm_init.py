@@ -4,6 +4,9 @@ Provides a function for initializing standalorm.
 
 
 import sys
+import time
+
+_imports_start = time.perf_counter()
 
 sys.dont_write_bytecode = True
 
@@ -13,9 +16,149 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "standalorm.settings")
 
 import django
 from path import Path
+import standalorm.utils as utils
+from standalorm.memory import install_memory_hook
+from standalorm.pragmas import install_pragma_hook
+from standalorm.readonly import install_readonly_hook
+
+# milliseconds spent in each phase of standalorm's startup, in the order the phases ran
+startup_timings = {"imports": (time.perf_counter() - _imports_start) * 1000}
+
+
+class _Phase:
+    """
+    Context manager that records how long the code inside it took to run in ``startup_timings``.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        startup_timings[self.name] = (time.perf_counter() - self.start) * 1000
+
+
+def get_startup_timings() -> dict:
+    """
+    Gets a breakdown of how long standalorm took to start up.
+
+    :return: A dictionary mapping the name of each startup phase to the number of milliseconds it took.
+    """
+    return dict(startup_timings)
 
 
-def orm_init(file_dunder):
+def _fast_django_setup():
+    """
+    A trimmed-down equivalent of ``django.setup()``. URL script prefix handling (and the import of ``django.urls``
+    that comes with it) is skipped, since standalone scripts don't resolve URLs. Django's logging configuration (and
+    the import of ``django.core.mail`` that comes with it) is skipped unless ``LOGGING`` is set, since Django's
+    default loggers only handle web requests. Every app's models module is imported lazily (see
+    ``standalorm.apps``).
+    """
+    from django.apps import AppConfig, apps
+    from django.conf import settings
+    from standalorm.apps import defer_model_loading, make_lazy
+
+    if settings.LOGGING:
+        from django.utils.log import configure_logging
+
+        with _Phase("logging"):
+            configure_logging(settings.LOGGING_CONFIG, settings.LOGGING)
+
+    with _Phase("apps"):
+        defer_model_loading(apps)
+        apps.populate([make_lazy(AppConfig.create(entry)) for entry in settings.INSTALLED_APPS])
+
+
+def _lazy_django_setup():
+    """
+    The equivalent of ``django.setup()``, except that every app's models module is imported lazily (see
+    ``standalorm.apps``), so a script only pays for importing the models it actually uses.
+    """
+    from django.apps import AppConfig, apps
+    from django.conf import settings
+    from django.urls import set_script_prefix
+    from django.utils.log import configure_logging
+    from standalorm.apps import defer_model_loading, make_lazy
+
+    configure_logging(settings.LOGGING_CONFIG, settings.LOGGING)
+    set_script_prefix("/" if settings.FORCE_SCRIPT_NAME is None else settings.FORCE_SCRIPT_NAME)
+
+    defer_model_loading(apps)
+    apps.populate([make_lazy(AppConfig.create(entry)) for entry in settings.INSTALLED_APPS])
+
+
+def setup(user_root: str, fast: bool = False, instrument: bool = False, warm: bool = False, lazy: bool = False,
+          record: bool = False):
+    """
+    Configures Django for the project whose root directory is ``user_root``. This is what ``orm_init()`` does under
+    the hood, and it's also used by standalorm's command line interface to run Django's management commands in-process.
+
+    :param user_root: The directory containing the user's Django app (and SQLite database, if one is in use).
+    :param fast: If True, use fast-startup mode (see ``orm_init()``).
+    :param instrument: If True, record statistics about every query (see ``orm_init()``).
+    :param warm: If True, open connections and preload models in the background (see ``orm_init()``).
+    :param lazy: If True, import each app's models module on first use instead of during setup (see ``orm_init()``).
+                 Fast-startup mode always does this.
+    :param record: If True, record the query workload for ``standalorm db advise`` if that's turned on in the
+                   [advisor] table of orm-settings.toml. Off for standalorm's own commands, so they don't end up in the
+                   workload.
+    """
+    from django.conf import settings
+
+    os.environ["USER_ROOT"] = user_root
+
+    with _Phase("hooks"):
+        # apply each SQLite connection's PRAGMA profile (if any) whenever Django opens it
+        install_pragma_hook()
+
+        # keep shared in-memory SQLite databases alive for as long as the process runs
+        install_memory_hook()
+
+        # reject writes on connections with the "readonly" role
+        install_readonly_hook()
+
+        if instrument:
+            from standalorm.instrumentation import install_instrumentation
+
+            install_instrumentation(utils.get_settings(), user_root)
+
+        if utils.get_settings().get("cache", {}).get("enabled", False):
+            from standalorm.cache import install_cache
+
+            install_cache(utils.get_settings(), user_root)
+
+        if record and utils.get_settings().get("advisor", {}).get("record", False):
+            from standalorm.advisor import install_recorder
+
+            install_recorder(utils.get_settings(), user_root)
+
+    with Path(os.path.dirname(__file__)):
+        with _Phase("settings"):
+            settings.INSTALLED_APPS  # accessing any setting imports standalorm.settings
+
+        if fast:
+            _fast_django_setup()
+        elif lazy:
+            with _Phase("django_setup"):
+                _lazy_django_setup()
+        else:
+            with _Phase("django_setup"):
+                django.setup()
+
+    if warm:
+        from standalorm.warmup import start_warmup
+
+        warmup_settings = utils.get_settings().get("warmup", {})
+
+        with _Phase("warmup"):
+            start_warmup(timeout=warmup_settings.get("timeout", 5.0),
+                         preload_models=warmup_settings.get("preload_models", True))
+
+
+def orm_init(file_dunder, fast=False, instrument=False, warm=False, lazy=None):
     """
     Initializes standalorm. This function is the only thing from the library a typical end user should be importing
     into their code.
@@ -32,8 +175,48 @@ def orm_init(file_dunder):
                          isn't strictly necessary when a non-SQLite database is being used, passing it in regardless
                          does no harm and it's easier for the end user to just always pass it in without having to
                          worry about what database is being used.
+    :param fast: If True, standalorm starts up in fast-startup mode, which is meant for short-lived scripts. Your app's
+                 models module isn't imported until you import it yourself or look one of its models up through
+                 Django's app registry, and Django's URL handling isn't set up. Don't use this mode to run management
+                 commands. Either way, ``get_startup_timings()`` reports how long each phase of startup took.
+    :param instrument: If True, every query's latency, row count and call site is recorded, repeated queries from the
+                       same line of code are flagged as likely N+1 queries, and slow queries are logged to the file
+                       set in the [instrumentation] table of orm-settings.toml. See ``standalorm.instrumentation``
+                       for how to read the results.
+    :param warm: If True, every configured connection is opened in a background thread, checked with a cheap
+                 readiness query, and handed to the calling thread while your code carries on running. Your app's
+                 models are preloaded (on the calling thread) while the connections open. Call
+                 ``standalorm.await_ready()`` to wait for the warm-up to finish, and see ``standalorm.warmup`` for its
+                 timings. The readiness query's timeout and whether models are preloaded are set in the [warmup]
+                 table of orm-settings.toml.
+    :param lazy: If True, each app's models module is imported the first time you import it yourself or look one of
+                 its models up through Django's app registry, rather than during ``orm_init()``, so startup time grows
+                 with the models your script uses instead of with the whole schema. If None, ``lazy_models`` in the
+                 [config] table of orm-settings.toml decides. Fast-startup mode is always lazy.
+
+    With ``record = true`` in the [advisor] table of orm-settings.toml, the statements your script runs are recorded
+    for ``standalorm db advise``, which proposes indexes for them (see ``standalorm.advisor``).
+
+    If there's an orm-settings.toml in the directory ``file_dunder`` is in, or in one of its parents, it's used instead
+    of the one that comes with standalorm, so each project can have its own apps and connections, and the directory
+    it's in is treated as the project's root directory (where apps are imported from and SQLite databases are looked
+    for). Run ``standalorm init`` in a project's root directory to create one. The STANDALORM_SETTINGS environment
+    variable, if it's set, takes precedence over both.
     """
-    os.environ["USER_ROOT"] = os.path.dirname(file_dunder)
+    user_root = os.path.dirname(os.path.abspath(file_dunder))
 
-    with Path(os.path.dirname(__file__)):
-        django.setup()
+    project_settings = None if "STANDALORM_SETTINGS" in os.environ else utils.find_project_settings(user_root)
+
+    # with a project-local settings file, the project's root is where the file is (and where its apps are imported
+    # from), wherever the script is
+    if project_settings is not None:
+        utils.use_settings(project_settings)
+        user_root = os.path.dirname(project_settings)
+
+        if user_root not in sys.path:
+            sys.path.insert(0, user_root)
+
+    if lazy is None:
+        lazy = utils.get_settings()["config"].get("lazy_models", False)
+
+    setup(user_root, fast, instrument, warm, lazy, record=True)
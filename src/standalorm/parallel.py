@@ -0,0 +1,130 @@
+"""
+Runs a function over a queryset in parallel across several processes, one primary key range per task.
+
+Each worker process sets standalorm up for itself and opens its own database connections; nothing is shared with the
+parent process. Because workers may be started with the "spawn" method, the function you pass in must be defined at
+module level, and a script that uses this module must guard its entry point with ``if __name__ == "__main__":``.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import reduce
+
+from django.apps import apps
+from django.db import connections
+
+
+def partition_by_pk(queryset, partitions: int) -> list:
+    """
+    Splits a queryset into primary key ranges holding roughly the same number of rows each. Any orderable primary key
+    works, not just integers, and gaps in the key sequence don't unbalance the partitions.
+
+    :param queryset: The queryset to split.
+    :param partitions: The number of ranges to split it into. Fewer are returned if the queryset has fewer rows.
+    :return: A list of ``(low, high)`` tuples. Each range includes ``low`` and excludes ``high``; None means unbounded.
+    """
+    total = queryset.count()
+    partitions = max(1, min(partitions, total))
+
+    keys = queryset.order_by("pk").values_list("pk", flat=True)
+    bounds = [None] + [keys[total * index // partitions] for index in range(1, partitions)] + [None]
+
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _init_worker(user_root: str):
+    """
+    Prepares a worker process. Spawned workers set Django up from scratch. Forked workers already have Django set up
+    but have inherited the parent's connection objects, which are dropped (without being closed, since closing them
+    would affect the parent) so the worker opens its own.
+    """
+    if apps.ready:
+        for connection in connections.all():
+            connection.connection = None
+    else:
+        from standalorm.orm_init import setup
+
+        setup(user_root, fast=True)
+
+
+def _run_partition(function, model_label: str, query, low, high):
+    """
+    Rebuilds a partition of the queryset inside a worker process and calls ``function`` on it.
+    """
+    model = apps.get_model(model_label)
+
+    queryset = model._default_manager.all()
+    queryset.query = query
+
+    if low is not None:
+        queryset = queryset.filter(pk__gte=low)
+    if high is not None:
+        queryset = queryset.filter(pk__lt=high)
+
+    return function(queryset)
+
+
+def parallel_map(function, queryset, partitions: int = None, processes: int = None, start_method: str = "spawn"):
+    """
+    Calls ``function`` on primary key partitions of ``queryset`` in a pool of worker processes::
+
+        def total_price(books):
+            return sum(book.price for book in books.iterator())
+
+        if __name__ == "__main__":
+            for subtotal in parallel_map(total_price, Book.objects.filter(in_print=True)):
+                ...
+
+    Only the queryset's query is sent to the workers (querysets themselves are evaluated when they're pickled), so the
+    parent process never loads the rows.
+
+    :param function: A module-level function taking a queryset. Its return value must be picklable.
+    :param queryset: The queryset to partition.
+    :param partitions: The number of partitions. Defaults to four per process, so uneven partitions even out.
+    :param processes: The number of worker processes. Defaults to the number of CPUs.
+    :param start_method: The multiprocessing start method. "spawn" (the default) is always safe; "fork" starts workers
+                         faster, but the parent must not have database connections open in other threads, since forked
+                         children can't safely dispose of them.
+    :return: A generator of ``function``'s results, in the order the partitions finish.
+    """
+    processes = processes or os.cpu_count() or 1
+    ranges = partition_by_pk(queryset, partitions or processes * 4)
+
+    context = multiprocessing.get_context(start_method)
+
+    if start_method == "fork":
+        # a forked child inherits the parent's sockets, so the parent's connections must be closed before forking
+        for connection in connections.all():
+            if connection.in_atomic_block:
+                raise RuntimeError("parallel_map() can't fork while a transaction is open. Use start_method='spawn'.")
+            connection.close()
+
+    pool = ProcessPoolExecutor(processes, mp_context=context, initializer=_init_worker,
+                               initargs=(os.getenv("USER_ROOT", os.getcwd()),))
+
+    try:
+        futures = [pool.submit(_run_partition, function, queryset.model._meta.label, queryset.query, low, high)
+                   for low, high in ranges]
+
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def parallel_reduce(function, queryset, reducer, initial, **kwargs):
+    """
+    Calls ``function`` on primary key partitions of ``queryset`` in a pool of worker processes and combines the results
+    with ``reducer`` as they arrive::
+
+        total = parallel_reduce(total_price, Book.objects.all(), operator.add, 0)
+
+    :param function: A module-level function taking a queryset. Its return value must be picklable.
+    :param queryset: The queryset to partition.
+    :param reducer: A function taking the running total and one partition's result and returning the new total.
+    :param initial: The starting total.
+    :param kwargs: Passed on to ``parallel_map()``.
+    :return: The combined result.
+    """
+    return reduce(reducer, parallel_map(function, queryset, **kwargs), initial)
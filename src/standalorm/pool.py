@@ -0,0 +1,249 @@
+"""
+A client-side database connection pool and the mixin standalorm's pooled database backends are built from.
+"""
+
+import threading
+import time
+import weakref
+from collections import deque
+from functools import partial
+
+# pools shared by every thread's DatabaseWrapper for the same connection alias
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no connection becomes available before the pool's checkout timeout runs out.
+    """
+    pass
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of DB-API connections with a hard upper bound on how many can be open at once.
+
+    Connections are handed out most-recently-returned first, so the connections that stay busy stay warm. Connections
+    that sit idle for longer than ``max_idle`` seconds are closed, down to ``min_size``.
+
+    :param min_size: The number of idle connections that are never closed for being idle.
+    :param max_size: The most connections that can be open at once (idle or checked out).
+    :param timeout: How many seconds ``checkout()`` waits for a connection before raising ``PoolTimeout``.
+    :param max_idle: How many seconds a connection can sit idle before it's closed.
+    """
+
+    def __init__(self, min_size: int = 0, max_size: int = 10, timeout: float = 30.0, max_idle: float = 300.0):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError("The pool's sizes must satisfy 0 <= min_size <= max_size and max_size >= 1.")
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+
+        self._idle = deque()  # (connection, time it was returned), oldest on the left
+        self._size = 0  # open connections, idle or checked out
+        self._in_use = 0
+        self._condition = threading.Condition()
+
+        self._counters = {
+            "checkouts": 0, "waits": 0, "wait_seconds": 0.0, "timeouts": 0, "created": 0, "closed": 0,
+            "peak_in_use": 0,
+        }
+
+    def _close(self, connection):
+        self._counters["closed"] += 1
+
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _reap_idle(self):
+        """
+        Closes connections that have been idle for longer than ``max_idle``. Must be called with the lock held.
+        """
+        now = time.monotonic()
+
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.max_idle:
+            connection, returned_at = self._idle.popleft()
+            self._size -= 1
+            self._close(connection)
+
+    def _mark_checked_out(self):
+        self._in_use += 1
+        self._counters["checkouts"] += 1
+        self._counters["peak_in_use"] = max(self._counters["peak_in_use"], self._in_use)
+
+    def checkout(self, create):
+        """
+        Takes a connection out of the pool, opening a new one if none are idle and the pool isn't full, and waiting
+        for one to be returned otherwise.
+
+        :param create: A function that opens a new connection.
+        :return: A DB-API connection.
+        """
+        deadline = time.monotonic() + self.timeout
+
+        with self._condition:
+            self._reap_idle()
+
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+
+                if remaining <= 0:
+                    self._counters["timeouts"] += 1
+                    raise PoolTimeout(f"No database connection became available within {self.timeout} seconds "
+                                      f"(all {self.max_size} are checked out).")
+
+                self._counters["waits"] += 1
+                wait_start = time.monotonic()
+                self._condition.wait(remaining)
+                self._counters["wait_seconds"] += time.monotonic() - wait_start
+
+            self._mark_checked_out()
+
+            if self._idle:
+                return self._idle.pop()[0]
+
+            # reserve a slot, then open the connection outside the lock
+            self._size += 1
+
+        try:
+            connection = create()
+        except BaseException:
+            self._release_slot()
+            raise
+
+        with self._condition:
+            self._counters["created"] += 1
+
+        return connection
+
+    def checkin(self, connection, discard: bool = False):
+        """
+        Returns a connection to the pool. Any open transaction is rolled back first; if that fails, the connection is
+        closed instead of being returned.
+
+        :param connection: A connection previously returned by ``checkout()``.
+        :param discard: If True, close the connection instead of returning it (e.g. because it's broken).
+        """
+        if not discard:
+            try:
+                connection.rollback()
+            except Exception:
+                discard = True
+
+        with self._condition:
+            self._in_use -= 1
+
+            if discard:
+                self._size -= 1
+                self._close(connection)
+            else:
+                self._idle.append((connection, time.monotonic()))
+                self._reap_idle()
+
+            self._condition.notify()
+
+    def _release_slot(self):
+        """
+        Gives back the slot of a checked-out connection that will never be checked in (e.g. because the object
+        holding it was garbage collected).
+        """
+        with self._condition:
+            self._in_use -= 1
+            self._size -= 1
+            self._condition.notify()
+
+    def close_all(self):
+        """
+        Closes every idle connection. Checked-out connections are closed when they're checked in with
+        ``discard=True`` or garbage collected.
+        """
+        with self._condition:
+            while self._idle:
+                self._size -= 1
+                self._close(self._idle.popleft()[0])
+
+    def stats(self) -> dict:
+        """
+        Gets the pool's utilization metrics.
+
+        :return: A dictionary with the pool's current size, how many connections are checked out and idle, its
+                 utilization (checked out / max size), and running totals of checkouts, waits, time spent waiting,
+                 timeouts, and connections created and closed.
+        """
+        with self._condition:
+            return {
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "utilization": self._in_use / self.max_size,
+                **self._counters,
+            }
+
+
+def get_pool(alias: str, config: dict) -> ConnectionPool:
+    """
+    Gets the pool for a connection alias, creating it the first time it's needed.
+
+    :param alias: A database connection alias.
+    :param config: The POOL settings of the connection (min_size, max_size, timeout, and max_idle).
+    :return: The alias's connection pool.
+    """
+    with _pools_lock:
+        if alias not in _pools:
+            _pools[alias] = ConnectionPool(**config)
+
+        return _pools[alias]
+
+
+def pool_stats() -> dict:
+    """
+    Gets the utilization metrics of every pool that's been created.
+
+    :return: A dictionary mapping connection aliases to the dictionaries returned by ``ConnectionPool.stats()``.
+    """
+    with _pools_lock:
+        return {alias: pool.stats() for alias, pool in _pools.items()}
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Mixin for Django ``DatabaseWrapper`` classes. Instead of opening and closing connections, the wrapper checks them
+    out of and back into a pool shared by every thread (see ``get_pool()``), configured by the POOL dictionary in the
+    connection's settings.
+
+    Django closes a thread's connection at unit-of-work boundaries (see ``standalorm.connection_scope()``) once it's
+    older than ``CONN_MAX_AGE``, so with the default ``CONN_MAX_AGE`` of 0, every unit of work returns its connection to
+    the pool. A connection held by a thread that exits without closing it is given back to the pool's capacity when
+    the thread's ``DatabaseWrapper`` is garbage collected.
+    """
+
+    _pool_finalizer = None
+
+    def _get_pool(self) -> ConnectionPool:
+        return get_pool(self.alias, self.settings_dict.get("POOL", {}))
+
+    def get_new_connection(self, conn_params):
+        pool = self._get_pool()
+        connection = pool.checkout(partial(super().get_new_connection, conn_params))
+
+        # the finalizer must not reference self, or self would never be garbage collected
+        self._pool_finalizer = weakref.finalize(self, pool._release_slot)
+
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+
+        if self._pool_finalizer is not None:
+            self._pool_finalizer.detach()
+            self._pool_finalizer = None
+
+        self._get_pool().checkin(self.connection, discard=self.errors_occurred)
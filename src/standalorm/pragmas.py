@@ -0,0 +1,63 @@
+"""
+SQLite PRAGMA profiles and the hook that applies them to new database connections.
+"""
+
+import re
+
+from django.db.backends.signals import connection_created
+
+# PRAGMAs a profile is allowed to set; anything else in orm-settings.toml is ignored
+ALLOWED_PRAGMAS = ("journal_mode", "synchronous", "mmap_size", "cache_size", "temp_store", "busy_timeout",
+                   "query_only")
+
+_pragma_value = re.compile(r"^-?\w+$")
+
+
+def get_profile(orm_settings: dict, profile_name: str) -> dict:
+    """
+    Gets a PRAGMA profile from standalorm's settings.
+
+    :param orm_settings: A dictionary of standalorm's settings.
+    :param profile_name: The name of the profile (e.g. "durable", "fast-bulk", or "read-mostly").
+    :return: A dictionary mapping PRAGMA names to values. The dictionary is empty if no profile with that name exists.
+    """
+    profile = orm_settings.get("pragma_profiles", {}).get(profile_name, {})
+
+    return {name: value for name, value in profile.items() if name in ALLOWED_PRAGMAS}
+
+
+def apply_pragmas(connection, pragmas: dict):
+    """
+    Executes a series of PRAGMA statements on an SQLite database connection.
+
+    :param connection: A Django database connection (``django.db.connection`` or one of ``django.db.connections``).
+    :param pragmas: A dictionary mapping PRAGMA names to values.
+    """
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            if name not in ALLOWED_PRAGMAS or not _pragma_value.match(str(value)):
+                raise ValueError(f"Invalid PRAGMA setting: {name} = {value!r}")
+
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def on_connection_created(sender, connection, **kwargs):
+    """
+    Receiver for Django's ``connection_created`` signal. Applies the PRAGMA profile a connection was configured with
+    (if any) every time Django opens a new SQLite connection.
+    """
+    if connection.vendor != "sqlite":
+        return
+
+    pragmas = connection.settings_dict.get("PRAGMAS")
+
+    if pragmas:
+        apply_pragmas(connection, pragmas)
+
+
+def install_pragma_hook():
+    """
+    Connects ``on_connection_created()`` to Django's ``connection_created`` signal. Calling this more than once is
+    harmless.
+    """
+    connection_created.connect(on_connection_created, dispatch_uid="standalorm.pragmas")
@@ -0,0 +1,96 @@
+"""
+Enforcement of the "readonly" connection role (see ``standalorm.databases.make_readonly()``).
+
+Every statement run through a read-only connection is checked before it's sent: writes, schema changes and locking
+reads (``select_for_update()``) raise ``ReadOnlyError`` instead of reaching the database. Use read-only connections
+for reports and exports with ``.using()``::
+
+    totals = Order.objects.using("reports").values("region").annotate(total=Sum("amount"))
+
+On SQLite, which has no statement timeout of its own, a read-only connection with ``STATEMENT_TIMEOUT`` interrupts
+any statement that takes longer than that many milliseconds to produce its first row.
+"""
+
+import re
+import time
+
+from django.db import DatabaseError
+from django.db.backends.signals import connection_created
+
+# statements that change data or schema
+_write_statement = re.compile(r"^\s*(INSERT|UPDATE|DELETE|REPLACE|MERGE|UPSERT|TRUNCATE|CREATE|ALTER|DROP|RENAME|"
+                              r"GRANT|REVOKE|COPY|VACUUM|REINDEX|ATTACH|DETACH|LOCK)\b", re.IGNORECASE)
+
+# reads that take row locks
+_locking_read = re.compile(r"\bFOR\s+(NO\s+KEY\s+UPDATE|UPDATE|KEY\s+SHARE|SHARE)\b", re.IGNORECASE)
+
+# how many SQLite virtual machine instructions run between statement timeout checks
+_PROGRESS_INTERVAL = 10000
+
+
+class ReadOnlyError(DatabaseError):
+    """
+    Raised when a statement that would write (or take write locks) is run through a read-only connection.
+    """
+    pass
+
+
+class ReadOnlyGuard:
+    """
+    An execute wrapper (see Django's ``connection.execute_wrapper()``) that rejects writes, and on SQLite enforces the
+    connection's statement timeout.
+
+    :param alias: The alias of the connection being guarded, for error messages.
+    :param timeout: The statement timeout in milliseconds, or 0 for none. Only used on SQLite.
+    """
+
+    def __init__(self, alias: str, timeout: float = 0):
+        self.alias = alias
+        self.timeout = timeout / 1000
+        self.deadline = None
+
+    def __call__(self, execute, sql, params, many, context):
+        if _write_statement.match(sql) or _locking_read.search(sql):
+            raise ReadOnlyError(f"The '{self.alias}' connection is read-only, so this statement can't be run on it: "
+                                f"{sql.split(None, 1)[0].upper()} ...")
+
+        if not self.timeout:
+            return execute(sql, params, many, context)
+
+        self.deadline = time.monotonic() + self.timeout
+
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.deadline = None
+
+    def check_deadline(self) -> int:
+        """
+        SQLite progress handler. Returning a non-zero value makes SQLite interrupt the running statement.
+        """
+        return int(self.deadline is not None and time.monotonic() > self.deadline)
+
+
+def _add_guard(sender, connection, **kwargs):
+    """
+    Receiver for Django's ``connection_created`` signal. Guards every new connection configured with the "readonly"
+    role.
+    """
+    if not connection.settings_dict.get("READONLY"):
+        return
+
+    if not any(isinstance(wrapper, ReadOnlyGuard) for wrapper in connection.execute_wrappers):
+        timeout = connection.settings_dict.get("STATEMENT_TIMEOUT", 0) if connection.vendor == "sqlite" else 0
+        connection.execute_wrappers.append(ReadOnlyGuard(connection.alias, timeout))
+
+    guard = next(wrapper for wrapper in connection.execute_wrappers if isinstance(wrapper, ReadOnlyGuard))
+
+    if guard.timeout:
+        connection.connection.set_progress_handler(guard.check_deadline, _PROGRESS_INTERVAL)
+
+
+def install_readonly_hook():
+    """
+    Connects ``_add_guard()`` to Django's ``connection_created`` signal. Calling this more than once is harmless.
+    """
+    connection_created.connect(_add_guard, dispatch_uid="standalorm.readonly")
@@ -0,0 +1,323 @@
+"""
+Bounded retries of whole transactions that fail for transient reasons: SQLite's "database is locked", PostgreSQL
+serialization failures and deadlocks, and (for transactions marked idempotent) dropped connections.
+
+``atomic_retry`` works like Django's ``transaction.atomic``, except that when the transaction fails with one of those
+errors it's rolled back and run again, after an exponentially growing, jittered delay::
+
+    @atomic_retry
+    def transfer(source, target, amount):
+        ...
+
+    @atomic_retry(using="default", idempotent=True)
+    def refresh_totals():
+        ...
+
+Since a ``with`` block can't run itself twice, the context manager form loops over attempts instead::
+
+    for attempt in atomic_retry():
+        with attempt:
+            ...
+
+Each connection's retry policy comes from the retry policy named by its ``RETRY_POLICY`` (see the [retry_policies]
+tables of orm-settings.toml), or from ``RETRY_DEFAULTS`` if it doesn't name one:
+
+* ``max_attempts``: how many times the transaction is run at most.
+* ``base_delay`` and ``max_delay``: the delay before the second attempt, and the most any delay can grow to, in
+  seconds. Each delay doubles the last.
+* ``max_elapsed``: no attempt is started more than this many seconds after the first one.
+* ``jitter``: if true, each delay is a random fraction of its nominal value, so competing jobs don't retry in lockstep.
+* ``idempotent``: if true, transactions are also retried after the connection drops. A drop during COMMIT leaves it
+  unknown whether the transaction was applied, so only mark transactions that are safe to apply twice.
+
+A transaction nested inside another ``atomic`` block is never retried on its own, since the error aborts the outer
+transaction too; put ``atomic_retry`` on the outermost block. ``get_retry_stats()`` counts retries and give-ups per
+connection, which shows which jobs contend with each other.
+"""
+
+import logging
+import random
+import threading
+import time
+from functools import wraps
+
+from django.db import DEFAULT_DB_ALIAS, InterfaceError, OperationalError, connections, transaction
+
+# the policy connections without a RETRY_POLICY get; retry policies in orm-settings.toml override these values
+RETRY_DEFAULTS = {
+    "max_attempts": 5,
+    "base_delay": 0.05,
+    "max_delay": 2.0,
+    "max_elapsed": 30.0,
+    "jitter": True,
+    "idempotent": False,
+}
+
+# PostgreSQL error codes (SQLSTATE) of transient failures, and what kind of failure each one is
+_POSTGRESQL_CODES = {
+    "40001": "serialization",  # serialization_failure
+    "40P01": "deadlock",  # deadlock_detected
+    "55P03": "locked",  # lock_not_available
+    "57P01": "disconnect",  # admin_shutdown
+    "57P02": "disconnect",  # crash_shutdown
+    "57P03": "disconnect",  # cannot_connect_now
+}
+
+retry_logger = logging.getLogger("standalorm.retry")
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def get_policy(orm_settings: dict, policy_name: str) -> dict:
+    """
+    Gets a retry policy from standalorm's settings.
+
+    :param orm_settings: A dictionary of standalorm's settings.
+    :param policy_name: The name of the policy.
+    :return: A dictionary of the policy's settings, with ``RETRY_DEFAULTS`` filling in whatever it leaves out (or
+             standing in for the whole policy if no policy with that name exists).
+    """
+    policy = orm_settings.get("retry_policies", {}).get(policy_name, {})
+
+    return {name: policy.get(name, default) for name, default in RETRY_DEFAULTS.items()}
+
+
+def classify_error(error: Exception, connection) -> str:
+    """
+    Works out whether a database error is transient.
+
+    :param error: The error.
+    :param connection: The Django connection it was raised on.
+    :return: "locked", "serialization", "deadlock" or "disconnect" for transient errors, or None for everything else.
+    """
+    if connection.vendor == "sqlite":
+        message = str(error).lower()
+
+        if isinstance(error, OperationalError) and ("locked" in message or "busy" in message):
+            return "locked"
+
+        return None
+
+    if connection.vendor == "postgresql":
+        code = getattr(error.__cause__, "pgcode", None) or getattr(error, "pgcode", None)
+
+        if code in _POSTGRESQL_CODES:
+            return _POSTGRESQL_CODES[code]
+
+        # connection exceptions (class 08), and errors the driver raises without a code when the server goes away
+        if (code or "").startswith("08") or isinstance(error, InterfaceError) or (
+                isinstance(error, OperationalError) and code is None):
+            return "disconnect"
+
+    return None
+
+
+def _count(alias: str, event: str, kind: str = None):
+    with _stats_lock:
+        stats = _stats.setdefault(alias, {"attempts": 0, "retries": 0, "give_ups": 0, "recovered": 0, "errors": {}})
+        stats[event] += 1
+
+        if kind is not None:
+            stats["errors"][kind] = stats["errors"].get(kind, 0) + 1
+
+
+def get_retry_stats() -> dict:
+    """
+    Gets the counts ``atomic_retry`` has kept since the process started (or ``reset_retry_stats()`` was last called).
+
+    :return: A dictionary mapping connection aliases to the number of attempts made, retries, give-ups (transient
+             errors that were raised after all), transactions that succeeded after at least one retry ("recovered"),
+             and transient errors by kind.
+    """
+    with _stats_lock:
+        return {alias: dict(stats, errors=dict(stats["errors"])) for alias, stats in _stats.items()}
+
+
+def reset_retry_stats():
+    """
+    Sets every count ``atomic_retry`` keeps back to zero.
+    """
+    with _stats_lock:
+        _stats.clear()
+
+
+class Attempt:
+    """
+    One attempt at running a transaction. Used as a context manager, it runs its block in ``transaction.atomic``, and
+    on a transient error that's worth retrying, waits out the backoff delay and suppresses the error so the next
+    attempt can start.
+    """
+
+    def __init__(self, retry, number: int):
+        self.retry = retry
+        self.number = number
+        self.succeeded = False
+        self.error = None
+
+    def __enter__(self):
+        _count(self.retry.using, "attempts")
+
+        self._atomic = transaction.atomic(using=self.retry.using, savepoint=self.retry.savepoint)
+        self._atomic.__enter__()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        raised = False
+
+        try:
+            # commits, or rolls back if the block raised; committing can fail too (e.g. with a serialization failure)
+            self._atomic.__exit__(exc_type, exc_value, traceback)
+        except Exception as error:
+            exc_value, raised = error, True
+
+        if exc_value is None:
+            self.succeeded = True
+
+            if self.number > 1:
+                _count(self.retry.using, "recovered")
+
+            return False
+
+        if isinstance(exc_value, Exception) and self.retry.should_retry(exc_value, self.number):
+            self.error = exc_value
+            self.retry.wait(exc_value, self.number)
+            return True
+
+        if raised:
+            raise exc_value
+
+        return False
+
+
+class AtomicRetry:
+    """
+    Runs a transaction, retrying it on transient errors. See the module's documentation, and ``atomic_retry()`` for
+    the parameters.
+    """
+
+    def __init__(self, using: str = None, savepoint: bool = True, idempotent: bool = None, **policy):
+        self.using = using or DEFAULT_DB_ALIAS
+        self.savepoint = savepoint
+        self.idempotent = idempotent
+        self.policy = policy
+
+    def get_policy(self) -> dict:
+        """
+        Gets the retry policy in effect: the connection's, with any overrides passed to ``atomic_retry()``.
+        """
+        policy = dict(RETRY_DEFAULTS)
+        policy.update(connections[self.using].settings_dict.get("RETRY", {}))
+        policy.update(self.policy)
+
+        if self.idempotent is not None:
+            policy["idempotent"] = self.idempotent
+
+        return policy
+
+    def __iter__(self):
+        connection = connections[self.using]
+
+        # inside another atomic block, only the outermost block can be run again
+        self._nested = connection.in_atomic_block
+
+        self._policy = self.get_policy()
+        self._start = time.monotonic()
+
+        number = 1
+
+        while True:
+            # a connection that can't be opened yet (e.g. while the server restarts) is retried like a dropped one
+            try:
+                connection.ensure_connection()
+            except Exception as error:
+                if not self.should_retry(error, number):
+                    raise
+
+                self.wait(error, number)
+                number += 1
+                continue
+
+            attempt = Attempt(self, number)
+            yield attempt
+
+            if attempt.succeeded or attempt.error is None:
+                return
+
+            number += 1
+
+    def _delay(self, number: int) -> float:
+        delay = min(self._policy["max_delay"], self._policy["base_delay"] * 2 ** (number - 1))
+
+        return random.uniform(0, delay) if self._policy["jitter"] else delay
+
+    def should_retry(self, error: Exception, number: int) -> bool:
+        """
+        Decides whether a failed attempt is retried, counting a give-up if it's a transient error that isn't.
+        """
+        connection = connections[self.using]
+        kind = classify_error(error, connection)
+
+        # a nested transaction's errors are the outermost block's to retry or give up on
+        if kind is None or self._nested:
+            return False
+
+        if kind == "disconnect":
+            # drop the broken connection, so the next attempt opens a new one
+            connection.close_if_unusable_or_obsolete()
+
+            if not self._policy["idempotent"]:
+                _count(self.using, "give_ups", kind)
+                return False
+
+        self._next_delay = self._delay(number)
+        elapsed = time.monotonic() - self._start
+
+        if number >= self._policy["max_attempts"] or elapsed + self._next_delay > self._policy["max_elapsed"]:
+            _count(self.using, "give_ups", kind)
+            return False
+
+        return True
+
+    def wait(self, error: Exception, number: int):
+        """
+        Waits out the backoff delay before the next attempt.
+        """
+        _count(self.using, "retries", classify_error(error, connections[self.using]))
+        retry_logger.info("Retrying transaction on '%s' in %.3f s (attempt %d failed: %s)", self.using,
+                          self._next_delay, number, error)
+
+        time.sleep(self._next_delay)
+
+    def __call__(self, func):
+        @wraps(func)
+        def inner(*args, **kwargs):
+            for attempt in AtomicRetry(self.using, self.savepoint, self.idempotent, **self.policy):
+                with attempt:
+                    result = func(*args, **kwargs)
+
+                if attempt.succeeded:
+                    return result
+
+        return inner
+
+
+def atomic_retry(using=None, savepoint: bool = True, idempotent: bool = None, **policy):
+    """
+    Runs a transaction like ``django.db.transaction.atomic``, retrying it on transient errors. Can be used as a
+    decorator (with or without arguments), or looped over for attempts to use as context managers. See the module's
+    documentation.
+
+    :param using: The alias of the connection to run the transaction on. Defaults to "default".
+    :param savepoint: Passed on to ``transaction.atomic``.
+    :param idempotent: If True, the transaction is also retried after the connection drops. If None, the connection's
+                       retry policy decides.
+    :param policy: Overrides for the connection's retry policy (``max_attempts``, ``base_delay``, ``max_delay``,
+                   ``max_elapsed`` and ``jitter``).
+    :return: An ``AtomicRetry``, or if used as a bare decorator, the decorated function.
+    """
+    if callable(using):
+        return AtomicRetry()(using)
+
+    return AtomicRetry(using, savepoint, idempotent, **policy)
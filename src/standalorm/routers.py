@@ -0,0 +1,62 @@
+"""
+Database routers for spreading queries across several database connections.
+"""
+
+import itertools
+import threading
+import time
+
+from django.conf import settings
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends writes to a primary connection and round-robins reads across replica connections.
+
+    Reads made by a thread within ``sticky_seconds`` of that thread's last write go to the primary instead, so a script
+    always sees its own writes even if the replicas lag behind. Migrations are never run against replicas.
+
+    The router is configured through the STANDALORM_ROUTER setting, which standalorm's settings.py builds from the
+    connection roles in orm-settings.toml (see ``standalorm.databases.build_router_settings()``).
+    """
+
+    def __init__(self):
+        config = settings.STANDALORM_ROUTER
+
+        self.primary = config["primary"]
+        self.replicas = list(config["replicas"])
+        self.sticky_seconds = config.get("sticky_seconds", 0)
+
+        self._replica_cycle = itertools.cycle(self.replicas)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _in_sticky_window(self) -> bool:
+        last_write = getattr(self._local, "last_write", None)
+        return last_write is not None and time.monotonic() - last_write < self.sticky_seconds
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas or self._in_sticky_window():
+            return self.primary
+
+        with self._lock:
+            return next(self._replica_cycle)
+
+    def db_for_write(self, model, **hints):
+        self._local.last_write = time.monotonic()
+        return self.primary
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # every connection in the group holds the same data
+        group = {self.primary, *self.replicas}
+
+        if obj1._state.db in group and obj2._state.db in group:
+            return True
+
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in self.replicas:
+            return False
+
+        return None
@@ -1,28 +1,25 @@
 import os
 import uuid
 
-import dj_database_url
 import standalorm.utils as utils
+from standalorm.databases import build_databases, build_router_settings
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 orm_settings = utils.get_settings()
 
-# ascertain django app name and connection info
+# ascertain django app names and connection info
 db_app = orm_settings["config"]["app"]
-db_info = orm_settings["databases"][orm_settings["config"]["db_name"]]
 
-# ascertain filepath for sqlite database if applicable
-if db_info.get("ENGINE") == "django.db.backends.sqlite3":
-    db_info["NAME"] = os.path.join(os.getenv("USER_ROOT"), db_info["NAME"])
+DATABASES = build_databases(orm_settings, os.getenv("USER_ROOT"))
 
-if not db_info.get("USE_ENV", False):
-    DATABASES = {"default": db_info}
-else:
-    DATABASES = {"default": dj_database_url.config(env=db_info["ENV_VAR"])}
+# spread reads across replica connections, if any have been configured
+STANDALORM_ROUTER = build_router_settings(orm_settings)
 
-INSTALLED_APPS = (
-    db_app,
-)
+if STANDALORM_ROUTER["replicas"]:
+    DATABASE_ROUTERS = ["standalorm.routers.PrimaryReplicaRouter"]
+
+# the current app first, followed by any other apps in the project
+INSTALLED_APPS = tuple(utils.get_apps(orm_settings))
 
 SECRET_KEY = uuid.uuid4()
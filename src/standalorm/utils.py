@@ -3,30 +3,208 @@ Various utility functions.
 """
 
 import os
+import pickle
+import tempfile
 
 import click
 import toml
 
 lib_root = os.path.dirname(__file__)
 
-orm_settings = toml.load(os.path.join(lib_root, "orm-settings.toml"))
+SETTINGS_FILENAME = "orm-settings.toml"
+
+# the STANDALORM_SETTINGS environment variable points standalorm at a different settings file (the benchmark suite uses
+# this to run against a throwaway project without touching yours, and use_settings() sets it for project-local files)
+settings_path = os.getenv("STANDALORM_SETTINGS", os.path.join(lib_root, SETTINGS_FILENAME))
+cache_path = settings_path + ".cache"
+
+# parsed contents of orm-settings.toml and the (mtime, inode, size) they were parsed from
+orm_settings = None
+_settings_key = None
+
+
+def _get_settings_key() -> tuple:
+    """
+    Gets a key identifying the current version of orm-settings.toml. The key changes whenever the file is rewritten or
+    replaced.
+
+    :return: A tuple of the file's modification time (in nanoseconds), inode number, and size.
+    """
+    stat = os.stat(settings_path)
+    return stat.st_mtime_ns, stat.st_ino, stat.st_size
+
+
+def atomic_write(path: str, data: bytes):
+    """
+    Writes ``data`` to a temporary file in the same directory as ``path``, flushes it to disk, then renames it over
+    ``path`` so readers never see a partially-written file.
+
+    :param path: A filepath.
+    :param data: The bytes to write.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+
+    try:
+        # mkstemp() creates the file with owner-only permissions, so carry the original file's over
+        if os.path.exists(path):
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _write_cache(key: tuple, settings: dict):
+    """
+    Writes a pickled copy of standalorm's settings next to orm-settings.toml so later processes can skip TOML parsing.
+    Failing to write the cache (e.g. because the package directory is read-only) is not an error.
+
+    :param key: The key of the orm-settings.toml version the settings were parsed from.
+    :param settings: A dictionary of standalorm's settings.
+    """
+    try:
+        atomic_write(cache_path, pickle.dumps((key, settings), protocol=pickle.HIGHEST_PROTOCOL))
+    except OSError:
+        pass
+
+
+def _read_cache(key: tuple):
+    """
+    Reads the pickled copy of standalorm's settings, if it was written from the current version of orm-settings.toml.
+
+    :param key: The key of the current orm-settings.toml version.
+    :return: A dictionary of standalorm's settings, or None if the cache is missing, unreadable, or stale.
+    """
+    try:
+        with open(cache_path, "rb") as cache_file:
+            cached_key, settings = pickle.load(cache_file)
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError):
+        return None
+
+    return settings if cached_key == key else None
 
 
 def get_settings() -> dict:
     """
     Gets standalorm's settings (orm-settings.toml, NOT to be confused with Django's settings.py).
 
+    The file is parsed the first time this is called and cached afterwards. It's only parsed again if it's been
+    modified or replaced since then, so this is cheap to call as often as needed.
+
     :return: A dictionary of standalorm's settings.
     """
+    global orm_settings, _settings_key
+
+    key = _get_settings_key()
+
+    if orm_settings is None or key != _settings_key:
+        settings = _read_cache(key)
+
+        if settings is None:
+            with open(settings_path) as settings_file:
+                settings = toml.load(settings_file)
+
+            _write_cache(key, settings)
+
+        orm_settings, _settings_key = settings, key
+
     return orm_settings
 
 
-def save_settings():
+def find_project_settings(directory: str):
     """
-    Converts ``orm_settings`` into a TOML-formatted string which is then written to orm-settings.toml,
-    overwriting its current contents.
+    Looks for a project-local orm-settings.toml in a directory and then in each of its parents, the way tools find a
+    project's configuration file from anywhere inside the project.
+
+    :param directory: The directory to start looking in.
+    :return: The path of the first orm-settings.toml found, or None if there isn't one.
     """
-    toml.dump(orm_settings, open(os.path.join(lib_root, "orm-settings.toml"), "w"))
+    directory = os.path.abspath(directory)
+
+    while True:
+        path = os.path.join(directory, SETTINGS_FILENAME)
+
+        if os.path.isfile(path):
+            return path
+
+        parent = os.path.dirname(directory)
+
+        if parent == directory:
+            return None
+
+        directory = parent
+
+
+def use_settings(path: str):
+    """
+    Points standalorm at a different orm-settings.toml for the rest of the process (and any processes it starts).
+    Must be called before Django is set up.
+
+    :param path: The path of the settings file.
+    """
+    global settings_path, cache_path, orm_settings, _settings_key
+
+    settings_path = os.path.abspath(path)
+    cache_path = settings_path + ".cache"
+    orm_settings, _settings_key = None, None
+
+    os.environ["STANDALORM_SETTINGS"] = settings_path
+
+
+def use_project_settings(directory: str) -> bool:
+    """
+    Switches to the project-local orm-settings.toml for a directory (see ``find_project_settings()``), if there is one
+    and the STANDALORM_SETTINGS environment variable isn't already pointing somewhere else.
+
+    :param directory: The directory to start looking in.
+    :return: True if standalorm is using a project-local settings file.
+    """
+    if "STANDALORM_SETTINGS" in os.environ:
+        return os.path.abspath(os.environ["STANDALORM_SETTINGS"]) != os.path.join(lib_root, SETTINGS_FILENAME)
+
+    project_settings = find_project_settings(directory)
+
+    if project_settings is not None:
+        use_settings(project_settings)
+
+    return project_settings is not None
+
+
+def get_apps(settings: dict = None) -> list:
+    """
+    Gets the names of the Django apps to install. The current app (``app`` in the [config] table of orm-settings.toml,
+    which commands like ``standalorm migrate`` work on) comes first, followed by the rest of the ``apps`` list.
+
+    :param settings: A dictionary of standalorm's settings. Defaults to the dictionary returned by ``get_settings()``.
+    :return: A list of app names.
+    """
+    config = (settings or get_settings())["config"]
+    return list(dict.fromkeys([config["app"], *config.get("apps", [])]))
+
+
+def save_settings(settings: dict = None):
+    """
+    Converts standalorm's settings into a TOML-formatted string which is then written to orm-settings.toml,
+    replacing its current contents. The file is replaced atomically, so a crash partway through can't corrupt it.
+
+    :param settings: The settings to save. Defaults to the dictionary returned by ``get_settings()``.
+    """
+    global orm_settings, _settings_key
+
+    if settings is None:
+        settings = get_settings()
+
+    atomic_write(settings_path, toml.dumps(settings).encode())
+
+    orm_settings, _settings_key = settings, _get_settings_key()
+    _write_cache(_settings_key, settings)
 
 
 def set_pythonpath(path: str):
@@ -56,6 +234,28 @@ def selection_prompt(prompt: str, choices: list) -> str:
     return selection.casefold()
 
 
+def create_app(root: str, app_name: str, models_source: str = None):
+    """
+    Creates a Django app directory containing an empty __init__.py and a models.py.
+
+    :param root: The directory to create the app in.
+    :param app_name: The name of the app.
+    :param models_source: The contents of models.py. Defaults to standalorm's models template.
+    """
+    app_path = os.path.join(root, app_name)
+    os.mkdir(app_path)
+
+    if models_source is None:
+        with open(os.path.join(lib_root, "models_template.py")) as template:
+            models_source = template.read()
+
+    # populate app directory with __init__.py and models.py
+    open(os.path.join(app_path, "__init__.py"), "w").close()
+
+    with open(os.path.join(app_path, "models.py"), "w") as models:
+        models.write(models_source)
+
+
 def get_connection_list(include_default: bool = True, current: bool = False) -> list:
     """
     Gets a list of existing database connections.
@@ -64,6 +264,8 @@ def get_connection_list(include_default: bool = True, current: bool = False) ->
     :param current: If True, only the current database connection will be returned.
     :return: A list of existing database connections.
     """
+    orm_settings = get_settings()
+
     if current:
         db_list = [orm_settings["config"]["db_name"]]
     else:
@@ -73,3 +275,26 @@ def get_connection_list(include_default: bool = True, current: bool = False) ->
         db_list.remove("default")
 
     return db_list
+
+
+def get_model(model_name: str):
+    """
+    Gets a model class from Django's app registry. Django must already be set up (see ``orm_init()``).
+
+    :param model_name: The name of a model in one of the configured apps (e.g. "Book"), or an app label and model
+                       name separated by a dot (e.g. "library.Book"). Without an app label, the current app is searched
+                       first.
+    :return: The model class.
+    """
+    from django.apps import apps
+
+    if "." in model_name:
+        return apps.get_model(model_name)
+
+    for app_name in get_apps():
+        try:
+            return apps.get_model(app_name.rpartition(".")[2], model_name)
+        except LookupError:
+            continue
+
+    raise LookupError(f"None of the installed apps ({', '.join(get_apps())}) has a model named '{model_name}'.")
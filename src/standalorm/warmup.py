@@ -0,0 +1,232 @@
+"""
+Pre-warming of database connections and models in a background thread, so a script's first query doesn't pay for
+opening connections (and, on PostgreSQL, the type registration and session setup that come with them).
+
+``orm_init(__file__, warm=True)`` starts the warm-up, which opens the calling thread's connection for every configured
+alias and runs a cheap readiness query on each in the background, so it overlaps with whatever the script does next.
+The installed apps' models are preloaded while the connections open, but on the calling thread, since importing them
+in the background would race the script's own imports for Django's app registry. A query made while the warm-up is
+still connecting waits for it instead of opening a second connection, so the script never has to wait explicitly; call
+``await_ready()`` to find out whether the databases are up before starting work::
+
+    orm_init(__file__, warm=True)
+    parse_input_files()  # runs while the connections open
+
+    if not await_ready(timeout=10):
+        sys.exit(f"Database not ready: {get_warmup_metrics()['errors']}")
+
+Only the thread that called ``orm_init()`` gets the warmed connections, since Django's connections belong to the thread
+that uses them.
+"""
+
+import threading
+import time
+
+from django.db import connections
+
+# the warm-up started by the last call to start_warmup()
+_warmup = None
+
+
+class Warmup:
+    """
+    Warms up a thread's database connections in a background thread, and preloads the installed apps' models on the
+    calling thread meanwhile.
+
+    :param aliases: The aliases of the connections to open. If None, every configured connection is opened.
+    :param timeout: How many seconds the readiness query on each connection may run for (enforced by the database
+                    where it supports a statement timeout).
+    :param preload_models: If True, the installed apps' models modules are imported and their metadata caches filled.
+    """
+
+    def __init__(self, aliases=None, timeout: float = 5.0, preload_models: bool = True):
+        self.aliases = list(connections) if aliases is None else list(aliases)
+        self.timeout = timeout
+        self.preload_models = preload_models
+
+        self.metrics = {"connections": {}, "models_ms": None, "total_ms": None, "waited_ms": 0.0, "errors": {}}
+
+        self._done = threading.Event()
+        self._connected = {alias: threading.Event() for alias in self.aliases}
+        self._thread = threading.Thread(target=self._run, name="standalorm-warmup", daemon=True)
+
+    def start(self):
+        """
+        Starts the warm-up. Must be called from the thread that will use the connections.
+        """
+        for alias in self.aliases:
+            wrapper = connections[alias]
+
+            # skip connections the thread has already opened
+            if wrapper.connection is not None:
+                self._connected[alias].set()
+                continue
+
+            wrapper.inc_thread_sharing()
+            wrapper.ensure_connection = self._make_waiting_ensure_connection(alias, wrapper)
+
+        self._wrappers = {alias: connections[alias] for alias in self.aliases}
+        self._start = time.perf_counter()
+        self._thread.start()
+
+        if self.preload_models:
+            start = time.perf_counter()
+
+            try:
+                _preload_models()
+            except Exception as error:
+                self.metrics["errors"]["models"] = f"{type(error).__name__}: {error}"
+
+            self.metrics["models_ms"] = (time.perf_counter() - start) * 1000
+
+    def _make_waiting_ensure_connection(self, alias: str, wrapper):
+        """
+        Makes a replacement for a connection's ``ensure_connection()`` method that waits for the warm-up to finish
+        opening the connection before falling through to the original method.
+        """
+        original = type(wrapper).ensure_connection.__get__(wrapper)
+
+        def ensure_connection():
+            if threading.current_thread() is not self._thread and not self._connected[alias].is_set():
+                start = time.perf_counter()
+                self._connected[alias].wait()
+                self.metrics["waited_ms"] += (time.perf_counter() - start) * 1000
+
+            return original()
+
+        return ensure_connection
+
+    def _run(self):
+        try:
+            for alias in self.aliases:
+                if not self._connected[alias].is_set():
+                    self._warm_connection(alias, self._wrappers[alias])
+        finally:
+            for event in self._connected.values():
+                event.set()
+
+            self.metrics["total_ms"] = (time.perf_counter() - self._start) * 1000
+            self._done.set()
+
+    def _warm_connection(self, alias: str, wrapper):
+        """
+        Opens one connection and runs the readiness query on it. If either fails, the connection is closed again, so
+        the thread's first real query reconnects and raises the error where the script can handle it.
+        """
+        timings = self.metrics["connections"][alias] = {"connect_ms": None, "ready_ms": None}
+
+        try:
+            start = time.perf_counter()
+            wrapper.connect()
+            timings["connect_ms"] = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            run_readiness_query(wrapper, self.timeout)
+            timings["ready_ms"] = (time.perf_counter() - start) * 1000
+        except Exception as error:
+            self.metrics["errors"][alias] = f"{type(error).__name__}: {error}"
+
+            try:
+                wrapper.close()
+            except Exception:
+                pass
+        finally:
+            del wrapper.ensure_connection
+            wrapper.dec_thread_sharing()
+            self._connected[alias].set()
+
+    def await_ready(self, timeout: float = None) -> bool:
+        """
+        Waits for the warm-up to finish.
+
+        :param timeout: The most seconds to wait. If None, waits for as long as the warm-up takes.
+        :return: True if the warm-up finished and every connection passed its readiness query.
+        """
+        start = time.perf_counter()
+        finished = self._done.wait(timeout)
+        self.metrics["waited_ms"] += (time.perf_counter() - start) * 1000
+
+        return finished and not any(alias in self.metrics["errors"] for alias in self.aliases)
+
+
+def run_readiness_query(wrapper, timeout: float):
+    """
+    Runs a query that proves a connection can actually reach its database, opening the connection if needed.
+
+    :param wrapper: The Django connection (a ``DatabaseWrapper``).
+    :param timeout: How many seconds the query may run for. Only enforced on PostgreSQL.
+    """
+    if wrapper.vendor == "sqlite":
+        # reading the schema makes SQLite open the file and check that it's a database
+        query = "SELECT count(*) FROM sqlite_master"
+    else:
+        query = "SELECT 1" + wrapper.features.bare_select_suffix
+
+    with wrapper.cursor() as cursor:
+        if wrapper.vendor == "postgresql":
+            cursor.execute(f"SET statement_timeout = {int(timeout * 1000)}")
+
+        try:
+            cursor.execute(query)
+            cursor.fetchone()
+        finally:
+            if wrapper.vendor == "postgresql":
+                # goes back to the value from the connection's OPTIONS, if it set one
+                cursor.execute("SET statement_timeout TO DEFAULT")
+
+
+def _preload_models():
+    """
+    Imports every installed app's models module (which fast-startup mode otherwise leaves until first use) and fills
+    each model's field caches.
+    """
+    from django.apps import apps
+
+    for app_config in apps.get_app_configs():
+        for model in app_config.get_models():
+            model._meta.get_fields()
+            model._meta.concrete_fields
+
+
+def start_warmup(aliases=None, timeout: float = 5.0, preload_models: bool = True) -> Warmup:
+    """
+    Starts warming up the calling thread's connections in the background, and preloads the installed apps' models. See
+    ``Warmup`` for the parameters.
+
+    :return: The started ``Warmup``.
+    """
+    global _warmup
+
+    _warmup = Warmup(aliases, timeout, preload_models)
+    _warmup.start()
+
+    return _warmup
+
+
+def await_ready(timeout: float = None) -> bool:
+    """
+    Waits for the warm-up started by ``orm_init(__file__, warm=True)`` to finish.
+
+    :param timeout: The most seconds to wait. If None, waits for as long as the warm-up takes.
+    :return: True if the warm-up finished and every connection passed its readiness query. Also True if no warm-up was
+             started.
+    """
+    if _warmup is None:
+        return True
+
+    return _warmup.await_ready(timeout)
+
+
+def get_warmup_metrics() -> dict:
+    """
+    Gets timings from the warm-up started by ``orm_init(__file__, warm=True)``.
+
+    :return: A dictionary with each connection's connect and readiness query times in milliseconds ("connections"),
+             the time spent preloading models ("models_ms"), the warm-up's total time ("total_ms", None while it's
+             still running), how long the calling thread spent waiting on it ("waited_ms"), and the errors it ran into
+             by connection alias ("errors"). Empty if no warm-up was started.
+    """
+    if _warmup is None:
+        return {}
+
+    return dict(_warmup.metrics)
@@ -0,0 +1,161 @@
+"""
+The throwaway project the tests run against: "library" and "shop" apps whose database is SQLite. Django can only be
+set up once per process, so every test module shares it.
+"""
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import toml
+
+MODELS = '''
+from django.db import models
+
+
+class Author(models.Model):
+    name = models.CharField(max_length=50)
+    age = models.IntegerField()
+'''
+
+INITIAL_MIGRATION = '''
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="Author",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=50)),
+            ],
+        ),
+    ]
+'''
+
+# what makemigrations writes when it asks for a one-off default
+ADD_FIELD_MIGRATION = '''
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("library", "0001_initial")]
+
+    operations = [
+        migrations.AddField(
+            model_name="author",
+            name="age",
+            field=models.IntegerField(default=0),
+            preserve_default=False,
+        ),
+    ]
+'''
+
+SHOP_MODELS = '''
+from django.db import models
+
+
+class Product(models.Model):
+    name = models.CharField(max_length=100, db_index=True)
+'''
+
+SHOP_INITIAL_MIGRATION = '''
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="Product",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=50)),
+            ],
+        ),
+    ]
+'''
+
+# SQLite applies this by rebuilding the table
+ALTER_FIELD_MIGRATION = '''
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("shop", "0001_initial")]
+
+    operations = [
+        migrations.AlterField(
+            model_name="product",
+            name="name",
+            field=models.CharField(max_length=100, db_index=True),
+        ),
+    ]
+'''
+
+_project_root = None
+
+
+def setup_project() -> str:
+    """
+    Creates the project in a temporary directory and runs ``orm_init()`` for it, the first time it's called. The
+    directory is deleted when the process exits.
+
+    :return: The project's root directory.
+    """
+    global _project_root
+
+    if _project_root is not None:
+        return _project_root
+
+    _project_root = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, _project_root, ignore_errors=True)
+
+    for app in ("library", "shop"):
+        os.makedirs(os.path.join(_project_root, app, "migrations"))
+
+    files = {
+        ("library", "__init__.py"): "",
+        ("library", "models.py"): MODELS,
+        ("library", "migrations", "__init__.py"): "",
+        ("library", "migrations", "0001_initial.py"): INITIAL_MIGRATION,
+        ("library", "migrations", "0002_author_age.py"): ADD_FIELD_MIGRATION,
+        ("shop", "__init__.py"): "",
+        ("shop", "models.py"): SHOP_MODELS,
+        ("shop", "migrations", "__init__.py"): "",
+        ("shop", "migrations", "0001_initial.py"): SHOP_INITIAL_MIGRATION,
+        ("shop", "migrations", "0002_product_name.py"): ALTER_FIELD_MIGRATION,
+    }
+
+    for path, source in files.items():
+        with open(os.path.join(_project_root, *path), "w") as source_file:
+            source_file.write(source)
+
+    settings_path = os.path.join(_project_root, "orm-settings.toml")
+
+    with open(settings_path, "w") as settings_file:
+        toml.dump({
+            "config": {"app": "library", "apps": ["shop"], "db_name": "default"},
+            "databases": {"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": "db.sqlite3"}},
+        }, settings_file)
+
+    import standalorm.utils as utils
+    from standalorm import orm_init
+
+    utils.use_settings(settings_path)
+    sys.path.insert(0, _project_root)
+    orm_init(os.path.join(_project_root, "script.py"))
+
+    return _project_root
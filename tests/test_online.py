@@ -0,0 +1,70 @@
+"""
+Tests for standalorm.online, run against a throwaway project on SQLite:
+
+    python -m unittest discover -s tests
+"""
+
+import unittest
+
+from project import setup_project
+
+
+def setUpModule():
+    setup_project()
+
+
+class OnlineAddFieldTest(unittest.TestCase):
+
+    def test_one_off_default(self):
+        from django.core.management import call_command
+        from django.db import connection
+        from standalorm.online import OnlineMigrator
+
+        call_command("migrate", "library", "0001", verbosity=0)
+
+        with connection.cursor() as cursor:
+            cursor.executemany("INSERT INTO library_author (name) VALUES (%s)", [("a",), ("b",)])
+
+        migrator = OnlineMigrator("library")
+
+        # a one-off default is still a constant default, so the column is added without rebuilding the table
+        self.assertEqual([strategy for _, _, strategy, _, _ in migrator.get_plan()], ["add_column"])
+        self.assertEqual(migrator.migrate(), 1)
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT age FROM library_author ORDER BY id")
+            self.assertEqual(cursor.fetchall(), [(0,), (0,)])
+
+
+class OnlineRebuildTest(unittest.TestCase):
+
+    def test_indexes_named_after_real_table(self):
+        from django.core.management import call_command
+        from django.db import connection
+        from standalorm.online import OnlineMigrator
+
+        call_command("migrate", "shop", "0001", verbosity=0)
+
+        with connection.cursor() as cursor:
+            cursor.executemany("INSERT INTO shop_product (name) VALUES (%s)", [("a",), ("b",), ("c",)])
+
+        migrator = OnlineMigrator("shop", batch_size=2)
+
+        self.assertEqual([strategy for _, _, strategy, _, _ in migrator.get_plan()], ["rebuild"])
+        self.assertEqual(migrator.migrate(), 1)
+
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(cursor, "shop_product")
+            cursor.execute("SELECT name FROM shop_product ORDER BY id")
+            self.assertEqual(cursor.fetchall(), [("a",), ("b",), ("c",)])
+
+        # the name Django's schema editor gives the index, so later migrations can find it
+        with connection.schema_editor() as editor:
+            expected = editor._create_index_name("shop_product", ["name"])
+
+        self.assertIn(expected, indexes)
+        self.assertEqual(indexes[expected]["columns"], ["name"])
+
+
+if __name__ == "__main__":
+    unittest.main()
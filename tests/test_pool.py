@@ -0,0 +1,236 @@
+"""
+Tests for standalorm.pool, run through the pooled SQLite backend (standalorm.backends.sqlite3_pool):
+
+    python -m unittest discover -s tests
+"""
+
+import threading
+import time
+import unittest
+
+from project import setup_project
+
+project_root = None
+
+
+def setUpModule():
+    global project_root
+
+    project_root = setup_project()
+
+
+class PoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # every test gets a pool of its own, since pools are shared by alias
+        self.alias = f"pool_{self._testMethodName}"
+        self.wrappers = []
+
+    def tearDown(self):
+        from standalorm.pool import get_pool
+
+        for wrapper in self.wrappers:
+            wrapper.close()
+
+        get_pool(self.alias, {}).close_all()
+
+    def make_wrapper(self, keep: bool = True, **pool):
+        """
+        Creates a DatabaseWrapper for the test's alias, as if for a thread of its own. Unless ``keep`` is False, it's
+        closed when the test ends, so it must belong to the main thread.
+        """
+        from django.db.utils import load_backend
+        from standalorm.databases import build_database
+
+        settings_dict = build_database({"ENGINE": "django.db.backends.sqlite3", "NAME": "pool.sqlite3", "POOL": pool},
+                                       {}, project_root, self.alias)
+
+        for key, default in (("ATOMIC_REQUESTS", False), ("AUTOCOMMIT", True), ("CONN_MAX_AGE", 0), ("OPTIONS", {}),
+                             ("TIME_ZONE", None), ("USER", ""), ("PASSWORD", ""), ("HOST", ""), ("PORT", ""),
+                             ("TEST", {})):
+            settings_dict.setdefault(key, default)
+
+        self.assertEqual(settings_dict["ENGINE"], "standalorm.backends.sqlite3_pool")
+
+        wrapper = load_backend(settings_dict["ENGINE"]).DatabaseWrapper(settings_dict, self.alias)
+
+        if keep:
+            self.wrappers.append(wrapper)
+
+        return wrapper
+
+    def stats(self) -> dict:
+        from standalorm.pool import pool_stats
+
+        return pool_stats()[self.alias]
+
+
+class MaxSizeTest(PoolTestCase):
+
+    def test_connections_are_reused_up_to_max_size(self):
+        from standalorm.pool import PoolTimeout
+
+        first, second, third = (self.make_wrapper(max_size=2, timeout=0.1) for _ in range(3))
+        first.ensure_connection()
+        second.ensure_connection()
+        raw_connection = first.connection
+
+        with self.assertRaises(PoolTimeout):
+            third.ensure_connection()
+
+        first.close()
+        third.ensure_connection()
+
+        # the connection first gave back is handed to third instead of a new one being opened
+        self.assertIs(third.connection, raw_connection)
+        self.assertEqual(self.stats()["size"], 2)
+        self.assertEqual(self.stats()["created"], 2)
+
+    def test_threads_never_exceed_max_size(self):
+        errors = []
+
+        def work():
+            # Django's connections belong to the thread that created them
+            wrapper = self.make_wrapper(keep=False, max_size=3, timeout=10)
+
+            try:
+                with wrapper.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                    time.sleep(0.02)
+
+                wrapper.close()
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=work) for _ in range(12)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        stats = self.stats()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(stats["checkouts"], 12)
+        self.assertLessEqual(stats["peak_in_use"], 3)
+        self.assertLessEqual(stats["created"], 3)
+        self.assertGreater(stats["waits"], 0)
+        self.assertEqual(stats["in_use"], 0)
+
+
+class CheckoutTimeoutTest(PoolTestCase):
+
+    def test_checkout_times_out(self):
+        from standalorm.pool import PoolTimeout
+
+        holder, waiter = self.make_wrapper(max_size=1, timeout=0.2), self.make_wrapper(max_size=1, timeout=0.2)
+        holder.ensure_connection()
+
+        start = time.monotonic()
+
+        with self.assertRaises(PoolTimeout):
+            waiter.ensure_connection()
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertEqual(self.stats()["timeouts"], 1)
+        self.assertGreater(self.stats()["wait_seconds"], 0)
+
+        # a failed checkout doesn't take up a slot
+        self.assertEqual(self.stats()["size"], 1)
+        self.assertEqual(self.stats()["in_use"], 1)
+
+    def test_waiter_gets_connection_returned_in_time(self):
+        checked_out = threading.Event()
+
+        def hold():
+            holder = self.make_wrapper(keep=False, max_size=1, timeout=5)
+            holder.ensure_connection()
+            checked_out.set()
+            time.sleep(0.1)
+            holder.close()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        checked_out.wait()
+
+        self.make_wrapper(max_size=1, timeout=5).ensure_connection()
+        thread.join()
+
+        self.assertEqual(self.stats()["waits"], 1)
+        self.assertEqual(self.stats()["timeouts"], 0)
+        self.assertEqual(self.stats()["created"], 1)
+
+
+class IdleReapingTest(PoolTestCase):
+
+    def test_idle_connections_are_closed_down_to_min_size(self):
+        wrappers = [self.make_wrapper(min_size=1, max_size=5, max_idle=0.05) for _ in range(3)]
+
+        for wrapper in wrappers:
+            wrapper.ensure_connection()
+
+        for wrapper in wrappers:
+            wrapper.close()
+
+        self.assertEqual(self.stats()["idle"], 3)
+
+        time.sleep(0.1)
+        self.make_wrapper(min_size=1, max_size=5, max_idle=0.05).ensure_connection()
+
+        stats = self.stats()
+
+        self.assertEqual(stats["closed"], 2)
+        self.assertEqual(stats["size"], 1)
+        self.assertEqual(stats["in_use"], 1)
+        self.assertEqual(stats["created"], 3)
+
+    def test_recently_returned_connections_are_kept(self):
+        wrappers = [self.make_wrapper(max_size=5, max_idle=60) for _ in range(2)]
+
+        for wrapper in wrappers:
+            wrapper.ensure_connection()
+
+        for wrapper in wrappers:
+            wrapper.close()
+
+        self.make_wrapper(max_size=5, max_idle=60).ensure_connection()
+
+        self.assertEqual(self.stats()["closed"], 0)
+        self.assertEqual(self.stats()["size"], 2)
+
+
+class MetricsTest(PoolTestCase):
+
+    def test_utilization_metrics(self):
+        first, second = self.make_wrapper(max_size=4), self.make_wrapper(max_size=4)
+        first.ensure_connection()
+        second.ensure_connection()
+
+        stats = self.stats()
+
+        self.assertEqual((stats["size"], stats["in_use"], stats["idle"]), (2, 2, 0))
+        self.assertEqual(stats["utilization"], 0.5)
+        self.assertEqual((stats["checkouts"], stats["created"], stats["peak_in_use"]), (2, 2, 2))
+
+        second.close()
+        stats = self.stats()
+
+        self.assertEqual((stats["size"], stats["in_use"], stats["idle"]), (2, 1, 1))
+        self.assertEqual(stats["utilization"], 0.25)
+        self.assertEqual(stats["peak_in_use"], 2)
+
+    def test_broken_connections_are_discarded(self):
+        wrapper = self.make_wrapper(max_size=2)
+        wrapper.ensure_connection()
+        wrapper.errors_occurred = True
+        wrapper.close()
+
+        stats = self.stats()
+
+        self.assertEqual((stats["size"], stats["in_use"], stats["idle"], stats["closed"]), (0, 0, 0, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()